@@ -0,0 +1,36 @@
+import json
+import logging
+import os
+
+
+def mask_account(phone_number: str):
+    '''hide the middle of a phone number in logs'''
+    if not phone_number or len(phone_number) < 7:
+        return "****"
+    return phone_number[:3] + "****" + phone_number[-4:]
+
+
+def load_accounts(config: dict):
+    """读取需要监控的国网账号列表
+    优先级：ACCOUNTS_FILE（JSON 文件）> ACCOUNTS（JSON 字符串）> PHONE_NUMBER/PASSWORD
+    每个账号形如 {"PHONE_NUMBER": "...", "PASSWORD": "..."}"""
+    raw = None
+    accounts_file = os.getenv("ACCOUNTS_FILE", "")
+    if accounts_file:
+        with open(accounts_file, encoding="utf-8") as f:
+            raw = json.load(f)
+    elif config.get("ACCOUNTS"):
+        raw = json.loads(config["ACCOUNTS"])
+
+    if not raw:
+        if not config.get("PHONE_NUMBER"):
+            return []
+        return [{"PHONE_NUMBER": config["PHONE_NUMBER"], "PASSWORD": config.get("PASSWORD", "")}]
+
+    accounts = []
+    for index, item in enumerate(raw):
+        if not item.get("PHONE_NUMBER") or not item.get("PASSWORD"):
+            logging.warning(f"Account #{index} has no PHONE_NUMBER or PASSWORD, ignored.")
+            continue
+        accounts.append({k: str(v) for k, v in item.items()})
+    return accounts
@@ -0,0 +1,208 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS balance_history (
+    user_id TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    balance REAL NOT NULL,
+    PRIMARY KEY (user_id, ts)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_usage (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    usage REAL NOT NULL,
+    PRIMARY KEY (user_id, day)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS usage_rollup (
+    user_id TEXT NOT NULL,
+    period TEXT NOT NULL,
+    usage REAL NOT NULL,
+    days INTEGER NOT NULL,
+    PRIMARY KEY (user_id, period)) WITHOUT ROWID;
+'''
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _db_path():
+    path = os.getenv("DB_NAME", "homeassistant.db")
+    if 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(path):
+        path = "/data/" + path
+    return path
+
+
+class BalanceStore:
+    '''Balance history of all accounts in one SQLite table keyed by (user_id, ts),
+    plus daily usage with month ("YYYY-MM") and year ("YYYY") rollups.
+
+    One long-lived connection in WAL mode shared by all fetcher threads;
+    writes are buffered and committed in batches. Rows older than
+    BALANCE_HISTORY_COMPACT_DAYS are reduced to the last reading of each day
+    and rows older than BALANCE_HISTORY_RETENTION_DAYS are deleted.'''
+
+    def __init__(self, path: str = None):
+        self.path = path or _db_path()
+        self.BALANCE_STORE_BATCH_SIZE = int(os.getenv("BALANCE_STORE_BATCH_SIZE", 100))
+        self.BALANCE_HISTORY_RETENTION_DAYS = int(os.getenv("BALANCE_HISTORY_RETENTION_DAYS", 3650))
+        self.BALANCE_HISTORY_COMPACT_DAYS = int(os.getenv("BALANCE_HISTORY_COMPACT_DAYS", 90))
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_maintenance = 0
+        self.connect = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.connect.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 足以保证不损坏数据库，只是断电时可能丢失最后一次提交
+        self.connect.execute("PRAGMA synchronous=NORMAL")
+        self.connect.executescript(SCHEMA)
+        self.connect.commit()
+        logging.info(f"Balance history database {self.path} opened.")
+
+    def add(self, user_id: str, balance: float, ts: int = None):
+        '''buffer one reading, written on flush() or once BALANCE_STORE_BATCH_SIZE readings are pending'''
+        self.add_many([(user_id, balance, ts)])
+
+    def add_many(self, readings):
+        '''readings: iterable of (user_id, balance, ts or None for now)'''
+        now = int(time.time())
+        with self._lock:
+            self._pending.extend((str(user_id), int(ts or now), float(balance))
+                                 for user_id, balance, ts in readings if balance is not None)
+            if len(self._pending) >= self.BALANCE_STORE_BATCH_SIZE:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        with self.connect:
+            self.connect.executemany("INSERT OR REPLACE INTO balance_history (user_id, ts, balance) VALUES (?, ?, ?)",
+                                     rows)
+        logging.debug(f"{len(rows)} balance reading(s) written.")
+
+    def flush(self):
+        '''write pending readings in one transaction; runs retention/compaction at most once a day'''
+        with self._lock:
+            self._flush()
+            if time.time() - self._last_maintenance > 86400:
+                self._maintain()
+
+    def _maintain(self):
+        self._last_maintenance = time.time()
+        now = int(time.time())
+        with self.connect:
+            deleted = 0
+            if self.BALANCE_HISTORY_RETENTION_DAYS > 0:
+                deleted = self.connect.execute("DELETE FROM balance_history WHERE ts < ?",
+                                               (now - self.BALANCE_HISTORY_RETENTION_DAYS * 86400,)).rowcount
+            compacted = 0
+            if self.BALANCE_HISTORY_COMPACT_DAYS > 0:
+                # 每个户号每天（本地时间）只保留最后一条；同一次执行的各户号时间戳相同，必须按户号关联
+                compacted = self.connect.execute('''
+                    DELETE FROM balance_history
+                    WHERE ts < ? AND EXISTS (
+                        SELECT 1 FROM balance_history AS newer
+                        WHERE newer.user_id = balance_history.user_id AND newer.ts > balance_history.ts
+                          AND date(newer.ts, 'unixepoch', 'localtime')
+                              = date(balance_history.ts, 'unixepoch', 'localtime'))''',
+                    (now - self.BALANCE_HISTORY_COMPACT_DAYS * 86400,)).rowcount
+        if deleted or compacted:
+            logging.info(f"Balance history: {deleted} expired and {compacted} compacted row(s) removed.")
+            self.connect.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.connect.execute("PRAGMA optimize")
+
+    def latest(self, user_id: str):
+        '''(ts, balance) of the newest reading, None if there is none'''
+        with self._lock:
+            self._flush()
+            return self.connect.execute(
+                "SELECT ts, balance FROM balance_history WHERE user_id = ? ORDER BY ts DESC LIMIT 1",
+                (str(user_id),)).fetchone()
+
+    def latest_all(self):
+        '''{user_id: (ts, balance)} of the newest reading of every user'''
+        with self._lock:
+            self._flush()
+            rows = self.connect.execute(
+                "SELECT user_id, MAX(ts), balance FROM balance_history GROUP BY user_id").fetchall()
+        return {user_id: (ts, balance) for user_id, ts, balance in rows}
+
+    def range(self, user_id: str, start_ts: int = None, end_ts: int = None):
+        '''[(ts, balance)] with start_ts <= ts < end_ts in time order'''
+        with self._lock:
+            self._flush()
+            return self.connect.execute(
+                "SELECT ts, balance FROM balance_history WHERE user_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (str(user_id), start_ts or 0, end_ts or 2 ** 62)).fetchall()
+
+    def last_usage_day(self, user_id: str):
+        '''newest stored usage day ("YYYY-MM-DD") of the user, None if there is none'''
+        with self._lock:
+            row = self.connect.execute("SELECT MAX(day) FROM daily_usage WHERE user_id = ?",
+                                       (str(user_id),)).fetchone()
+        return row[0]
+
+    def add_daily_usage(self, user_id: str, days: dict):
+        '''upsert {"YYYY-MM-DD": kWh} in one transaction and move the month/year
+        rollups by the difference to the stored values instead of re-summing'''
+        user_id = str(user_id)
+        if not days:
+            return 0
+        with self._lock, self.connect:
+            placeholders = ",".join("?" * len(days))
+            stored = dict(self.connect.execute(
+                f"SELECT day, usage FROM daily_usage WHERE user_id = ? AND day IN ({placeholders})",
+                (user_id, *days)).fetchall())
+            changed = {day: usage for day, usage in days.items() if stored.get(day) != usage}
+            if not changed:
+                return 0
+            self.connect.executemany(
+                "INSERT OR REPLACE INTO daily_usage (user_id, day, usage) VALUES (?, ?, ?)",
+                [(user_id, day, usage) for day, usage in changed.items()])
+            deltas = {}
+            for day, usage in changed.items():
+                new_day = day not in stored
+                for period in (day[:7], day[:4]):
+                    delta, count = deltas.get(period, (0.0, 0))
+                    deltas[period] = (delta + usage - stored.get(day, 0.0), count + new_day)
+            self.connect.executemany(
+                "INSERT INTO usage_rollup (user_id, period, usage, days) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id, period) DO UPDATE SET usage = usage + excluded.usage, days = days + excluded.days",
+                [(user_id, period, delta, count) for period, (delta, count) in deltas.items()])
+        return len(changed)
+
+    def usage_summary(self, user_id: str):
+        '''{"last_day", "last_usage", "month_usage", "year_usage"} from the newest stored day and its rollups'''
+        with self._lock:
+            row = self.connect.execute(
+                "SELECT day, usage FROM daily_usage WHERE user_id = ? ORDER BY day DESC LIMIT 1",
+                (str(user_id),)).fetchone()
+            if row is None:
+                return None
+            rollups = dict(self.connect.execute(
+                "SELECT period, usage FROM usage_rollup WHERE user_id = ? AND period IN (?, ?)",
+                (str(user_id), row[0][:7], row[0][:4])).fetchall())
+        return {"last_day": row[0], "last_usage": row[1],
+                "month_usage": rollups.get(row[0][:7]), "year_usage": rollups.get(row[0][:4])}
+
+    def usage_range(self, user_id: str, start_day: str, end_day: str):
+        '''[(day, kWh)] with start_day <= day <= end_day'''
+        with self._lock:
+            return self.connect.execute(
+                "SELECT day, usage FROM daily_usage WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (str(user_id), start_day, end_day)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self.connect.close()
+
+
+def get_balance_store():
+    '''the process-wide BalanceStore, opened on first use'''
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BalanceStore()
+        return _store
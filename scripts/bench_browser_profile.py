@@ -0,0 +1,85 @@
+"""对比 default 与 lean 浏览器配置（BROWSER_PROFILE）的页面加载开销
+
+    python bench_browser_profile.py
+    python bench_browser_profile.py --urls https://95598.cn/osgweb/login --repeat 3
+
+每种配置启动一个浏览器，依次打开各地址（默认 LOGIN_URL），统计：
+传输字节数（Performance API 中文档与所有资源的 transferSize 之和）、
+页面加载时间（navigation loadEventEnd）、资源请求数，以及加载后浏览器进程树的 RSS。
+需要能访问目标网站，或把 --urls 指向本地的模拟页面。"""
+import argparse
+import os
+import time
+
+from bench_utils import summarize
+from browser_manager import BrowserManager
+from const import *
+
+METRICS_JS = """
+const nav = performance.getEntriesByType("navigation")[0];
+const resources = performance.getEntriesByType("resource");
+return {
+    load_ms: nav ? nav.loadEventEnd - nav.startTime : null,
+    document_bytes: nav ? nav.transferSize : 0,
+    resource_bytes: resources.reduce((sum, r) => sum + (r.transferSize || 0), 0),
+    resources: resources.length,
+};
+"""
+
+
+def measure(profile, urls, repeat):
+    os.environ["BROWSER_PROFILE"] = profile
+    # 只为创建浏览器，不读写会话和验证码缓存
+    os.environ["ENABLE_SESSION_STORE"] = "false"
+    os.environ["ENABLE_CAPTCHA_CACHE"] = "false"
+    from data_fetcher import DataFetcher
+    fetcher = DataFetcher("bench", "bench")
+    manager = BrowserManager(fetcher._get_webdriver)
+    start = time.monotonic()
+    driver = manager.acquire()
+    startup = time.monotonic() - start
+    if profile != "lean":
+        driver.maximize_window()
+    loads, transferred, resources = [], [], []
+    try:
+        for _ in range(repeat):
+            for url in urls:
+                driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+                driver.get(url)
+                fetcher.waiter.wait_page_ready(driver)
+                metrics = driver.execute_script(METRICS_JS)
+                if metrics["load_ms"]:
+                    loads.append(metrics["load_ms"] / 1000)
+                transferred.append(metrics["document_bytes"] + metrics["resource_bytes"])
+                resources.append(metrics["resources"])
+        rss = manager.rss_mb()
+    finally:
+        manager.quit()
+    return {
+        "startup_s": startup,
+        "load": summarize(loads),
+        "kb_per_page": sum(transferred) / len(transferred) / 1024,
+        "resources_per_page": sum(resources) / len(resources),
+        "rss_mb": rss,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", default=LOGIN_URL, help="comma separated pages to load")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    urls = args.urls.split(",")
+
+    results = {profile: measure(profile, urls, args.repeat) for profile in ("default", "lean")}
+    print(f"{'profile':<10}{'startup':>10}{'load p50':>12}{'load p95':>12}{'KB/page':>12}{'requests':>10}{'RSS':>10}")
+    for profile, r in results.items():
+        rss = f"{r['rss_mb']:.0f}MB" if r["rss_mb"] is not None else "n/a"
+        print(f"{profile:<10}{r['startup_s']:>9.1f}s{r['load'].get('p50_ms', float('nan')):>10.0f}ms"
+              f"{r['load'].get('p95_ms', float('nan')):>10.0f}ms{r['kb_per_page']:>12.0f}"
+              f"{r['resources_per_page']:>10.0f}{rss:>10}")
+    default, lean = results["default"], results["lean"]
+    if default["kb_per_page"]:
+        print(f"lean transfers {1 - lean['kb_per_page'] / default['kb_per_page']:.0%} fewer bytes per page")
+    if default["rss_mb"] and lean["rss_mb"]:
+        print(f"lean uses {default['rss_mb'] - lean['rss_mb']:.0f}MB less RSS after loading")
@@ -0,0 +1,200 @@
+"""滑块识别离线基准与准确率测试，用于评估识别代码改动和模型替换
+
+    python bench_captcha.py --model captcha.onnx --images backgrounds/
+    python bench_captcha.py --model new.onnx --images backgrounds/ --max-mae 3 --min-accuracy 0.95 --json result.json
+    python bench_captcha.py --model captcha.onnx --images backgrounds/ --input rgba
+
+backgrounds/ 中是录制的滑块背景图（png/jpg），真实偏移量（登录成功时滑动的像素数，与 _login 中
+round(distance*1.06) 同一尺度）来自同目录的 labels.json：
+    {"0001.png": 132, "0002.png": {"offset": 87}}
+或文件名末尾的数字，例如 0001_132.png。没有标注的图片只计入耗时。
+
+分阶段耗时：decode（PNG/JPEG 解码）、resize（缩放到 416x416 并归一化写入输入缓冲区）、
+inference（模型推理）、postprocess（置信度/NMS 后处理）。不需要网络和浏览器。
+--input rgba 测量 CAPTCHA_RAW_PIXELS=true 时的路径（与求解服务的 OP_SOLVE_RGBA 相同）：图片在计时前
+预先缩放为 416x416 的 RGBA 像素（浏览器 canvas getImageData 的结果），decode 只是把字节视为数组，
+resize 只是归一化写入输入缓冲区。
+设置了 --max-mae/--min-accuracy 时不达标以非零状态退出。"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from bench_utils import format_summary, peak_rss_mb, percentile, summarize
+from onnx import ONNX, INPUT_SIZE
+
+# 与 data_fetcher._solve_captcha 相同的补偿系数
+COMPENSATION = 1.06
+STAGES = ("decode", "resize", "inference", "postprocess", "total")
+
+
+def load_dataset(images_dir):
+    '''[(name, encoded bytes, ground-truth offset or None)]'''
+    paths = sorted(glob.glob(os.path.join(images_dir, "*.png")) + glob.glob(os.path.join(images_dir, "*.jpg")))
+    labels = {}
+    labels_path = os.path.join(images_dir, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path, encoding="utf-8") as f:
+            for name, value in json.load(f).items():
+                labels[name] = value["offset"] if isinstance(value, dict) else value
+    dataset = []
+    for path in paths:
+        name = os.path.basename(path)
+        offset = labels.get(name)
+        if offset is None:
+            match = re.search(r"_(\d+)\.\w+$", name)
+            offset = int(match.group(1)) if match else None
+        with open(path, "rb") as f:
+            dataset.append((name, f.read(), offset))
+    return dataset
+
+
+def solve(onnx, data, timings):
+    '''one image through the same stages as ONNX.get_distance, timing each'''
+    start = time.perf_counter()
+    image = Image.open(BytesIO(data))
+    image.load()
+    decoded = time.perf_counter()
+    pixels = np.asarray(image.resize((INPUT_SIZE, INPUT_SIZE)).convert("RGB"))
+    onnx._write_input(onnx._input_buffer[0], pixels)
+    resized = time.perf_counter()
+    prediction = onnx._run_buffer(1)
+    inferred = time.perf_counter()
+    distance = onnx._distance(prediction)
+    done = time.perf_counter()
+    for stage, value in zip(STAGES, (decoded - start, resized - decoded, inferred - resized,
+                                     done - inferred, done - start)):
+        timings[stage].append(value)
+    return distance
+
+
+def to_rgba(data):
+    '''416x416 RGBA bytes, what the page hands over with CAPTCHA_RAW_PIXELS=true'''
+    image = Image.open(BytesIO(data))
+    return image.convert("RGBA").resize((INPUT_SIZE, INPUT_SIZE)).tobytes()
+
+
+def solve_rgba(onnx, rgba, timings):
+    '''one pre-resized RGBA image through the same stages as ONNX.get_distance_rgba, timing each'''
+    start = time.perf_counter()
+    pixels = np.frombuffer(rgba, dtype=np.uint8).reshape(INPUT_SIZE, INPUT_SIZE, 4)
+    decoded = time.perf_counter()
+    onnx._write_input(onnx._input_buffer[0], pixels)
+    resized = time.perf_counter()
+    prediction = onnx._run_buffer(1)
+    inferred = time.perf_counter()
+    distance = onnx._distance(prediction)
+    done = time.perf_counter()
+    for stage, value in zip(STAGES, (decoded - start, resized - decoded, inferred - resized,
+                                     done - inferred, done - start)):
+        timings[stage].append(value)
+    return distance
+
+
+def accuracy(results, tolerance):
+    '''error of round(distance*1.06) against the labelled offsets'''
+    labelled = [(distance, offset) for _, distance, offset in results if offset is not None]
+    if not labelled:
+        return {"labelled": 0}
+    errors = [round(distance * COMPENSATION) - offset for distance, offset in labelled]
+    absolute = [abs(e) for e in errors]
+    # 使误差中位数最小的补偿系数，替换模型后可据此调整 1.06
+    ratios = [offset / distance for distance, offset in labelled if distance > 0]
+    return {
+        "labelled": len(labelled),
+        "no_gap_detected": sum(distance == 0 for distance, _ in labelled),
+        "mae_px": sum(absolute) / len(absolute),
+        "mean_error_px": sum(errors) / len(errors),
+        "p50_abs_error_px": percentile(absolute, 50),
+        "p95_abs_error_px": percentile(absolute, 95),
+        "max_abs_error_px": max(absolute),
+        "accuracy": sum(e <= tolerance for e in absolute) / len(absolute),
+        "tolerance_px": tolerance,
+        "fitted_compensation": float(np.median(ratios)) if ratios else None,
+    }
+
+
+def run(args):
+    dataset = load_dataset(args.images)
+    if not dataset:
+        raise SystemExit(f"no images in {args.images}")
+    if args.input == "rgba":
+        dataset = [(name, to_rgba(data), offset) for name, data, offset in dataset]
+        solver = solve_rgba
+    else:
+        solver = solve
+    onnx = ONNX(args.model)
+    for _, data, _ in dataset[:args.warmup]:
+        solver(onnx, data, {stage: [] for stage in STAGES})
+
+    timings = {stage: [] for stage in STAGES}
+    results = []
+    for _ in range(args.repeat):
+        results = [(name, solver(onnx, data, timings), offset) for name, data, offset in dataset]
+    report = {
+        "model": args.model,
+        "input": args.input,
+        "images": len(dataset),
+        "repeat": args.repeat,
+        "stages": {stage: summarize(values) for stage, values in timings.items()},
+        "throughput_ips": len(timings["total"]) / sum(timings["total"]),
+        "peak_rss_mb": peak_rss_mb(),
+        "accuracy": accuracy(results, args.tolerance),
+    }
+
+    print(f"{args.model}: {len(dataset)} images x {args.repeat} repeats, {args.input} input")
+    for stage in STAGES:
+        print("  " + format_summary(stage, report["stages"][stage]))
+    print(f"  throughput={report['throughput_ips']:.1f} img/s peak RSS={report['peak_rss_mb']:.1f}MB")
+    acc = report["accuracy"]
+    if acc["labelled"]:
+        print(f"  offset error vs labels (distance*{COMPENSATION}): n={acc['labelled']} mae={acc['mae_px']:.2f}px "
+              f"bias={acc['mean_error_px']:+.2f}px p50={acc['p50_abs_error_px']}px p95={acc['p95_abs_error_px']}px "
+              f"max={acc['max_abs_error_px']}px within {args.tolerance}px={acc['accuracy']:.1%} "
+              f"no gap={acc['no_gap_detected']}")
+        if acc["fitted_compensation"]:
+            print(f"  fitted compensation factor: {acc['fitted_compensation']:.4f}")
+    else:
+        print("  no labelled images, accuracy not measured")
+    if args.verbose:
+        for name, distance, offset in results:
+            print(f"    {name}: distance={distance} offset={round(distance * COMPENSATION)} label={offset}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.max_mae is not None and (not acc["labelled"] or acc["mae_px"] > args.max_mae):
+        failures.append(f"mae above {args.max_mae}px")
+    if args.min_accuracy is not None and (not acc["labelled"] or acc["accuracy"] < args.min_accuracy):
+        failures.append(f"accuracy below {args.min_accuracy:.0%}")
+    if args.max_p95_ms is not None and report["stages"]["total"]["p95_ms"] > args.max_p95_ms:
+        failures.append(f"p95 latency above {args.max_p95_ms}ms")
+    if failures:
+        print("FAILED: " + ", ".join(failures))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="captcha.onnx")
+    parser.add_argument("--images", required=True, help="directory of recorded slider backgrounds")
+    parser.add_argument("--input", choices=("encoded", "rgba"), default="encoded",
+                        help="encoded PNG/JPEG bytes, or pre-resized RGBA pixels as with CAPTCHA_RAW_PIXELS=true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=3, help="images solved before timing starts")
+    parser.add_argument("--tolerance", type=int, default=3, help="offset error in px still counted as solved")
+    parser.add_argument("--max-mae", type=float, help="fail if the mean absolute offset error is larger")
+    parser.add_argument("--min-accuracy", type=float, help="fail if the share of solved images (0-1) is lower")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if the p95 total latency is larger")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="print every image")
+    sys.exit(run(parser.parse_args()))
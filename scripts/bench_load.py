@@ -0,0 +1,234 @@
+"""在本地模拟的 95598 站点上以递增的并发数运行完整的抓取流程，找出吞吐量不再增长的并发数
+
+    python bench_load.py --accounts 16 --users 3 --concurrency 1,2,4,8
+    python bench_load.py --latency lognormal:400,0.6 --api-latency exp:150 --error-rate 0.02 --rate-limit 20
+
+每个并发级别新建一个 DriverPool，用 fetch_accounts() 抓取全部 --accounts 个模拟账号（浏览器启动计入耗时），统计：
+  吞吐量      成功账号数 / 墙钟分钟
+  单账号耗时  fetch_accounts 返回的 duration 的 p50/p95/p99
+  CPU         Python 进程和每个浏览器进程树（chromedriver、Chromium 及其子进程）的 CPU 占用
+  RSS         每个浏览器进程树的峰值 RSS
+吞吐量相对上一级的增幅低于 --knee-threshold 时，上一级即为拐点，MAX_CONCURRENT_BROWSERS 不宜超过该值。
+模拟站点与抓取运行在同一进程，其 CPU 计入 Python 部分；需要本机安装 Chromium。"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+from bench_utils import percentile, summarize
+from browser_manager import _children_map
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _cpu_ticks(pid):
+    '''utime + stime of one process from /proc, None once it has exited'''
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return int(fields[11]) + int(fields[12])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class BrowserSampler:
+    '''samples CPU time and RSS of every browser in a pool while a level runs'''
+
+    def __init__(self, pool, interval: float = 0.5):
+        self.pool = pool
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="bench-sampler")
+        # {slot: {pid: 最后一次读到的 CPU ticks}}，进程退出后保留其最后的值
+        self.ticks = {}
+        self.peak_rss_mb = {}
+
+    def _sample(self):
+        with self.pool._managers_lock:
+            managers = list(self.pool._managers)
+        if not managers:
+            return
+        children = _children_map()
+        for manager in managers:
+            stack, seen, rss_kb = manager.root_pids(), set(), 0
+            slot_ticks = self.ticks.setdefault(manager.slot, {})
+            while stack:
+                pid = stack.pop()
+                if pid in seen:
+                    continue
+                seen.add(pid)
+                stack.extend(children.get(pid, []))
+                ticks = _cpu_ticks(pid)
+                if ticks is not None:
+                    slot_ticks[pid] = ticks
+                    rss_kb += _rss_kb(pid)
+            self.peak_rss_mb[manager.slot] = max(self.peak_rss_mb.get(manager.slot, 0), rss_kb / 1024)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def cpu_seconds(self):
+        '''{slot: CPU seconds of the browser process tree}'''
+        return {slot: sum(ticks.values()) / CLOCK_TICKS for slot, ticks in self.ticks.items()}
+
+
+def run_level(concurrency, accounts, password):
+    from data_fetcher import DataFetcher
+    from driver_pool import DriverPool, fetch_accounts
+
+    configs = [{"PHONE_NUMBER": phone, "PASSWORD": password} for phone in accounts]
+    pool = DriverPool(DataFetcher(configs[0]["PHONE_NUMBER"], password)._get_webdriver, concurrency)
+    cpu_start = os.times()
+    start = time.monotonic()
+    try:
+        with BrowserSampler(pool) as sampler:
+            results = fetch_accounts(configs, lambda account: DataFetcher(account["PHONE_NUMBER"],
+                                                                          account["PASSWORD"]), pool=pool)
+            sampler._sample()
+    finally:
+        pool.close()
+    elapsed = time.monotonic() - start
+    cpu_end = os.times()
+    succeeded = [result for result in results if result["success"] and not result["failed_users"]]
+    browser_cpu = sampler.cpu_seconds()
+    python_cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    browsers = max(len(browser_cpu), 1)
+    return {
+        "concurrency": concurrency,
+        "accounts": len(results),
+        "succeeded": len(succeeded),
+        "wall_s": elapsed,
+        "accounts_per_min": len(succeeded) / elapsed * 60,
+        "account_duration": summarize([result["duration"] for result in results]),
+        "python_cpu_pct": python_cpu / elapsed * 100,
+        "browser_cpu_pct": {slot: seconds / elapsed * 100 for slot, seconds in sorted(browser_cpu.items())},
+        "cpu_pct_per_browser": sum(browser_cpu.values()) / elapsed * 100 / browsers,
+        "peak_rss_mb_per_browser": dict(sorted(sampler.peak_rss_mb.items())),
+        "p95_rss_mb_per_browser": percentile(list(sampler.peak_rss_mb.values()), 95),
+        "errors": sorted({result["error"] for result in results if result["error"]}),
+    }
+
+
+def find_knee(levels, threshold):
+    '''the concurrency after which throughput grows by less than threshold, None if it kept growing'''
+    for previous, level in zip(levels, levels[1:]):
+        if previous["accounts_per_min"] <= 0:
+            return previous["concurrency"]
+        if level["accounts_per_min"] / previous["accounts_per_min"] - 1 < threshold:
+            return previous["concurrency"]
+    return None
+
+
+def print_level(level):
+    duration = level["account_duration"]
+    print(f"c={level['concurrency']:<3} ok={level['succeeded']}/{level['accounts']:<4} "
+          f"{level['accounts_per_min']:7.2f} accounts/min  wall={level['wall_s']:7.1f}s  "
+          f"p50={duration.get('p50_ms', 0) / 1000:6.1f}s p95={duration.get('p95_ms', 0) / 1000:6.1f}s "
+          f"p99={duration.get('p99_ms', 0) / 1000:6.1f}s  python={level['python_cpu_pct']:5.0f}% CPU  "
+          f"browser={level['cpu_pct_per_browser']:5.0f}% CPU "
+          f"{level['p95_rss_mb_per_browser']:6.0f}MB RSS (per browser, p95)")
+    for error in level["errors"]:
+        print(f"      error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma separated pool sizes to run")
+    parser.add_argument("--accounts", type=int, default=16, help="accounts fetched at every level")
+    parser.add_argument("--users", type=int, default=3, help="户号 per account")
+    parser.add_argument("--latency", default="lognormal:300,0.5", help="page latency distribution, see mock_95598.py")
+    parser.add_argument("--api-latency", default="lognormal:120,0.5", help="API latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=0, help="site wide requests per second, 0 for unlimited")
+    parser.add_argument("--capacity", type=int, default=0, help="requests the site serves at once, 0 for unlimited")
+    parser.add_argument("--captcha-fail-rate", type=float, default=0)
+    parser.add_argument("--knee-threshold", type=float, default=0.1,
+                        help="relative throughput gain below which concurrency stops paying off")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    levels = sorted({int(value) for value in args.concurrency.split(",") if value.strip()})
+
+    # const 在导入时读取 SGCC_BASE_URL，必须在导入抓取相关模块之前指向模拟站点
+    port = _free_port()
+    os.environ["SGCC_BASE_URL"] = f"http://127.0.0.1:{port}"
+    # 每一级都要重新登录，不读写本地状态；重试由本脚本之外的 run_task 负责，这里只跑一轮
+    for key, value in (("ENABLE_SESSION_STORE", "false"), ("ENABLE_CAPTCHA_CACHE", "false"),
+                       ("ENABLE_DATABASE_STORAGE", "false"), ("RECORD_DIR", ""),
+                       ("RETRY_TIMES_LIMIT", "3"), ("RETRY_WAIT_TIME_OFFSET_UNIT", "1"),
+                       ("BROWSER_KEEP_WARM", "false")):
+        os.environ.setdefault(key, value)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+
+    import mock_95598
+    import mock_hass
+    accounts = mock_95598.make_accounts(args.accounts, args.users, args.seed)
+    site = mock_95598.start_server(accounts, port, latency=args.latency, api_latency=args.api_latency,
+                                   error_rate=args.error_rate, rate_limit=args.rate_limit, capacity=args.capacity,
+                                   captcha_fail_rate=args.captcha_fail_rate, seed=args.seed)
+    hass = mock_hass.start_server("bench")
+    os.environ["HASS_URL"] = f"http://127.0.0.1:{hass.server_address[1]}/"
+    os.environ["HASS_TOKEN"] = "bench"
+    print(f"Mock 95598 on {site.url}: {args.accounts} account(s) x {args.users} user(s), "
+          f"page latency {args.latency}, API latency {args.api_latency}, error rate {args.error_rate}, "
+          f"rate limit {args.rate_limit or 'none'}, capacity {args.capacity or 'unlimited'}")
+
+    results = []
+    try:
+        for concurrency in levels:
+            with site.lock:
+                site.requests.clear()
+                site.verifications.update({True: 0, False: 0})
+                site.site.throttled = site.site.errors = 0
+            level = run_level(concurrency, list(accounts), site.site.password)
+            level["site"] = {"requests": dict(site.requests), "throttled": site.site.throttled,
+                             "errors": site.site.errors, "verifications": {"passed": site.verifications[True],
+                                                                 "failed": site.verifications[False]}}
+            results.append(level)
+            print_level(level)
+    finally:
+        site.shutdown()
+        hass.shutdown()
+    knee = find_knee(results, args.knee_threshold)
+    if knee is None:
+        print(f"Throughput still grew by at least {args.knee_threshold:.0%} at c={levels[-1]}, try higher levels.")
+    else:
+        print(f"Throughput stops growing after c={knee} (gain below {args.knee_threshold:.0%}).")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "levels": results, "knee": knee}, f, indent=2, default=str)
+    return 0 if all(level["succeeded"] for level in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""YOLO 后处理微基准：对比 ONNX.get_boxes（逐框 Python 循环）与 ONNX.get_boxes_vectorized
+
+用录制的模型输出（.npy）测试：
+    python bench_postprocess.py --predictions predictions/
+先用模型把一批滑块背景图的输出录制下来：
+    python bench_postprocess.py --record backgrounds/ --model captcha.onnx --predictions predictions/
+没有录制数据时使用合成的输出张量：
+    python bench_postprocess.py --synthetic 20"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from bench_utils import format_summary, summarize
+from onnx import ONNX
+
+
+def record(images_dir, model_path, out_dir):
+    from PIL import Image
+    onnx = ONNX(model_path)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = sorted(glob.glob(os.path.join(images_dir, "*.png")) + glob.glob(os.path.join(images_dir, "*.jpg")))
+    for path in paths:
+        prediction, _ = onnx._inference(Image.open(path))
+        name = os.path.splitext(os.path.basename(path))[0]
+        np.save(os.path.join(out_dir, f"{name}.npy"), prediction)
+    print(f"recorded {len(paths)} prediction tensors to {out_dir}")
+
+
+def synthetic_predictions(count, boxes=10647, seed=0):
+    '''(1, boxes, 6) tensors: mostly background plus a cluster of confident boxes around one gap'''
+    rng = np.random.default_rng(seed)
+    predictions = []
+    for _ in range(count):
+        pred = np.empty((1, boxes, 6), dtype=np.float32)
+        pred[0, :, 0] = rng.uniform(0, 416, boxes)
+        pred[0, :, 1] = rng.uniform(0, 416, boxes)
+        pred[0, :, 2:4] = rng.uniform(10, 80, (boxes, 2))
+        pred[0, :, 4] = rng.beta(0.5, 6, boxes)
+        pred[0, :, 5] = rng.uniform(0, 1, boxes)
+        cluster = rng.choice(boxes, 40, replace=False)
+        gap_x, gap_y = rng.uniform(100, 380), rng.uniform(40, 200)
+        pred[0, cluster, 0] = gap_x + rng.normal(0, 2, 40)
+        pred[0, cluster, 1] = gap_y + rng.normal(0, 2, 40)
+        pred[0, cluster, 2:4] = 52 + rng.normal(0, 2, (40, 2))
+        pred[0, cluster, 4] = rng.uniform(0.75, 0.99, 40)
+        predictions.append(pred)
+    return predictions
+
+
+def bench(onnx, predictions, thresholds, repeat):
+    for threshold in thresholds:
+        timings = {"get_boxes": [], "get_boxes_vectorized": []}
+        mismatches = 0
+        top_mismatches = 0
+        for prediction in predictions:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                # get_boxes 会就地改写输入的类别列，传入副本
+                reference = onnx.get_boxes(prediction.copy(), confidence_threshold=threshold)
+                timings["get_boxes"].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                result = onnx.get_boxes_vectorized(prediction, confidence_threshold=threshold)
+                timings["get_boxes_vectorized"].append(time.perf_counter() - start)
+            if len(reference) != len(result) or (len(result) and not np.allclose(reference, result)):
+                mismatches += 1
+            # get_distance 只使用第一个框
+            if (len(reference) == 0) != (len(result) == 0) or (len(result) and not np.allclose(reference[0], result[0])):
+                top_mismatches += 1
+        print(f"confidence_threshold={threshold}, candidates/tensor="
+              f"{np.mean([np.count_nonzero(p[..., 4] > threshold) for p in predictions]):.0f}")
+        for name, values in timings.items():
+            print("  " + format_summary(name, summarize(values)))
+        speedup = np.median(timings["get_boxes"]) / np.median(timings["get_boxes_vectorized"])
+        # 候选框超过 max_candidates 时低分框会被提前丢弃，完整输出可能不同
+        print(f"  speedup (p50): {speedup:.1f}x, different output: {mismatches}/{len(predictions)}, "
+              f"different first box: {top_mismatches}/{len(predictions)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--predictions", help="directory of recorded .npy prediction tensors")
+    parser.add_argument("--record", metavar="IMAGES_DIR", help="record predictions for the images in this directory")
+    parser.add_argument("--model", default="captcha.onnx")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic tensors instead of recordings")
+    parser.add_argument("--thresholds", default="0.7,0.5,0.3,0.1")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.model, args.predictions or "predictions")
+    else:
+        if args.synthetic:
+            predictions = synthetic_predictions(args.synthetic)
+        else:
+            predictions = [np.load(path) for path in sorted(glob.glob(os.path.join(args.predictions or "predictions", "*.npy")))]
+        if not predictions:
+            parser.error("no prediction tensors, use --record or --synthetic")
+        # 后处理不使用推理会话，不需要加载模型
+        onnx = ONNX.__new__(ONNX)
+        bench(onnx, predictions, [float(t) for t in args.thresholds.split(",")], args.repeat)
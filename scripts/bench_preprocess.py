@@ -0,0 +1,123 @@
+"""滑块背景图从浏览器到模型输入的两条路径对比
+
+旧路径：canvas.toDataURL PNG -> split/base64 解码 -> PIL 解码 -> resize/RGB/np.array/transpose/astype/除法/expand_dims
+新路径：canvas getImageData 416x416 原始 RGBA -> base64 解码 -> np.frombuffer -> 写入复用的 float32 NCHW 缓冲区 -> IOBinding
+
+    python bench_preprocess.py --model captcha.onnx --images backgrounds/
+    python bench_preprocess.py --model captcha.onnx --synthetic 20
+
+浏览器端的 PNG 编码在这里用 PIL 的编码时间近似（encode_png），新路径在浏览器端只有一次 drawImage/getImageData。
+峰值内存为单次识别期间 tracemalloc 记录的 Python/NumPy 分配峰值。"""
+import argparse
+import base64
+import glob
+import os
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from bench_utils import format_summary, peak_rss_mb, summarize
+from onnx import ONNX, INPUT_SIZE
+
+
+def load_images(args):
+    if args.images:
+        paths = sorted(glob.glob(os.path.join(args.images, "*.png")) + glob.glob(os.path.join(args.images, "*.jpg")))
+        return [Image.open(path).convert("RGBA") for path in paths]
+    rng = np.random.default_rng(0)
+    return [Image.fromarray((rng.random((160, 320, 4)) * 255).astype(np.uint8), "RGBA") for _ in range(args.synthetic)]
+
+
+def old_path(onnx, data_url, timings):
+    start = time.perf_counter()
+    background = data_url.split(',')[1]
+    # 与 data_fetcher.base64_to_PLI 相同
+    image = Image.open(BytesIO(base64.b64decode(background)))
+    image.load()
+    decoded = time.perf_counter()
+    img, _ = onnx._preprocess(image)
+    img = np.expand_dims(img, axis=0)
+    preprocessed = time.perf_counter()
+    prediction = onnx.onnx_session.run(onnx.model.output_names, {onnx.model.input_name: img})[0]
+    inferred = time.perf_counter()
+    distance = onnx._distance(prediction)
+    done = time.perf_counter()
+    timings["decode"].append(decoded - start)
+    timings["preprocess"].append(preprocessed - decoded)
+    timings["inference"].append(inferred - preprocessed)
+    timings["postprocess"].append(done - inferred)
+    timings["total"].append(done - start)
+    return distance
+
+
+def new_path(onnx, raw_b64, timings):
+    start = time.perf_counter()
+    pixels = np.frombuffer(base64.b64decode(raw_b64), dtype=np.uint8).reshape(INPUT_SIZE, INPUT_SIZE, 4)
+    decoded = time.perf_counter()
+    onnx._write_input(onnx._input_buffer[0], pixels)
+    preprocessed = time.perf_counter()
+    prediction = onnx._run_buffer(1)
+    inferred = time.perf_counter()
+    distance = onnx._distance(prediction)
+    done = time.perf_counter()
+    timings["decode"].append(decoded - start)
+    timings["preprocess"].append(preprocessed - decoded)
+    timings["inference"].append(inferred - preprocessed)
+    timings["postprocess"].append(done - inferred)
+    timings["total"].append(done - start)
+    return distance
+
+
+def run(name, func, onnx, payloads, repeat):
+    timings = {"decode": [], "preprocess": [], "inference": [], "postprocess": [], "total": []}
+    peaks = []
+    distances = []
+    func(onnx, payloads[0], {k: [] for k in timings})  # 预热
+    for _ in range(repeat):
+        for payload in payloads:
+            tracemalloc.start()
+            distances.append(func(onnx, payload, timings))
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    print(f"{name}:")
+    for stage, values in timings.items():
+        print("  " + format_summary(stage, summarize(values)))
+    print(f"  peak traced memory per solve: max={max(peaks) / 1024 / 1024:.2f}MB "
+          f"mean={sum(peaks) / len(peaks) / 1024 / 1024:.2f}MB")
+    return distances
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="captcha.onnx")
+    parser.add_argument("--images", help="directory of recorded slider backgrounds")
+    parser.add_argument("--synthetic", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    images = load_images(args)
+    onnx = ONNX(args.model)
+
+    encode_times = []
+    data_urls, raw_payloads = [], []
+    for image in images:
+        start = time.perf_counter()
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+        encode_times.append(time.perf_counter() - start)
+        data_urls.append("data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode())
+        # 浏览器中 drawImage 到 416x416 后的 getImageData
+        raw_payloads.append(base64.b64encode(image.resize((INPUT_SIZE, INPUT_SIZE)).tobytes()).decode())
+
+    print(f"{len(images)} images x {args.repeat} repeats")
+    print(format_summary("encode_png (browser, old)", summarize(encode_times)))
+    print(f"payload size: old={sum(map(len, data_urls)) / len(data_urls) / 1024:.0f}KB "
+          f"new={sum(map(len, raw_payloads)) / len(raw_payloads) / 1024:.0f}KB per image")
+    old = run("old path (PNG data URL + PIL)", old_path, onnx, data_urls, args.repeat)
+    new = run("new path (raw RGBA + reused buffer)", new_path, onnx, raw_payloads, args.repeat)
+    differ = sum(abs(a - b) > 2 for a, b in zip(old, new))
+    print(f"distance differs by more than 2px on {differ}/{len(old)} solves (browser vs PIL resampling)")
+    print(f"peak RSS of this process: {peak_rss_mb():.1f}MB")
@@ -0,0 +1,54 @@
+"""基准测试脚本共用的统计工具"""
+import math
+import os
+import resource
+import sys
+
+
+def percentile(values, p):
+    '''nearest-rank percentile of a list of numbers, p in [0, 100]'''
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    '''mean/p50/p95/p99/max of durations in seconds, returned in milliseconds'''
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "mean_ms": sum(values) / len(values) * 1000,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": max(values) * 1000,
+    }
+
+
+def format_summary(name, summary):
+    if not summary.get("n"):
+        return f"{name:<28} no samples"
+    return (f"{name:<28} n={summary['n']:<5} mean={summary['mean_ms']:8.3f}ms p50={summary['p50_ms']:8.3f}ms "
+            f"p95={summary['p95_ms']:8.3f}ms p99={summary['p99_ms']:8.3f}ms max={summary['max_ms']:8.3f}ms")
+
+
+def peak_rss_mb():
+    '''peak resident set size of this process'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上单位为字节，Linux 上为 KB
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb(pid=None):
+    '''current resident set size of a process from /proc, None when unavailable'''
+    try:
+        with open(f"/proc/{pid or os.getpid()}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+import time
+
+
+def _children_map():
+    '''{ppid: [pid]} of all processes from /proc'''
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # comm 可能包含空格，从最后一个括号之后解析
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    return children
+
+
+def account_scripts(driver):
+    '''identifiers of the Page.addScriptToEvaluateOnNewDocument scripts that belong to the current account'''
+    scripts = getattr(driver, "_account_scripts", None)
+    if scripts is None:
+        scripts = driver._account_scripts = set()
+    return scripts
+
+
+def process_tree_rss_mb(root_pids):
+    '''total VmRSS of the given processes and all their descendants, None when /proc is unavailable'''
+    if not os.path.isdir("/proc"):
+        return None
+    children = _children_map()
+    seen, stack, total_kb = set(), [pid for pid in root_pids if pid], 0
+    while stack:
+        pid = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            pass
+    return total_kb / 1024
+
+
+class BrowserManager:
+    '''Owns one WebDriver: starts it on demand, health-checks it before every
+    use and recycles it after BROWSER_MAX_USES uses or once the Chromium
+    process tree grows beyond BROWSER_MAX_RSS_MB.'''
+
+    def __init__(self, driver_factory, create_lock: threading.Lock = None, slot: str = "0"):
+        self._factory = driver_factory
+        self.slot = slot
+        # undetected_chromedriver 启动时会改写 chromedriver 文件，多个实例的创建需要串行
+        self._create_lock = create_lock or threading.Lock()
+        self.driver = None
+        self.uses = 0
+        self.starts = 0
+        self.BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", 20))
+        self.BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", 1500))
+
+    def _start(self):
+        with self._create_lock:
+            start = time.monotonic()
+            self.driver = self._factory()
+        self.uses = 0
+        self.starts += 1
+        logging.info(f"WebDriver started in {time.monotonic() - start:.1f}s.")
+
+    def root_pids(self):
+        '''pids of chromedriver and the browser, their descendants are the renderer/GPU processes'''
+        if self.driver is None:
+            return []
+        process = getattr(getattr(self.driver, "service", None), "process", None)
+        return [pid for pid in (getattr(process, "pid", None), getattr(self.driver, "browser_pid", None)) if pid]
+
+    def rss_mb(self):
+        '''memory of chromedriver and the browser with all renderer/GPU processes'''
+        if self.driver is None:
+            return 0
+        return process_tree_rss_mb(self.root_pids())
+
+    def is_healthy(self):
+        '''the driver processes are alive and the browser answers a script'''
+        if self.driver is None:
+            return False
+        process = getattr(getattr(self.driver, "service", None), "process", None)
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except Exception as e:
+            logging.debug(f"WebDriver health check failed: {e}")
+            return False
+
+    def _recycle_reason(self):
+        if not self.is_healthy():
+            return "health check failed"
+        if self.BROWSER_MAX_USES and self.uses >= self.BROWSER_MAX_USES:
+            return f"used {self.uses} times"
+        if self.BROWSER_MAX_RSS_MB:
+            rss = self.rss_mb()
+            if rss is not None and rss > self.BROWSER_MAX_RSS_MB:
+                return f"RSS {rss:.0f}MB above {self.BROWSER_MAX_RSS_MB}MB"
+        return None
+
+    def acquire(self):
+        '''a healthy driver, started or replaced as needed'''
+        if self.driver is not None:
+            reason = self._recycle_reason()
+            if reason is None:
+                return self.driver
+            logging.info(f"Recycling WebDriver: {reason}.")
+            self.quit()
+        self._start()
+        return self.driver
+
+    def release(self):
+        '''count one finished use of the driver'''
+        self.uses += 1
+
+    def quit(self):
+        driver, self.driver = self.driver, None
+        if driver is None:
+            return
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.debug(f"Error while quitting WebDriver: {e}")
@@ -0,0 +1,155 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+HASH_SIZE = 8
+
+
+def image_hash(image):
+    """滑块背景的感知哈希（dHash，64 位）
+    image: (H,W,3/4) uint8 数组或 PIL 图片；缩放、轻微重采样差异不会改变哈希"""
+    pixels = image if isinstance(image, np.ndarray) else np.asarray(image.convert("RGB"))
+    gray = pixels[..., 0] * 0.299 + pixels[..., 1] * 0.587 + pixels[..., 2] * 0.114
+    # 按块求平均缩小到 8 行 9 列
+    row_edges = np.linspace(0, gray.shape[0], HASH_SIZE + 1).astype(int)[:-1]
+    col_edges = np.linspace(0, gray.shape[1], HASH_SIZE + 2).astype(int)[:-1]
+    sums = np.add.reduceat(np.add.reduceat(gray, row_edges, axis=0), col_edges, axis=1)
+    counts = np.outer(np.diff(np.append(row_edges, gray.shape[0])), np.diff(np.append(col_edges, gray.shape[1])))
+    small = sums / counts
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def rgba_hash(rgba: bytes, width: int, height: int):
+    '''image_hash of raw RGBA bytes from canvas getImageData'''
+    return image_hash(np.frombuffer(rgba, dtype=np.uint8).reshape(height, width, 4))
+
+
+def _to_signed(value):
+    '''SQLite integers are signed 64-bit'''
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class CaptchaCache:
+    '''Persistent map from the perceptual hash of a slider background to the
+    slide offset that logged in successfully, plus offsets that failed.
+    Bounded to CAPTCHA_CACHE_SIZE entries with LRU eviction.'''
+
+    def __init__(self):
+        path = os.getenv("CAPTCHA_CACHE_PATH", "captcha_cache.db")
+        if 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(path):
+            path = "/data/" + path
+        self.CAPTCHA_CACHE_SIZE = int(os.getenv("CAPTCHA_CACHE_SIZE", 2000))
+        self.CAPTCHA_CACHE_MAX_DISTANCE = int(os.getenv("CAPTCHA_CACHE_MAX_DISTANCE", 0))
+        self._lock = threading.Lock()
+        self.connect = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connect.executescript('''
+            CREATE TABLE IF NOT EXISTS captcha_cache (
+                hash INTEGER PRIMARY KEY NOT NULL,
+                offset INTEGER,
+                failed TEXT NOT NULL DEFAULT '[]',
+                hits INTEGER NOT NULL DEFAULT 0,
+                last_used REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS captcha_cache_last_used ON captcha_cache (last_used);
+            CREATE TABLE IF NOT EXISTS captcha_cache_stats (
+                name TEXT PRIMARY KEY NOT NULL,
+                value INTEGER NOT NULL);''')
+        self.connect.commit()
+
+    def _count(self, name, amount=1):
+        self.connect.execute(
+            "INSERT INTO captcha_cache_stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount))
+
+    def _nearest(self, value):
+        '''the cached row whose hash is closest to value within CAPTCHA_CACHE_MAX_DISTANCE bits'''
+        if self.CAPTCHA_CACHE_MAX_DISTANCE <= 0:
+            return self._exact(value)
+        best, best_distance = None, self.CAPTCHA_CACHE_MAX_DISTANCE + 1
+        for row in self.connect.execute("SELECT hash, offset, failed FROM captcha_cache"):
+            distance = bin((row[0] & ((1 << 64) - 1)) ^ value).count("1")
+            if distance < best_distance:
+                best, best_distance = row, distance
+        return best
+
+    def lookup(self, value):
+        '''verified slide offset for this background, None on a miss'''
+        with self._lock:
+            row = self._nearest(value)
+            if row is not None and row[1] is not None:
+                self.connect.execute("UPDATE captcha_cache SET hits = hits + 1, last_used = ? WHERE hash = ?",
+                                     (time.time(), row[0]))
+                self._count("hits")
+                self.connect.commit()
+                return row[1]
+            self._count("misses")
+            self.connect.commit()
+            return None
+
+    def _exact(self, value):
+        return self.connect.execute("SELECT hash, offset, failed FROM captcha_cache WHERE hash = ?",
+                                    (_to_signed(value),)).fetchone()
+
+    def failed_offsets(self, value):
+        '''offsets that failed on exactly this background, a near hash may have its gap elsewhere'''
+        with self._lock:
+            row = self._exact(value)
+            return set(json.loads(row[2])) if row is not None else set()
+
+    def record(self, value, offset, success):
+        '''remember the outcome of sliding to offset on this background'''
+        with self._lock:
+            row = self._exact(value)
+            key = _to_signed(value)
+            failed = set(json.loads(row[2])) if row is not None else set()
+            verified = row[1] if row is not None else None
+            if success:
+                verified = offset
+                failed.discard(offset)
+                self._count("saved_offsets")
+            else:
+                failed.add(offset)
+                if verified == offset:
+                    verified = None
+            self.connect.execute(
+                "INSERT INTO captcha_cache (hash, offset, failed, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(hash) DO UPDATE SET offset = excluded.offset, failed = excluded.failed, "
+                "last_used = excluded.last_used",
+                (key, verified, json.dumps(sorted(failed)), time.time()))
+            # LRU：超出容量时删除最久未使用的条目
+            self.connect.execute(
+                "DELETE FROM captcha_cache WHERE hash IN (SELECT hash FROM captcha_cache "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.CAPTCHA_CACHE_SIZE,))
+            self.connect.commit()
+
+    def add_inference_time(self, seconds):
+        '''account model time spent on misses, used to estimate the time saved by hits'''
+        with self._lock:
+            self._count("inference_ms", int(seconds * 1000))
+            self._count("inferences")
+            self.connect.commit()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.connect.execute("SELECT name, value FROM captcha_cache_stats"))
+            entries, verified = self.connect.execute(
+                "SELECT COUNT(*), COUNT(offset) FROM captcha_cache").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        inferences = counters.get("inferences", 0)
+        mean_inference_ms = counters.get("inference_ms", 0) / inferences if inferences else 0.0
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "entries": entries,
+            "verified_entries": verified,
+            "saved_model_seconds": round(hits * mean_inference_ms / 1000, 2),
+        }
+
+    def close(self):
+        with self._lock:
+            self.connect.close()
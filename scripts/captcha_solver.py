@@ -0,0 +1,300 @@
+"""本地滑块验证码识别服务：模型只加载一次，多个抓取进程的请求合并成一个批次推理
+
+启动：python captcha_solver.py serve --address unix:/tmp/captcha.sock --max-batch 8 --max-delay-ms 10
+压测：python captcha_solver.py bench --address unix:/tmp/captcha.sock --images backgrounds/ --concurrency 8 --requests 200
+抓取进程设置 CAPTCHA_SOLVER_ADDRESS 后使用本服务，服务不可用时回退到进程内识别。"""
+import argparse
+import glob
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+
+from bench_utils import format_summary, summarize
+
+OP_SOLVE = b"S"
+OP_SOLVE_RGBA = b"R"
+OP_STATS = b"T"
+HEADER = struct.Struct(">cI")
+LENGTH = struct.Struct(">I")
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+INPUT_SIZE = 416
+
+
+def parse_address(address: str):
+    '''"unix:/path/to.sock" or "host:port" -> (family, sockaddr)'''
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, port = address.rsplit(":", 1)
+    return socket.AF_INET, (host, int(port))
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class SolverStats:
+    '''request/batch counters and recent latencies of the solver'''
+
+    def __init__(self, window=10000):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.batch_sizes = {}
+        self.latencies = deque(maxlen=window)
+        self.queue_waits = deque(maxlen=window)
+        self.inference_times = deque(maxlen=window)
+
+    def record_batch(self, size, inference_time, queue_waits, latencies):
+        with self._lock:
+            self.requests += size
+            self.batches += 1
+            self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+            self.inference_times.append(inference_time)
+            self.queue_waits.extend(queue_waits)
+            self.latencies.extend(latencies)
+
+    def record_error(self, size):
+        with self._lock:
+            self.errors += size
+
+    def snapshot(self):
+        with self._lock:
+            uptime = time.monotonic() - self.started
+            return {
+                "uptime_s": uptime,
+                "requests": self.requests,
+                "batches": self.batches,
+                "errors": self.errors,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0,
+                "batch_sizes": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+                "throughput_rps": self.requests / uptime if uptime else 0,
+                "latency": summarize(list(self.latencies)),
+                "queue_wait": summarize(list(self.queue_waits)),
+                "inference_per_batch": summarize(list(self.inference_times)),
+            }
+
+
+class Batcher:
+    '''collect concurrent requests for up to max_delay seconds (or max_batch images) and infer them together'''
+
+    def __init__(self, onnx, max_batch: int, max_delay: float):
+        self.onnx = onnx
+        self.max_batch = max_batch if onnx.supports_batch() else 1
+        self.max_delay = max_delay
+        self.stats = SolverStats()
+        self._queue = queue.Queue()
+        if self.max_batch == 1 and max_batch > 1:
+            logging.warning("The model has a fixed batch size of 1, requests are solved one by one.")
+        threading.Thread(target=self._run, daemon=True, name="solver-batcher").start()
+
+    def submit(self, image) -> Future:
+        future = Future()
+        self._queue.put((image, future, time.monotonic()))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.monotonic()
+            try:
+                distances = self.onnx.get_distances([image for image, _, _ in batch])
+            except Exception as e:
+                logging.error(f"Batch inference of {len(batch)} image(s) failed: {e}")
+                self.stats.record_error(len(batch))
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            done = time.monotonic()
+            for (_, future, _), distance in zip(batch, distances):
+                future.set_result(distance)
+            self.stats.record_batch(len(batch), done - start,
+                                    [start - enqueued for _, _, enqueued in batch],
+                                    [done - enqueued for _, _, enqueued in batch])
+
+
+class SolverHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        from PIL import Image
+        op, size = HEADER.unpack(_recv_exact(self.request, HEADER.size))
+        if size > MAX_MESSAGE_SIZE:
+            raise ValueError(f"message of {size} bytes is too large")
+        body = _recv_exact(self.request, size)
+        if op == OP_STATS:
+            response = self.server.batcher.stats.snapshot()
+        elif op in (OP_SOLVE, OP_SOLVE_RGBA):
+            try:
+                if op == OP_SOLVE_RGBA:
+                    # 浏览器中已缩放为 416x416 的原始 RGBA 像素
+                    image = np.frombuffer(body, dtype=np.uint8).reshape(INPUT_SIZE, INPUT_SIZE, 4)
+                else:
+                    image = Image.open(BytesIO(body))
+                    image.load()
+                response = {"distance": self.server.batcher.submit(image).result()}
+            except Exception as e:
+                response = {"error": str(e)}
+        else:
+            response = {"error": f"unknown op {op!r}"}
+        data = json.dumps(response).encode("utf-8")
+        self.request.sendall(LENGTH.pack(len(data)) + data)
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def start_server(address: str, onnx, max_batch: int = 8, max_delay: float = 0.01):
+    '''serve in a daemon thread, returns the server'''
+    family, sockaddr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(sockaddr):
+            os.remove(sockaddr)
+        server = ThreadingUnixServer(sockaddr, SolverHandler)
+    else:
+        server = ThreadingTCPServer(sockaddr, SolverHandler)
+    server.batcher = Batcher(onnx, max_batch, max_delay)
+    threading.Thread(target=server.serve_forever, daemon=True, name="solver-server").start()
+    return server
+
+
+class SolverClient:
+    '''client used by DataFetcher, one short-lived connection per request'''
+
+    def __init__(self, address: str, timeout: float = 30):
+        self.address = address
+        self.timeout = timeout
+        self._family, self._sockaddr = parse_address(address)
+
+    def _call(self, op: bytes, body: bytes = b""):
+        with socket.socket(self._family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self._sockaddr)
+            sock.sendall(HEADER.pack(op, len(body)) + body)
+            size, = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+            response = json.loads(_recv_exact(sock, size))
+        if "error" in response:
+            raise RuntimeError(f"captcha solver error: {response['error']}")
+        return response
+
+    def get_distance(self, image_bytes: bytes):
+        '''distance for an encoded (PNG/JPEG) background image'''
+        return self._call(OP_SOLVE, image_bytes)["distance"]
+
+    def get_distance_rgba(self, rgba: bytes):
+        '''distance for raw 416x416 RGBA pixels'''
+        return self._call(OP_SOLVE_RGBA, rgba)["distance"]
+
+    def stats(self):
+        return self._call(OP_STATS)
+
+
+def report(stats: dict):
+    lines = [f"requests={stats['requests']} batches={stats['batches']} errors={stats['errors']} "
+             f"mean_batch={stats['mean_batch_size']:.2f} throughput={stats['throughput_rps']:.1f} req/s",
+             format_summary("latency", stats["latency"]),
+             format_summary("queue wait", stats["queue_wait"]),
+             format_summary("inference per batch", stats["inference_per_batch"]),
+             f"batch sizes: {stats['batch_sizes']}"]
+    return "\n".join(lines)
+
+
+def serve(args):
+    from onnx import ONNX
+    onnx = ONNX(args.model)
+    server = start_server(args.address, onnx, args.max_batch, args.max_delay_ms / 1000)
+    logging.info(f"Captcha solver listening on {args.address}, max batch {server.batcher.max_batch}, "
+                 f"max delay {args.max_delay_ms}ms.")
+    last_requests = 0
+    while True:
+        time.sleep(args.report_interval)
+        stats = server.batcher.stats.snapshot()
+        if stats["requests"] != last_requests:
+            last_requests = stats["requests"]
+            logging.info("Captcha solver stats:\n" + report(stats))
+
+
+def bench(args):
+    paths = sorted(glob.glob(os.path.join(args.images, "*.png")) + glob.glob(os.path.join(args.images, "*.jpg")))
+    if not paths:
+        raise SystemExit(f"no images in {args.images}")
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    client = SolverClient(args.address)
+
+    def one(index):
+        start = time.perf_counter()
+        client.get_distance(images[index % len(images)])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        latencies = list(executor.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    print(f"concurrency={args.concurrency} requests={args.requests} elapsed={elapsed:.2f}s "
+          f"throughput={args.requests / elapsed:.1f} img/s")
+    print(format_summary("client latency", summarize(latencies)))
+    print("server:\n" + report(client.stats()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="run the solver daemon")
+    serve_parser.add_argument("--address", default=os.getenv("CAPTCHA_SOLVER_ADDRESS", "127.0.0.1:8599"))
+    serve_parser.add_argument("--model", default="captcha.onnx")
+    serve_parser.add_argument("--max-batch", type=int, default=int(os.getenv("CAPTCHA_SOLVER_MAX_BATCH", 8)))
+    serve_parser.add_argument("--max-delay-ms", type=float, default=float(os.getenv("CAPTCHA_SOLVER_MAX_DELAY_MS", 10)))
+    serve_parser.add_argument("--report-interval", type=float, default=300, help="seconds between stats logs")
+    bench_parser = sub.add_parser("bench", help="measure latency/throughput of a running solver")
+    bench_parser.add_argument("--address", default=os.getenv("CAPTCHA_SOLVER_ADDRESS", "127.0.0.1:8599"))
+    bench_parser.add_argument("--images", required=True, help="directory of background images")
+    bench_parser.add_argument("--concurrency", type=int, default=8)
+    bench_parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s  [%(levelname)-8s] ---- %(message)s")
+    if args.command == "serve":
+        serve(args)
+    else:
+        bench(args)
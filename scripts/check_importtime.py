@@ -0,0 +1,83 @@
+"""启动导入开销的回归检查：入口模块导入时不应加载浏览器和验证码识别相关的重依赖
+
+    python check_importtime.py
+    python check_importtime.py --module main5fenzongxunhuan --budget-ms 250 --top 15
+
+在子进程中以 python -X importtime 导入入口模块（重复 --repeat 次取最快一次），检查：
+  HEAVY_MODULES 中的包没有被导入（它们应在 run_task() 开始执行时才导入）
+  入口模块的累计导入时间不超过 --budget-ms（0 表示不检查）
+并列出累计耗时最多的顶层导入。任一检查失败时退出码为 1，可在 CI 或改动依赖后运行。"""
+import argparse
+import os
+import subprocess
+import sys
+
+# 只在执行抓取时需要的依赖
+HEAVY_MODULES = ("undetected_chromedriver", "selenium", "PIL", "onnxruntime", "numpy", "sympy",
+                 "onnx", "data_fetcher", "captcha_solver", "captcha_cache")
+
+
+def parse_importtime(stderr: str):
+    '''[(module, self_us, cumulative_us, depth)] from the -X importtime report'''
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(fields[0]), int(fields[1]), depth))
+    return imports
+
+
+def subtree(imports, module: str):
+    '''entries imported by module, -X importtime lists children right before their parent'''
+    end = next(index for index, entry in enumerate(imports) if entry[0] == module and entry[3] == 0)
+    start = end
+    while start > 0 and imports[start - 1][3] > 0:
+        start -= 1
+    return imports[start:end + 1]
+
+
+def measure(module: str):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    if process.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{process.stderr[-2000:]}")
+    # 解释器启动时（site、.pth）的导入不计入
+    return subtree(parse_importtime(process.stderr), module)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main5fenzongxunhuan", help="entry module to import")
+    parser.add_argument("--budget-ms", type=float, default=250, help="cumulative import time allowed, 0 to skip")
+    parser.add_argument("--repeat", type=int, default=3, help="imports measured, the fastest one is reported")
+    parser.add_argument("--top", type=int, default=10, help="slowest top level imports to list")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(max(1, args.repeat))]
+    imports = min(runs, key=lambda run: run[-1][2])
+    total_ms = imports[-1][2] / 1000
+
+    failures = []
+    heavy = sorted({name.split(".")[0] for name, _, _, _ in imports} & set(HEAVY_MODULES))
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    if args.budget_ms and total_ms > args.budget_ms:
+        failures.append(f"import of {args.module} took {total_ms:.1f}ms, budget {args.budget_ms:.0f}ms")
+
+    print(f"{args.module}: {total_ms:.1f}ms cumulative, {len(imports)} modules imported")
+    top_level = sorted((entry for entry in imports if entry[3] == 1), key=lambda entry: entry[2], reverse=True)
+    for name, _, cumulative, _ in top_level[:args.top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,15 @@
+import os
+
 # 填写普通参数 不要填写密码等敏感信息
-# 国网电力官网
-LOGIN_URL = "https://95598.cn/osgweb/login"
-ELECTRIC_USAGE_URL = "https://95598.cn/osgweb/electricityCharge"
-BALANCE_URL = "https://95598.cn/osgweb/userAcc"
+# 国网电力官网，SGCC_BASE_URL 可指向 replay_server.py / mock_95598.py 启动的本地站点用于离线测试
+SGCC_BASE_URL = os.getenv("SGCC_BASE_URL", "https://95598.cn").rstrip("/")
+LOGIN_URL = SGCC_BASE_URL + "/osgweb/login"
+ELECTRIC_USAGE_URL = SGCC_BASE_URL + "/osgweb/electricityCharge"
+BALANCE_URL = SGCC_BASE_URL + "/osgweb/userAcc"
+# 登录后页面通过 XHR 调用的接口，HTTP 抓取模式（FETCH_BACKEND=http）直接请求
+API_BASE_URL = SGCC_BASE_URL
+USER_LIST_API = "/api/osg-open-uc0001/member/c9/f02" # 绑定的户号列表
+BALANCE_API = "/api/osg-web0004/member/c24/f01" # 户号余额
 
 
 # Home Assistant
@@ -6,7 +6,6 @@ import time
 
 import random
 import base64
-import sqlite3
 import undetected_chromedriver as uc
 from selenium import webdriver
 from selenium.webdriver import ActionChains
@@ -16,16 +15,72 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.common.exceptions import WebDriverException
 from sensor_updator import SensorUpdator
+from page_waiter import PageWaiter
+from session_store import SessionStore
+from http_backend import HttpBackend
+from captcha_solver import INPUT_SIZE, SolverClient
+from captcha_cache import CaptchaCache, image_hash, rgba_hash
+from balance_store import get_balance_store
+from tracing import span, traced
+from profiling import memory_diff, profiled, sample_browser
+import recorder
 
 from const import *
 
 import platform
+from datetime import datetime, timedelta
 from io import BytesIO
-from PIL import Image
-from onnx import ONNX
+
+# 把滑块背景 canvas 缩放到模型输入大小后取 getImageData 的原始 RGBA 像素，base64 返回
+RAW_BACKGROUND_JS = """
+var source = document.getElementById("slideVerify").childNodes[0];
+var size = arguments[0];
+var canvas = document.createElement("canvas");
+canvas.width = size;
+canvas.height = size;
+var ctx = canvas.getContext("2d");
+ctx.drawImage(source, 0, 0, size, size);
+var data = ctx.getImageData(0, 0, size, size).data;
+var chunks = [];
+for (var i = 0; i < data.length; i += 0x8000) {
+    chunks.push(String.fromCharCode.apply(null, data.subarray(i, i + 0x8000)));
+}
+return btoa(chunks.join(""));
+"""
+
+# 日用电量表（ELECTRIC_USAGE_URL 的“日用电量”页），每行为 日期、用电量
+DAILY_USAGE_TABLE_XPATH = "//*[@id='pane-second']/div[2]/div[2]/div[1]/div[3]/table/tbody"
+DAILY_USAGE_ROWS_JS = """
+var body = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!body) { return []; }
+return Array.from(body.querySelectorAll("tr")).map(function (tr) {
+    var cells = tr.querySelectorAll("td");
+    return [cells[0] ? cells[0].innerText.trim() : "", cells[1] ? cells[1].innerText.trim() : ""];
+});
+"""
+# BROWSER_PROFILE=lean 时屏蔽的请求；滑块背景由 canvas 绘制（接口返回的 base64/data: 地址），不受影响，
+# png 也不屏蔽，以免影响滑块拼图
+# setBlockedURLs 的通配符要匹配整个 URL，带查询参数（如 logo.jpg?v=3）的资源需要单独的 "?*" 模式
+def _with_query(extensions):
+    return [f"*.{extension}{suffix}" for extension in extensions for suffix in ("", "?*")]
+
+
+LEAN_BLOCKED_IMAGES = _with_query(["jpg", "jpeg", "gif", "webp", "ico", "svg"])
+LEAN_BLOCKED_URLS = _with_query(["woff", "woff2", "ttf", "otf", "eot", "mp4", "webm", "mp3", "ogg"]) + [
+    "*hm.baidu.com*", "*cnzz.com*", "*google-analytics.com*", "*googletagmanager.com*",
+    "*growingio.com*", "*sensorsdata*", "*doubleclick.net*",
+]
+# 减少渲染进程数量和后台任务的内存占用
+LEAN_CHROME_FLAGS = [
+    "--disable-extensions", "--disable-background-networking", "--disable-component-update",
+    "--disable-default-apps", "--disable-sync", "--no-first-run", "--mute-audio",
+    "--disable-features=site-per-process,Translate,OptimizationHints,MediaRouter",
+    "--renderer-process-limit=2", "--disable-software-rasterizer",
+]
 
 
 def base64_to_PLI(base64_str: str):
+    from PIL import Image
     base64_data = re.sub('^data:image/.+;base64,', '', base64_str)
     byte_data = base64.b64decode(base64_data)
     image_data = BytesIO(byte_data)
@@ -40,7 +95,15 @@ class DataFetcher:
             dotenv.load_dotenv(verbose=True)
         self._username = username
         self._password = password
-        self.onnx = ONNX("./captcha.onnx")
+        self._onnx = None
+        # 配置后由本地识别服务（captcha_solver.py）统一推理
+        self.CAPTCHA_RAW_PIXELS = os.getenv("CAPTCHA_RAW_PIXELS", "true").lower() == "true"
+        if os.getenv("ENABLE_CAPTCHA_CACHE", "true").lower() == "true":
+            self.captcha_cache = CaptchaCache()
+        else:
+            self.captcha_cache = None
+        solver_address = os.getenv("CAPTCHA_SOLVER_ADDRESS", "")
+        self.solver = SolverClient(solver_address) if solver_address else None
         if platform.system() == 'Windows':
             pass
         else:
@@ -52,7 +115,40 @@ class DataFetcher:
         self.RETRY_TIMES_LIMIT = int(os.getenv("RETRY_TIMES_LIMIT", 5))
         self.LOGIN_EXPECTED_TIME = int(os.getenv("LOGIN_EXPECTED_TIME", 10))
         self.RETRY_WAIT_TIME_OFFSET_UNIT = int(os.getenv("RETRY_WAIT_TIME_OFFSET_UNIT", 10))
+        # 提交滑块或验证码后等待跳转的时间，验证失败时页面不跳转，等待过长会拖慢每次重试
+        self.CAPTCHA_VERIFY_TIMEOUT = float(os.getenv("CAPTCHA_VERIFY_TIMEOUT", 8))
         self.IGNORE_USER_ID = os.getenv("IGNORE_USER_ID", "xxxxx,xxxxx").split(",")
+        self.waiter = PageWaiter()
+        # RECORD_DIR 设置时在 fetch() 中替换为真正的录制器
+        self.recorder = recorder.NULL_RECORDER
+        # default：原有的大窗口、不过滤请求；lean：屏蔽字体/媒体/图片/统计脚本，小视口并减少渲染进程
+        self.BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "default").lower()
+        self.LEAN_WINDOW_SIZE = os.getenv("LEAN_WINDOW_SIZE", "1280,800")
+        self.LEAN_BLOCKED_URLS = LEAN_BLOCKED_URLS + [
+            url for url in os.getenv("LEAN_EXTRA_BLOCKED_URLS", "").split(",") if url]
+        if os.getenv("LEAN_BLOCK_IMAGES", "true").lower() == "true":
+            self.LEAN_BLOCKED_URLS += LEAN_BLOCKED_IMAGES
+        # selenium：在页面上逐个户号抓取；http：登录后直接请求页面背后的 JSON 接口
+        self.FETCH_BACKEND = os.getenv("FETCH_BACKEND", "selenium").lower()
+        self.SESSION_VALIDATE_TIMEOUT = int(os.getenv("SESSION_VALIDATE_TIMEOUT", 20))
+        self.DATA_RETENTION_DAYS = int(os.getenv("DATA_RETENTION_DAYS", 7))
+        # 数据库存储开启时从 ELECTRIC_USAGE_URL 增量抓取日用电量
+        self.FETCH_DAILY_USAGE = os.getenv("FETCH_DAILY_USAGE", "true").lower() == "true"
+        # 同时打开多少个标签页分别选择户号读取余额，1 为逐个户号处理
+        self.BALANCE_TAB_FANOUT = max(1, int(os.getenv("BALANCE_TAB_FANOUT", 1)))
+        if os.getenv("ENABLE_SESSION_STORE", "true").lower() == "true":
+            self.session_store = SessionStore(username, password)
+        else:
+            self.session_store = None
+
+    @property
+    def onnx(self):
+        '''the CAPTCHA model is only needed when a real login happens, load it on first use'''
+        if self._onnx is None:
+            # onnxruntime 和 NumPy 较重，使用识别服务或已保存的会话时不需要导入
+            from onnx import ONNX
+            self._onnx = ONNX("./captcha.onnx")
+        return self._onnx
 
     # @staticmethod
     def _click_button(self, driver, button_search_type, button_search_key):
@@ -93,71 +189,50 @@ class DataFetcher:
             # time.sleep(0.2)
         ActionChains(driver).release().perform()
 
-    def connect_user_db(self, user_id):
-        """创建数据库集合，db_name = electricity_daily_usage_{user_id}
-        :param user_id: 用户ID"""
-        try:
-            # 创建数据库
-            DB_NAME = os.getenv("DB_NAME", "homeassistant.db")
-            if 'PYTHON_IN_DOCKER' in os.environ: 
-                DB_NAME = "/data/" + DB_NAME
-            self.connect = sqlite3.connect(DB_NAME)
-            self.connect.cursor()
-            logging.info(f"Database of {DB_NAME} created successfully.")
-			
-			# 创建data表名
-            self.table_expand_name = f"data{user_id}"
-            sql = f'''CREATE TABLE IF NOT EXISTS {self.table_expand_name} (
-                    name TEXT PRIMARY KEY NOT NULL,
-                    value TEXT NOT NULL)'''
-            self.connect.execute(sql)
-            logging.info(f"Table {self.table_expand_name} created successfully")
-			
-        # 如果表已存在，则不会创建
-        except sqlite3.Error as e:
-            logging.debug(f"Create db or Table error:{e}")
-            return False
-        return True
-
-    def insert_expand_data(self, data:dict):
-        if self.connect is None:
-            logging.error("Database connection is not established.")
-            return
-        # 创建索引
-        try:
-            sql = f"INSERT OR REPLACE INTO {self.table_expand_name} VALUES('{data['name']}','{data['value']}');"
-            self.connect.execute(sql)
-            self.connect.commit()
-        except BaseException as e:
-            logging.debug(f"Data update failed: {e}")
-
-                
+    @traced("get_webdriver")
     def _get_webdriver(self):
         chrome_options = Options()
         chrome_options.add_argument('--incognito')
-        chrome_options.add_argument('--window-size=4000,1600')
+        if self.BROWSER_PROFILE == "lean":
+            chrome_options.add_argument(f'--window-size={self.LEAN_WINDOW_SIZE}')
+            for flag in LEAN_CHROME_FLAGS:
+                chrome_options.add_argument(flag)
+        else:
+            chrome_options.add_argument('--window-size=4000,1600')
         chrome_options.add_argument('--headless')
+        if recorder.ENABLED:
+            # 录制 XHR 响应需要 Chrome 的 performance 日志
+            chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
         chrome_options.add_argument('--no-sandbox')
         chrome_options.add_argument('--disable-gpu')
         chrome_options.add_argument('--disable-dev-shm-usage')
         driver = uc.Chrome(driver_executable_path="/usr/bin/chromedriver", options=chrome_options, version_main=self._chromium_version)
         driver.implicitly_wait(self.DRIVER_IMPLICITY_WAIT_TIME)
+        self.waiter.install(driver)
+        if self.BROWSER_PROFILE == "lean":
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.LEAN_BLOCKED_URLS})
         return driver
 
+    @traced("login")
     def _login(self, driver, phone_code = False):
 
-        driver.get(LOGIN_URL)
+        with span("page_load", page="login"):
+            driver.get(LOGIN_URL)
         logging.info(f"Open LOGIN_URL:{LOGIN_URL}.\r")
-        time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
+        self.waiter.wait_page_ready(driver)
+        self.recorder.page(driver, "login")
+        self.waiter.fallback_sleep()
         # swtich to username-password login page
-        driver.find_element(By.CLASS_NAME, "user").click()
+        self.waiter.wait_present(driver, By.CLASS_NAME, "user").click()
         logging.info("find_element 'user'.\r")
         self._click_button(driver, By.XPATH, '//*[@id="login_box"]/div[1]/div[1]/div[2]/span')
-        time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
+        self.waiter.wait_visible(driver, By.XPATH, '//*[@id="login_box"]/div[2]/div[1]/form/div[1]/div[3]/div/span[2]')
+        self.waiter.fallback_sleep()
         # click agree button
         self._click_button(driver, By.XPATH, '//*[@id="login_box"]/div[2]/div[1]/form/div[1]/div[3]/div/span[2]')
         logging.info("Click the Agree option.\r")
-        time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
+        self.waiter.fallback_sleep()
         if phone_code:
             self._click_button(driver, By.XPATH, '//*[@id="login_box"]/div[1]/div[1]/div[3]/span')
             input_elements = driver.find_elements(By.CLASS_NAME, "el-input__inner")
@@ -169,8 +244,9 @@ class DataFetcher:
             logging.info(f"input_elements verification code: {code}.\r")
             # click login button
             self._click_button(driver, By.XPATH, '//*[@id="login_box"]/div[2]/div[2]/form/div[2]/div/button/span')
-            time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT*2)
             logging.info("Click login button.\r")
+            self.waiter.wait_url_change(driver, LOGIN_URL, timeout=self.CAPTCHA_VERIFY_TIMEOUT)
+            self.waiter.fallback_sleep(2)
 
             return True
         else :
@@ -183,30 +259,31 @@ class DataFetcher:
 
             # click login button
             self._click_button(driver, By.CLASS_NAME, "el-button.el-button--primary")
-            time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT*2)
             logging.info("Click login button.\r")
+            self.waiter.fallback_sleep(2)
             # sometimes ddddOCR may fail, so add retry logic)
             for retry_times in range(1, self.RETRY_TIMES_LIMIT + 1):
-                
-                self._click_button(driver, By.XPATH, '//*[@id="login_box"]/div[1]/div[1]/div[2]/span')
-                #get canvas image
-                background_JS = 'return document.getElementById("slideVerify").childNodes[0].toDataURL("image/png");'
-                # targe_JS = 'return document.getElementsByClassName("slide-verify-block")[0].toDataURL("image/png");'
-                # get base64 image data
-                im_info = driver.execute_script(background_JS) 
-                background = im_info.split(',')[1]  
-                background_image = base64_to_PLI(background)
-                logging.info(f"Get electricity canvas image successfully.\r")
-                distance = self.onnx.get_distance(background_image)
-                logging.info(f"Image CaptCHA distance is {distance}.\r")
-
-                self._sliding_track(driver, round(distance*1.06)) #1.06是补偿
-                time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
+                with span("captcha_attempt", attempt=retry_times) as attempt:
+                    self._click_button(driver, By.XPATH, '//*[@id="login_box"]/div[1]/div[1]/div[2]/span')
+                    self.waiter.wait_slider_ready(driver)
+                    captcha_index = self.recorder.captcha(driver)
+                    offset, captcha_hash = self._solve_captcha(driver)
+
+                    with span("captcha_slide", offset=offset):
+                        self._sliding_track(driver, offset)
+                    with span("captcha_verify"):
+                        self.waiter.wait_url_change(driver, LOGIN_URL, timeout=self.CAPTCHA_VERIFY_TIMEOUT)
+                        self.waiter.fallback_sleep()
+                    attempt.set(success=driver.current_url != LOGIN_URL)
+                    self.recorder.captcha_result(captcha_index, offset, driver.current_url != LOGIN_URL)
+                if captcha_hash is not None:
+                    self.captcha_cache.record(captcha_hash, offset, driver.current_url != LOGIN_URL)
+                    logging.info(f"Captcha cache stats: {self.captcha_cache.stats()}")
                 if (driver.current_url == LOGIN_URL): # if login not success
                     try:
                         logging.info(f"Sliding CAPTCHA recognition failed and reloaded.\r")
                         self._click_button(driver, By.CLASS_NAME, "el-button.el-button--primary")
-                        time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT*2)
+                        self.waiter.fallback_sleep(2)
                         continue
                     except:
                         logging.debug(
@@ -219,26 +296,96 @@ class DataFetcher:
         raise Exception(
             "Login failed, maybe caused by 1.incorrect phone_number and password, please double check. or 2. network, please mnodify LOGIN_EXPECTED_TIME in .env and run docker compose up --build.")
         
-    def fetch(self):
-        """Main logic for fetching data."""
-        driver = None
+    def _solve_captcha(self, driver):
+        '''slide offset for the slider background canvas, and the perceptual hash of the background'''
+        with span("captcha_decode", raw=self.CAPTCHA_RAW_PIXELS):
+            if self.CAPTCHA_RAW_PIXELS:
+                # 直接取 416x416 的原始像素，省去浏览器端 PNG 编码和这里的解码、缩放
+                rgba = base64.b64decode(driver.execute_script(RAW_BACKGROUND_JS, INPUT_SIZE))
+                logging.info(f"Get electricity canvas pixels successfully.\r")
+                captcha_hash = rgba_hash(rgba, INPUT_SIZE, INPUT_SIZE) if self.captcha_cache else None
+            else:
+                #get canvas image
+                background_JS = 'return document.getElementById("slideVerify").childNodes[0].toDataURL("image/png");'
+                # targe_JS = 'return document.getElementsByClassName("slide-verify-block")[0].toDataURL("image/png");'
+                # get base64 image data
+                im_info = driver.execute_script(background_JS)
+                logging.info(f"Get electricity canvas image successfully.\r")
+                background = im_info.split(',')[1]
+                background_image = base64_to_PLI(background)
+                captcha_hash = image_hash(background_image) if self.captcha_cache else None
+
+        if captcha_hash is not None:
+            offset = self.captcha_cache.lookup(captcha_hash)
+            if offset is not None:
+                logging.info(f"Captcha cache hit, reuse the verified slide offset {offset}.\r")
+                return offset, captcha_hash
+
+        distance = None
+        solve_start = time.monotonic()
+        with span("captcha_inference") as inference, memory_diff("onnx_solve"):
+            if self.solver is not None:
+                try:
+                    if self.CAPTCHA_RAW_PIXELS:
+                        distance = self.solver.get_distance_rgba(rgba)
+                    else:
+                        distance = self.solver.get_distance(base64.b64decode(background))
+                    inference.set(backend="solver")
+                except (OSError, RuntimeError) as e:
+                    logging.warning(f"Captcha solver at {self.solver.address} unavailable, solve locally: {e}")
+            if distance is None:
+                if self.CAPTCHA_RAW_PIXELS:
+                    distance = self.onnx.get_distance_rgba(rgba)
+                else:
+                    distance = self.onnx.get_distance(background_image)
+                inference.set(backend="onnx")
+        logging.info(f"Image CaptCHA distance is {distance}.\r")
+        if self.captcha_cache is not None:
+            self.captcha_cache.add_inference_time(time.monotonic() - solve_start)
+        offset = round(distance*1.06) #1.06是补偿
+
+        if captcha_hash is not None:
+            # 这张背景图上已经失败过的偏移量不再重复尝试，改用最近的未失败值
+            failed = self.captcha_cache.failed_offsets(captcha_hash)
+            if offset in failed:
+                candidates = [offset + delta for delta in (1, -1, 2, -2, 3, -3) if offset + delta not in failed]
+                if candidates:
+                    logging.info(f"Slide offset {offset} failed before on this background, try {candidates[0]}.\r")
+                    offset = candidates[0]
+        return offset, captcha_hash
+
+    @traced("fetch")
+    @profiled("fetch")
+    def fetch(self, driver=None):
+        """Main logic for fetching data.
+        A driver passed in (e.g. from DriverPool) is used as is and not quit here.
+        Returns {user_id: balance} with None for users that failed, or None if login failed."""
+        owns_driver = driver is None
+        balances = None
+        self.recorder = recorder.open_recorder(self._username)
         try:
             # Initialize WebDriver
-            if platform.system() == 'Windows':
-                driverfile_path = r'C:\Users\mxwang\Project\msedgedriver.exe'
-                driver = webdriver.Edge(executable_path=driverfile_path)
-            else:
-                driver = self._get_webdriver()
+            if owns_driver:
+                if platform.system() == 'Windows':
+                    driverfile_path = r'C:\Users\mxwang\Project\msedgedriver.exe'
+                    driver = webdriver.Edge(executable_path=driverfile_path)
+                else:
+                    driver = self._get_webdriver()
             
-            driver.maximize_window()
+            if self.BROWSER_PROFILE != "lean":
+                driver.maximize_window()
             logging.info("WebDriver initialized.")
             updator = SensorUpdator()
 
             # Try logging in
             try:
                 debug_mode = os.getenv("DEBUG_MODE", "false").lower() == "true"
-                if self._login(driver, phone_code=debug_mode):
+                if self._restore_session(driver):
+                    logging.info("Stored session is still valid, login skipped.")
+                elif self._login(driver, phone_code=debug_mode):
                     logging.info("Login succeeded!")
+                    if self.session_store is not None:
+                        self.session_store.save(driver)
                 else:
                     logging.error("Login failed!")
                     raise Exception("Login failed")
@@ -247,64 +394,212 @@ class DataFetcher:
                 return
 
             logging.info(f"Login successful on {LOGIN_URL}")
+            sample_browser(driver, "after_login")
+            if self.FETCH_BACKEND == "http":
+                result = self._fetch_over_http(driver, updator)
+                if result is not None:
+                    user_id_list, balances = result
+                    logging.info("Data fetching over HTTP completed successfully.")
+                    self._finish_fetch(driver, user_id_list, balances, updator)
+                    return balances
+                logging.warning("HTTP backend unavailable, fall back to scraping the pages.")
             user_id_list = self._get_user_ids(driver)
+            if user_id_list is None:
+                return
             logging.info(f"Fetched {len(user_id_list)} user IDs, ignoring {self.IGNORE_USER_ID}.")
-            
-            # Iterate through users
-            for userid_index, user_id in enumerate(user_id_list):
-                try:
-                    driver.get(BALANCE_URL)
-                    time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
-                    
-                    self._choose_current_userid(driver, userid_index)
-                    time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
-                    
-                    current_userid = self._get_current_userid(driver)
-                    if current_userid in self.IGNORE_USER_ID:
-                        logging.info(f"Skipping ignored user {current_userid}.")
-                        continue
-                    
-                    # Fetch data
-                    balance = self._get_balance(driver)
-                    updator.update_one_userid(user_id, balance)
-                    
-                    logging.info(f"Data fetched successfully for user.")
-                    time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
-                 
-                except Exception as e:
-                    logging.warning(f"Failed to fetch data for user: {e}")
-                    continue  # Continue to next user
-
+            with memory_diff("user_loop"):
+                if self.BALANCE_TAB_FANOUT > 1 and len(user_id_list) > 1:
+                    balances = self._fetch_balances_in_tabs(driver, user_id_list, updator)
+                else:
+                    balances = {}
+                    for userid_index, user_id in enumerate(user_id_list):
+                        try:
+                            with span("page_load", page="balance"):
+                                driver.get(BALANCE_URL)
+                                self.waiter.wait_page_ready(driver)
+                            self.waiter.fallback_sleep()
+
+                            self._choose_current_userid(driver, userid_index)
+                            self.waiter.fallback_sleep()
+
+                            current_userid = self._get_current_userid(driver)
+                            if current_userid in self.IGNORE_USER_ID:
+                                logging.info(f"Skipping ignored user {current_userid}.")
+                                continue
+
+                            # Fetch data
+                            balance = self._get_balance(driver)
+                            self.recorder.balance(driver, user_id)
+                            balances[user_id] = balance
+                            updator.update_one_userid(user_id, balance)
+
+                            logging.info(f"Data fetched successfully for user.")
+                            sample_browser(driver, f"user_{userid_index}")
+                            self.waiter.fallback_sleep()
+
+                        except Exception as e:
+                            logging.warning(f"Failed to fetch data for user: {e}")
+                            balances[user_id] = None
+                            continue  # Continue to next user
+
+            sample_browser(driver, "after_users")
             logging.info("Data fetching completed successfully.")
+            self._finish_fetch(driver, user_id_list, balances, updator)
 
         except Exception as e:
             logging.error(f"Unexpected error in fetch process: {e}")
 
         finally:
-            if driver:
+            self.recorder.close()
+            self.recorder = recorder.NULL_RECORDER
+            if driver and owns_driver:
                 try:
                     driver.quit()
                     logging.info("WebDriver successfully quit.")
                 except WebDriverException as e:
                     logging.error(f"Error while quitting WebDriver: {e}")
+        return balances
+
+    def _fetch_balances_in_tabs(self, driver, user_id_list, updator):
+        """每批打开 BALANCE_TAB_FANOUT 个标签页，每页选择一个户号后再依次读取余额。
+        WebDriver 命令是串行的，但各标签页的页面加载和切换户号后的 XHR 在浏览器中同时进行"""
+        balances = {}
+        main_window = driver.current_window_handle
+        users = list(enumerate(user_id_list))
+        for start in range(0, len(users), self.BALANCE_TAB_FANOUT):
+            batch = users[start:start + self.BALANCE_TAB_FANOUT]
+            known = set(driver.window_handles)
+            # window.open 不等待页面加载，所有标签页同时开始加载
+            for _ in batch:
+                driver.execute_script("window.open(arguments[0], '_blank');", BALANCE_URL)
+            self.waiter.until(lambda: len(set(driver.window_handles) - known) >= len(batch),
+                              message="balance tabs to open")
+            tabs = [handle for handle in driver.window_handles if handle not in known]
+            selected = []
+            for tab, (userid_index, user_id) in zip(tabs, batch):
+                try:
+                    driver.switch_to.window(tab)
+                    self.waiter.track_network(driver)
+                    self.waiter.wait_page_ready(driver)
+                    self._choose_current_userid(driver, userid_index, wait=False)
+                    selected.append((tab, user_id))
+                except Exception as e:
+                    logging.warning(f"Failed to choose user in tab: {e}")
+                    balances[user_id] = None
+            for tab, user_id in selected:
+                try:
+                    driver.switch_to.window(tab)
+                    self.waiter.wait_network_idle(driver)
+                    current_userid = self._get_current_userid(driver)
+                    if current_userid in self.IGNORE_USER_ID:
+                        logging.info(f"Skipping ignored user {current_userid}.")
+                        continue
+                    shown = (re.findall("[0-9]+", current_userid) or [""])[-1]
+                    if shown != user_id:
+                        # 户号切换未生效时页面上仍是其他户号的余额，不能记到 user_id 名下
+                        logging.warning(f"Tab shows user {shown[-4:]} instead of {user_id[-4:]}, "
+                                        f"balance not recorded.")
+                        balances[user_id] = None
+                        continue
+                    balance = self._get_balance(driver)
+                    self.recorder.balance(driver, user_id)
+                    balances[user_id] = balance
+                    updator.update_one_userid(user_id, balance)
+                except Exception as e:
+                    logging.warning(f"Failed to fetch data for user: {e}")
+                    balances[user_id] = None
+            for tab in tabs:
+                try:
+                    driver.switch_to.window(tab)
+                    driver.close()
+                except WebDriverException as e:
+                    logging.debug(f"Failed to close balance tab: {e}")
+            driver.switch_to.window(main_window)
+        logging.info(f"Fetched balances of {len(user_id_list)} user(s) with {self.BALANCE_TAB_FANOUT} tabs.")
+        return balances
+
+    def _fetch_over_http(self, driver, updator):
+        '''(user ids in dropdown order, balances) from the JSON endpoints using the browser's cookies,
+        None if the backend can not be used'''
+        backend = HttpBackend.from_driver(driver)
+        try:
+            all_user_ids = backend.get_user_ids()
+            user_id_list = [user_id for user_id in all_user_ids if user_id not in self.IGNORE_USER_ID]
+            logging.info(f"Fetched {len(user_id_list)} user IDs over HTTP, ignoring {self.IGNORE_USER_ID}.")
+            balances = backend.get_balances(user_id_list)
+        except Exception as e:
+            logging.warning(f"Failed to fetch data over HTTP: {e}")
+            return None
+        finally:
+            backend.close()
+        for user_id, balance in balances.items():
+            updator.update_one_userid(user_id, balance)
+        return all_user_ids, balances
+
+    def _finish_fetch(self, driver, user_id_list, balances, updator):
+        '''steps shared by both backends once the balances are read'''
+        self._save_balances_to_db(balances)
+        if self.enable_database_storage and self.FETCH_DAILY_USAGE:
+            # 日用电量没有对应的 JSON 接口，两种后端都在页面上读取
+            self._harvest_daily_usage(driver, user_id_list, updator)
+        # 刷新本地保存的会话，延长其有效期
+        if self.session_store is not None:
+            self.session_store.save(driver)
+
+    def _restore_session(self, driver):
+        '''restore the stored login session and check on BALANCE_URL that it is still alive'''
+        if self.session_store is None or not self.session_store.restore(driver):
+            return False
+        alive = None
+        try:
+            with span("page_load", page="session_check"):
+                driver.get(BALANCE_URL)
+            self.waiter.wait_document_ready(driver, timeout=self.SESSION_VALIDATE_TIMEOUT)
+            # 会话失效时前端路由会跳回登录页，有效时会渲染户号下拉框
+            self.waiter.until(
+                lambda: driver.current_url.startswith(LOGIN_URL)
+                or self.waiter.find_now(driver, By.CLASS_NAME, "el-dropdown") is not None,
+                timeout=self.SESSION_VALIDATE_TIMEOUT, message="session check on BALANCE_URL")
+            alive = not driver.current_url.startswith(LOGIN_URL)
+        except TimeoutError:
+            alive = False
+        finally:
+            if alive is None:
+                # 页面加载出错时无法判断会话是否失效，保留本地会话，只移除注入的 web storage 脚本
+                self.session_store.finish_restore(driver)
+        if alive:
+            self.session_store.finish_restore(driver)
+        else:
+            logging.info("Stored session has expired, fall back to login.")
+            self.session_store.clear(driver)
+        return alive
 
     def _get_current_userid(self, driver):
         current_userid = driver.find_element(By.XPATH, '//*[@id="app"]/div/div/article/div/div/div[2]/div/div/div[1]/div[2]/div/div/div/div[2]/div/div[1]/div/ul/div/li[1]/span[2]').text
         return current_userid
     
-    def _choose_current_userid(self, driver, userid_index):
-        elements = driver.find_elements(By.CLASS_NAME, "button_confirm")
-        if elements:
+    @traced("choose_current_userid")
+    def _choose_current_userid(self, driver, userid_index, wait=True):
+        if self.waiter.find_now(driver, By.CLASS_NAME, "button_confirm") is not None:
             self._click_button(driver, By.XPATH, f'''//*[@id="app"]/div/div[2]/div/div/div/div[2]/div[2]/div/button''')
-        time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
+        self.waiter.fallback_sleep()
+        self.waiter.wait_visible(driver, By.CLASS_NAME, "el-input__suffix")
         self._click_button(driver, By.CLASS_NAME, "el-input__suffix")
-        time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
-        self._click_button(driver, By.XPATH, f"/html/body/div[2]/div[1]/div[{userid_index+1}]/ul/li/span")
-
+        option_xpath = f"/html/body/div[2]/div[1]/div[{userid_index+1}]/ul/li/span"
+        self.waiter.wait_visible(driver, By.XPATH, option_xpath)
+        self.waiter.fallback_sleep()
+        self._click_button(driver, By.XPATH, option_xpath)
+        # 切换户号会触发 XHR 刷新余额；多标签页模式下由调用方稍后再等待
+        if wait:
+            self.waiter.wait_network_idle(driver)
+
+    @traced("get_balance")
     def _get_balance(self, driver):
+        """read the balance of the user selected on the current BALANCE_URL page"""
         try:
-            driver.get(BALANCE_URL)
-            time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
+            self.waiter.wait_stable_text(driver, By.CLASS_NAME, "amttxt")
+            self.waiter.wait_stable_text(driver, By.CLASS_NAME, "num", predicate=lambda text: text.strip() != "")
+            self.waiter.fallback_sleep()
             balance = self._get_electric_balance(driver)
             if (balance is None):
                 logging.info(f"Get electricity charge balance for user failed, Pass.")
@@ -316,37 +611,36 @@ class DataFetcher:
             logging.error(f"Failed to get balance: {e}")
             return None
 
+    @traced("get_user_ids")
     def _get_user_ids(self, driver):
         try:
             # 刷新网页
             driver.refresh()
-            time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT*2)
-            element = WebDriverWait(driver, self.DRIVER_IMPLICITY_WAIT_TIME).until(EC.presence_of_element_located((By.CLASS_NAME, 'el-dropdown')))
+            self.waiter.wait_page_ready(driver)
+            self.waiter.fallback_sleep(2)
+            self.waiter.wait_visible(driver, By.CLASS_NAME, 'el-dropdown')
             # click roll down button for user id
             self._click_button(driver, By.XPATH, "//div[@class='el-dropdown']/span")
             logging.debug(f'''self._click_button(driver, By.XPATH, "//div[@class='el-dropdown']/span")''')
-            time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
+            self.waiter.fallback_sleep()
             # wait for roll down menu displayed
-            target = driver.find_element(By.CLASS_NAME, "el-dropdown-menu.el-popper").find_element(By.TAG_NAME, "li")
-            logging.debug(f'''target = driver.find_element(By.CLASS_NAME, "el-dropdown-menu.el-popper").find_element(By.TAG_NAME, "li")''')
-            time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
-            WebDriverWait(driver, self.DRIVER_IMPLICITY_WAIT_TIME).until(EC.visibility_of(target))
-            time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
-            logging.debug(f'''WebDriverWait(driver, self.DRIVER_IMPLICITY_WAIT_TIME).until(EC.visibility_of(target))''')
-            WebDriverWait(driver, self.DRIVER_IMPLICITY_WAIT_TIME).until(
-                EC.text_to_be_present_in_element((By.XPATH, "//ul[@class='el-dropdown-menu el-popper']/li"), ":"))
-            time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT)
+            self.waiter.wait_visible(driver, By.CSS_SELECTOR, ".el-dropdown-menu.el-popper li")
+            logging.debug("roll down menu of user id is visible")
+            self.waiter.wait_stable_text(driver, By.CSS_SELECTOR, ".el-dropdown-menu.el-popper",
+                                         predicate=lambda text: ":" in text)
+            self.waiter.fallback_sleep()
 
             # get user id one by one
             userid_elements = driver.find_element(By.CLASS_NAME, "el-dropdown-menu.el-popper").find_elements(By.TAG_NAME, "li")
             userid_list = []
             for element in userid_elements:
                 userid_list.append(re.findall("[0-9]+", element.text)[-1])
+            self.recorder.user_ids(driver, userid_list)
             return userid_list
         except Exception as e:
             logging.error(
                 f"Webdriver quit abnormly, reason: {e}. get user_id list failed.")
-            driver.quit()
+            return None
 
     def _get_electric_balance(self, driver):
         try:
@@ -359,25 +653,65 @@ class DataFetcher:
         except:
             return None
 
-    def _save_balance_to_db(self, user_id, balance):
-        """Saves the balance to the database."""
-        if self.connect_user_db(user_id):
+    @traced("harvest_daily_usage")
+    def _harvest_daily_usage(self, driver, user_id_list, updator):
+        """把 ELECTRIC_USAGE_URL 日用电量表中本地还没有的日期写入数据库，月/年累计随之增量更新。
+        已有昨天数据的户号不打开页面；缺少的天数超过 7 天且 DATA_RETENTION_DAYS=30 时才切换到 30 天视图"""
+        store = get_balance_store()
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        for userid_index, user_id in enumerate(user_id_list):
+            if user_id in self.IGNORE_USER_ID:
+                continue
+            last_day = store.last_usage_day(user_id)
+            if last_day is not None and last_day >= yesterday:
+                logging.debug(f"Daily usage of user {user_id[-4:]} is up to date.")
+                updator.update_usage(user_id, store.usage_summary(user_id))
+                continue
             try:
-                # 写入当前户号
-                dic = {'name': 'user', 'value': f"{user_id}"}
-                self.insert_expand_data(dic)
-                # 写入剩余金额
-                dic = {'name': 'balance', 'value': f"{balance}"}
-                self.insert_expand_data(dic)
-                self.connect.close()
-                logging.info(f"Balance for user {user_id} saved to database.")
+                with span("page_load", page="usage"):
+                    driver.get(ELECTRIC_USAGE_URL)
+                self.waiter.wait_page_ready(driver)
+                self._choose_current_userid(driver, userid_index)
+                self._click_button(driver, By.XPATH, "//div[@class='el-tabs__nav is-top']/div[@id='tab-second']")
+                missing = self.DATA_RETENTION_DAYS if last_day is None else \
+                    (datetime.now() - datetime.strptime(last_day, "%Y-%m-%d")).days
+                if missing > 7 and self.DATA_RETENTION_DAYS == 30:
+                    self._click_button(driver, By.XPATH, "//*[@id='pane-second']/div[1]/div/label[2]/span[1]")
+                    self.waiter.wait_network_idle(driver)
+                self.waiter.wait_stable_text(driver, By.XPATH, DAILY_USAGE_TABLE_XPATH,
+                                             predicate=lambda text: text.strip() != "")
+                # 一次脚本调用读出整张表
+                rows = driver.execute_script(DAILY_USAGE_ROWS_JS, DAILY_USAGE_TABLE_XPATH)
+                self.recorder.usage(driver, user_id, rows)
+                days = {}
+                for day, usage in rows:
+                    if not usage.strip() or (last_day is not None and day < last_day):
+                        continue
+                    try:
+                        days[day] = float(usage)
+                    except ValueError:
+                        # 当天数据未出时表格显示 "-" 等占位符，跳过这一格，其余日期照常保存
+                        logging.debug(f"Skip daily usage {usage!r} of user {user_id[-4:]} on {day}.")
+                changed = store.add_daily_usage(user_id, days)
+                logging.info(f"Daily usage of user {user_id[-4:]}: {changed} day(s) added or updated.")
+                summary = store.usage_summary(user_id)
+                if summary is not None:
+                    updator.update_usage(user_id, summary)
             except Exception as e:
-                logging.error(f"Failed to save balance to database: {e}")
-            finally:
-                if hasattr(self, 'connect') and self.connect:
-                    self.connect.close()
-        else:
-            logging.error("Database connection failed, balance not saved.")
+                logging.warning(f"Failed to fetch daily usage for user: {e}")
+
+    @traced("save_balances_to_db")
+    def _save_balances_to_db(self, balances):
+        """append this run's balances to the history database in one transaction"""
+        if not self.enable_database_storage or not balances:
+            return
+        try:
+            store = get_balance_store()
+            store.add_many((user_id, balance, None) for user_id, balance in balances.items())
+            store.flush()
+            logging.info(f"Balances of {sum(b is not None for b in balances.values())} user(s) saved to database.")
+        except Exception as e:
+            logging.error(f"Failed to save balances to database: {e}")
 
 if __name__ == "__main__":
     with open("bg.jpg", "rb") as f:
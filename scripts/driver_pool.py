@@ -0,0 +1,164 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from const import *
+from accounts import mask_account
+from browser_manager import BrowserManager, account_scripts
+import metrics
+
+
+def _available_memory_mb():
+    '''MemAvailable from /proc/meminfo, None when it can not be read'''
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_pool_size(account_count: int):
+    """并发浏览器数量上限
+    MAX_CONCURRENT_BROWSERS 为数字时直接使用，为 auto（默认）时按 CPU 核数和可用内存
+    （每个 Chromium 约 BROWSER_MEMORY_MB MB）估算"""
+    setting = os.getenv("MAX_CONCURRENT_BROWSERS", "auto").lower()
+    if setting != "auto":
+        size = int(setting)
+    else:
+        size = os.cpu_count() or 1
+        memory_mb = _available_memory_mb()
+        if memory_mb is not None:
+            size = min(size, memory_mb // int(os.getenv("BROWSER_MEMORY_MB", 400)))
+    return max(1, min(size, account_count))
+
+
+class DriverPool:
+    '''A bounded pool of browsers shared by concurrent fetchers.
+
+    Each slot is a BrowserManager around a driver created lazily by
+    driver_factory (DataFetcher._get_webdriver). Drivers are reset between
+    accounts, recycled by their manager and quit when close() is called;
+    a pool that is not closed keeps its browsers warm for the next run.'''
+
+    def __init__(self, driver_factory, size: int):
+        self.size = size
+        self._factory = driver_factory
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._create_lock = threading.Lock()
+        self._managers = []
+        self._managers_lock = threading.Lock()
+        self.origin = "{0.scheme}://{0.netloc}".format(urlparse(LOGIN_URL))
+
+    def _manager(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._managers_lock:
+                manager = BrowserManager(self._factory, self._create_lock, slot=str(len(self._managers)))
+                self._managers.append(manager)
+            return manager
+
+    def _reset(self, driver):
+        '''forget the previous account (scripts it injected, cookies, storage) before the driver is handed out again'''
+        scripts = account_scripts(driver)
+        while scripts:
+            driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": scripts.pop()})
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": self.origin, "storageTypes": "all"})
+        driver.get("about:blank")
+
+    @contextmanager
+    def driver(self):
+        '''borrow a driver, a driver that raised is quit instead of being reused'''
+        self._slots.acquire()
+        manager = None
+        try:
+            manager = self._manager()
+            driver = manager.acquire()
+            try:
+                yield driver
+            except BaseException:
+                manager.quit()
+                raise
+            manager.release()
+            if metrics.enabled():
+                metrics.observe_browser(manager.slot, manager.rss_mb())
+            try:
+                self._reset(driver)
+            except Exception as e:
+                logging.warning(f"Pooled WebDriver can not be reset, discarded: {e}")
+                manager.quit()
+        finally:
+            if manager is not None:
+                self._idle.put(manager)
+            self._slots.release()
+
+    def close(self):
+        with self._managers_lock:
+            managers, self._managers = self._managers, []
+        # 未放回空闲队列的槽位在关闭后不再复用
+        self._idle = queue.LifoQueue()
+        running = sum(manager.driver is not None for manager in managers)
+        for manager in managers:
+            manager.quit()
+        logging.info(f"Driver pool closed, {running} WebDriver(s) quit.")
+
+
+def fetch_accounts(accounts: list, fetcher_factory, pool_size: int = None, pool: DriverPool = None):
+    """多账号并发抓取，返回每个账号的结果
+    {"account": 手机号, "success": 登录并取得户号列表, "balances": {户号: 余额},
+     "failed_users": [余额获取失败的户号], "error": str, "duration": 秒}
+    传入 pool 时使用其中已启动的浏览器，结束后不关闭，由调用方保留到下一次执行"""
+    if not accounts:
+        return []
+    fetchers = [fetcher_factory(account) for account in accounts]
+    owns_pool = pool is None
+    if owns_pool:
+        pool = DriverPool(fetchers[0]._get_webdriver, pool_size or default_pool_size(len(accounts)))
+    pool_size = pool.size
+    logging.info(f"Fetching {len(accounts)} account(s) with {pool_size} concurrent browser(s).")
+
+    def run_one(fetcher, account):
+        start = time.monotonic()
+        result = {"account": account["PHONE_NUMBER"], "success": False, "balances": {},
+                  "failed_users": [], "error": ""}
+        try:
+            with pool.driver() as driver:
+                balances = fetcher.fetch(driver=driver)
+            if balances is None:
+                result["error"] = "login or user list failed"
+            else:
+                result["success"] = True
+                result["balances"] = balances
+                result["failed_users"] = [user_id for user_id, balance in balances.items() if balance is None]
+        except Exception as e:
+            result["error"] = str(e)
+        result["duration"] = time.monotonic() - start
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="fetcher") as executor:
+            results = list(executor.map(run_one, fetchers, accounts))
+    finally:
+        if owns_pool:
+            pool.close()
+
+    for result in results:
+        if not result["success"]:
+            status = f"FAILED ({result['error']})"
+        elif result["failed_users"]:
+            status = f"PARTIAL (balance failed for {', '.join(result['failed_users'])})"
+        else:
+            status = "OK"
+        logging.info(f"Account {mask_account(result['account'])}: {status}, "
+                     f"{len(result['balances'])} user(s), {result['duration']:.1f}s")
+    return results
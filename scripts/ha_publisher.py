@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from const import *
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+class HaPublisher:
+    '''Push sensor states to Home Assistant's REST API (POST /api/states/<entity_id>).
+
+    All requests share one keep-alive session and at most HA_PUBLISH_WORKERS
+    run at once. A state whose value and attributes were already pushed within
+    HA_STATE_CACHE_MAX_AGE seconds is skipped; the cache survives restarts in
+    HA_STATE_CACHE_PATH.'''
+
+    def __init__(self, base_url: str = None, token: str = None):
+        # 以 Add-on 形式运行时通过 supervisor 代理访问
+        if base_url is None and os.getenv("SUPERVISOR_TOKEN") and not os.getenv("HASS_URL"):
+            base_url, token = SUPERVISOR_URL, os.getenv("SUPERVISOR_TOKEN")
+        self.base_url = (base_url or os.getenv("HASS_URL", "")).rstrip("/")
+        self.token = token or os.getenv("HASS_TOKEN", "")
+        self.HA_PUBLISH_TIMEOUT = float(os.getenv("HA_PUBLISH_TIMEOUT", 10))
+        self.HA_PUBLISH_WORKERS = int(os.getenv("HA_PUBLISH_WORKERS", 4))
+        self.HA_STATE_CACHE_MAX_AGE = int(os.getenv("HA_STATE_CACHE_MAX_AGE", 86400))
+        cache_path = os.getenv("HA_STATE_CACHE_PATH", "ha_state_cache.json")
+        if 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(cache_path):
+            cache_path = "/data/" + cache_path
+        self.cache_path = cache_path
+
+        self.session = requests.Session()
+        retry = Retry(total=int(os.getenv("HA_PUBLISH_RETRIES", 3)), backoff_factor=0.5,
+                      status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.HA_PUBLISH_WORKERS, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Authorization": "Bearer " + self.token, "Content-Type": "application/json"})
+        self._executor = ThreadPoolExecutor(max_workers=self.HA_PUBLISH_WORKERS, thread_name_prefix="ha-publish")
+        self._cache_lock = threading.Lock()
+        self._cache = self._load_cache()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        tmp = self.cache_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._cache, f)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logging.debug(f"Failed to save Home Assistant state cache: {e}")
+
+    @staticmethod
+    def _fingerprint(state, attributes):
+        # 不同日期的 present_date 等属性变化也会重新推送
+        return hashlib.sha1(json.dumps([state, attributes], sort_keys=True, default=str).encode()).hexdigest()
+
+    def _unchanged(self, entity_id, fingerprint):
+        cached = self._cache.get(entity_id)
+        return cached is not None and cached[0] == fingerprint and time.time() - cached[1] < self.HA_STATE_CACHE_MAX_AGE
+
+    def _post(self, entity_id, state, attributes):
+        response = self.session.post(f"{self.base_url}{API_PATH}{entity_id}",
+                                     json={"state": state, "attributes": attributes},
+                                     timeout=self.HA_PUBLISH_TIMEOUT)
+        response.raise_for_status()
+
+    def publish(self, states):
+        """states: [(entity_id, state, attributes)]，返回 {"sent", "skipped", "failed"} 数量"""
+        pending = []
+        skipped = 0
+        with self._cache_lock:
+            for entity_id, state, attributes in states:
+                fingerprint = self._fingerprint(state, attributes)
+                if self._unchanged(entity_id, fingerprint):
+                    skipped += 1
+                else:
+                    pending.append((entity_id, state, attributes, fingerprint))
+        futures = [(item, self._executor.submit(self._post, *item[:3])) for item in pending]
+        # 等待请求完成时不持有锁，其他抓取线程的推送可以同时进行
+        done = []
+        failed = 0
+        for (entity_id, _, _, fingerprint), future in futures:
+            try:
+                future.result()
+                done.append((entity_id, fingerprint))
+            except Exception as e:
+                logging.error(f"Failed to update {entity_id} in Home Assistant: {e}")
+                failed += 1
+        sent = len(done)
+        if done:
+            now = time.time()
+            with self._cache_lock:
+                for entity_id, fingerprint in done:
+                    self._cache[entity_id] = [fingerprint, now]
+                self._save_cache()
+        logging.debug(f"Home Assistant states: {sent} sent, {skipped} unchanged, {failed} failed.")
+        return {"sent": sent, "skipped": skipped, "failed": failed}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+def get_publisher():
+    '''the process-wide HaPublisher, so concurrent fetchers share its connections and cache'''
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = HaPublisher()
+        return _publisher
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from const import *
+
+SUCCESS_CODES = ("1", "0000", "200")
+
+READ_STORAGE_JS = "return [window.sessionStorage.getItem(arguments[0]), window.localStorage.getItem(arguments[0])];"
+
+
+class SessionExpiredError(Exception):
+    '''the cookies handed over from the browser are no longer accepted'''
+
+
+class HttpBackend:
+    '''Fetch user ids and balances from the JSON endpoints the 95598 SPA calls,
+    reusing the cookies of a logged-in browser instead of scraping the DOM.'''
+
+    def __init__(self, cookies: list, headers: dict = None):
+        self.API_BASE_URL = os.getenv("API_BASE_URL", API_BASE_URL).rstrip("/")
+        self.USER_LIST_API = os.getenv("USER_LIST_API", USER_LIST_API)
+        self.BALANCE_API = os.getenv("BALANCE_API", BALANCE_API)
+        self.HTTP_TIMEOUT = float(os.getenv("HTTP_BACKEND_TIMEOUT", 10))
+        self.HTTP_WORKERS = int(os.getenv("HTTP_BACKEND_WORKERS", 4))
+
+        self.session = requests.Session()
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.HTTP_WORKERS, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json;charset=UTF-8"})
+        if headers:
+            self.session.headers.update(headers)
+        for cookie in cookies:
+            self.session.cookies.set(cookie["name"], cookie["value"],
+                                     domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+
+    @classmethod
+    def from_driver(cls, driver):
+        """从已登录的浏览器复制 cookie、User-Agent 以及 HTTP_BACKEND_HEADERS 指定的请求头
+        HTTP_BACKEND_HEADERS 格式：请求头=storage键名，多个用","分隔，值从 sessionStorage/localStorage 读取"""
+        cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        headers = {"User-Agent": driver.execute_script("return navigator.userAgent;")}
+        for item in os.getenv("HTTP_BACKEND_HEADERS", "").split(","):
+            if "=" not in item:
+                continue
+            header, key = item.split("=", 1)
+            session_value, local_value = driver.execute_script(READ_STORAGE_JS, key)
+            if session_value or local_value:
+                headers[header] = session_value or local_value
+        return cls(cookies, headers)
+
+    def _post(self, path: str, payload: dict):
+        response = self.session.post(self.API_BASE_URL + path, data=json.dumps(payload), timeout=self.HTTP_TIMEOUT)
+        if response.status_code in (401, 403):
+            raise SessionExpiredError(f"{path} returned HTTP {response.status_code}")
+        response.raise_for_status()
+        body = response.json()
+        if str(body.get("code")) not in SUCCESS_CODES:
+            if str(body.get("code")) in ("401", "10002"):
+                raise SessionExpiredError(f"{path} returned code {body.get('code')}: {body.get('message')}")
+            raise ValueError(f"{path} returned code {body.get('code')}: {body.get('message')}")
+        return body.get("data") or {}
+
+    def get_user_ids(self):
+        data = self._post(self.USER_LIST_API, {})
+        return [str(user["consNo"]) for user in data.get("powerUserList", [])]
+
+    def get_balance(self, user_id: str):
+        '''balance in CNY, negative when the account is in arrears, None if missing'''
+        data = self._post(self.BALANCE_API, {"consNo": user_id})
+        for item in data.get("list", []):
+            if str(item.get("consNo")) != user_id:
+                continue
+            owe = float(item.get("historyOwe") or 0)
+            if owe > 0:
+                return -owe
+            return float(item["sumMoney"])
+        return None
+
+    def get_balances(self, user_ids: list):
+        '''fetch balances concurrently over the pooled session, {user_id: balance or None}'''
+        def one(user_id):
+            try:
+                return self.get_balance(user_id)
+            except SessionExpiredError:
+                raise
+            except Exception as e:
+                logging.warning(f"Failed to get balance over HTTP for user {user_id[-4:]}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.HTTP_WORKERS) as executor:
+            return dict(zip(user_ids, executor.map(one, user_ids)))
+
+    def close(self):
+        self.session.close()
@@ -6,7 +6,9 @@ import time
 import json
 from datetime import datetime, timedelta
 from const import *
-from data_fetcher import DataFetcher
+from accounts import load_accounts
+from driver_pool import fetch_accounts
+import profiling
 
 # 全局配置变量
 CONFIG = {}
@@ -35,7 +37,8 @@ def load_config():
             "DATA_RETENTION_DAYS": os.getenv("DATA_RETENTION_DAYS", "7"),
             "RECHARGE_NOTIFY": os.getenv("RECHARGE_NOTIFY", "false").lower(),
             "BALANCE": os.getenv("BALANCE", "5.0"),
-            "PUSHPLUS_TOKEN": os.getenv("PUSHPLUS_TOKEN", "")
+            "PUSHPLUS_TOKEN": os.getenv("PUSHPLUS_TOKEN", ""),
+            "ACCOUNTS": os.getenv("ACCOUNTS", "")
         }
         RETRY_TIMES_LIMIT = int(os.getenv("RETRY_TIMES_LIMIT", 5))
         logging.info("配置加载成功")
@@ -66,27 +69,30 @@ def should_run_now():
     time_diff = abs((now - scheduled_time).total_seconds())
     return time_diff < 300  # 5分钟窗口期
 
+@profiling.profiled("run")
 def run_task():
-    """执行数据获取任务"""
-    driver = None
-    try:
-        fetcher = DataFetcher(CONFIG["PHONE_NUMBER"], CONFIG["PASSWORD"])
-        driver = fetcher._get_webdriver()
-        fetcher.driver = driver
-        
-        for retry_times in range(1, RETRY_TIMES_LIMIT + 1):
-            try:
-                fetcher.fetch()
-                return True
-            except Exception as e:
-                logging.error(f"任务执行失败: {e}, 剩余重试次数: {RETRY_TIMES_LIMIT - retry_times}")
-                time.sleep(60)  # 重试前等待1分钟
-    except Exception as e:
-        logging.error(f"任务初始化失败: {e}")
+    """执行数据获取任务，多个账号时并发执行"""
+    accounts = load_accounts(CONFIG)
+    if not accounts:
+        logging.error("未配置国网账号 PHONE_NUMBER/PASSWORD 或 ACCOUNTS")
         return False
-    finally:
-        if driver:
-            driver.quit()
+    # Selenium、undetected_chromedriver 等依赖较重，执行开始时才导入，调度器等待期间不加载
+    from data_fetcher import DataFetcher
+
+    pending = accounts
+    for retry_times in range(1, RETRY_TIMES_LIMIT + 1):
+        try:
+            results = fetch_accounts(
+                pending, lambda account: DataFetcher(account["PHONE_NUMBER"], account["PASSWORD"]))
+        except Exception as e:
+            logging.error(f"任务初始化失败: {e}")
+            return False
+        pending = [account for account, result in zip(pending, results) if not result["success"]]
+        if not pending:
+            return True
+        logging.error(f"{len(pending)} 个账号执行失败, 剩余重试次数: {RETRY_TIMES_LIMIT - retry_times}")
+        if retry_times < RETRY_TIMES_LIMIT:
+            time.sleep(60)  # 重试前等待1分钟
     return False
 
 def logger_init(level: str):
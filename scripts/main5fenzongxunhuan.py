@@ -4,14 +4,20 @@ import os
 import sys
 import time
 import json
-import random
-from datetime import datetime, timedelta
 from const import *
-from data_fetcher import DataFetcher
+from accounts import load_accounts, mask_account
+from driver_pool import DriverPool, default_pool_size, fetch_accounts
+from scheduler import Scheduler
+from tracing import traced
+import tracing
+import metrics
+import profiling
 
 # 全局配置变量
 CONFIG = {}
 RETRY_TIMES_LIMIT = 5
+# BROWSER_KEEP_WARM 时在两次执行之间保留的浏览器
+BROWSER_POOL = None
 
 def load_config():
     """加载配置文件"""
@@ -43,7 +49,8 @@ def load_config():
                 "DATA_RETENTION_DAYS": str(options.get("DATA_RETENTION_DAYS", 7)),
                 "RECHARGE_NOTIFY": str(options.get("RECHARGE_NOTIFY", "false")).lower(),
                 "BALANCE": str(options.get("BALANCE", 5.0)),
-                "PUSHPLUS_TOKEN": options.get("PUSHPLUS_TOKEN", "")
+                "PUSHPLUS_TOKEN": options.get("PUSHPLUS_TOKEN", ""),
+                "ACCOUNTS": json.dumps(options.get("ACCOUNTS", []))
             }
             RETRY_TIMES_LIMIT = int(options.get("RETRY_TIMES_LIMIT", 5))
             logging.info("当前以Homeassistant Add-on 形式运行.")
@@ -69,7 +76,8 @@ def load_config():
                 "DATA_RETENTION_DAYS": os.getenv("DATA_RETENTION_DAYS", "7"),
                 "RECHARGE_NOTIFY": os.getenv("RECHARGE_NOTIFY", "false").lower(),
                 "BALANCE": os.getenv("BALANCE", "5.0"),
-                "PUSHPLUS_TOKEN": os.getenv("PUSHPLUS_TOKEN", "")
+                "PUSHPLUS_TOKEN": os.getenv("PUSHPLUS_TOKEN", ""),
+                "ACCOUNTS": os.getenv("ACCOUNTS", "")
             }
             RETRY_TIMES_LIMIT = int(os.getenv("RETRY_TIMES_LIMIT", 5))
             logging.info("当前以 Docker 镜像形式运行.")
@@ -79,63 +87,59 @@ def load_config():
     
     # 设置环境变量
     for key, value in CONFIG.items():
-        if key not in ["PHONE_NUMBER", "PASSWORD", "JOB_START_TIME", "LOG_LEVEL", "VERSION"]:
+        if key not in ["PHONE_NUMBER", "PASSWORD", "ACCOUNTS", "JOB_START_TIME", "LOG_LEVEL", "VERSION"]:
             os.environ[key] = value
     
     os.environ["RETRY_TIMES_LIMIT"] = str(RETRY_TIMES_LIMIT)
     
     return True
 
-def should_run_now():
-    """检查当前是否应该运行任务"""
-    if not CONFIG:
-        return False
-    
-    # 获取当前时间
-    now = datetime.now()
-    
-    # 解析配置中的执行时间
-    try:
-        job_time = datetime.strptime(CONFIG["JOB_START_TIME"], "%H:%M").time()
-    except ValueError:
-        logging.error("JOB_START_TIME 格式错误，应为 HH:MM")
+def warm_pool(accounts):
+    """BROWSER_KEEP_WARM 为 true 时返回跨执行保留的浏览器池，否则返回 None（每次执行结束后关闭浏览器）"""
+    global BROWSER_POOL
+    if os.getenv("BROWSER_KEEP_WARM", "false").lower() != "true":
+        return None
+    if BROWSER_POOL is None:
+        from data_fetcher import DataFetcher
+        factory = DataFetcher(accounts[0]["PHONE_NUMBER"], accounts[0]["PASSWORD"])._get_webdriver
+        BROWSER_POOL = DriverPool(factory, default_pool_size(len(accounts)))
+    return BROWSER_POOL
+
+@traced("run")
+@profiling.profiled("run")
+def run_task(accounts=None):
+    """执行数据获取任务，多个账号时并发执行"""
+    accounts = accounts or load_accounts(CONFIG)
+    if not accounts:
+        logging.error("未配置国网账号 PHONE_NUMBER/PASSWORD 或 ACCOUNTS")
         return False
-    
-    # 添加随机延迟（-10分钟到+10分钟）
-    random_delay_minutes = random.randint(-10, 10)
-    scheduled_time = (datetime.combine(now.date(), job_time) + 
-                     timedelta(minutes=random_delay_minutes))
-    
-    # 如果计划时间已经过去，则推迟到第二天
-    if scheduled_time < now:
-        scheduled_time += timedelta(days=1)
-    
-    # 检查当前时间是否在计划时间的5分钟内
-    time_diff = abs((now - scheduled_time).total_seconds())
-    return time_diff < 300  # 5分钟窗口期
+    # Selenium、undetected_chromedriver 等依赖较重，执行开始时才导入，调度器等待期间不加载
+    from data_fetcher import DataFetcher
 
-def run_task():
-    """执行数据获取任务"""
-    driver = None
+    pending = accounts
+    for retry_times in range(1, RETRY_TIMES_LIMIT + 1):
+        try:
+            results = fetch_accounts(
+                pending, lambda account: DataFetcher(account["PHONE_NUMBER"], account["PASSWORD"]),
+                pool=warm_pool(accounts))
+        except Exception as e:
+            logging.error(f"任务初始化失败: {e}")
+            return False
+        metrics.record_results(results)
+        pending = [account for account, result in zip(pending, results) if not result["success"]]
+        if not pending:
+            return True
+        logging.error(f"{len(pending)} 个账号执行失败, 剩余重试次数: {RETRY_TIMES_LIMIT - retry_times}")
+        if retry_times < RETRY_TIMES_LIMIT:
+            time.sleep(60)  # 重试前等待1分钟
+    return False
+
+def run_scheduled(accounts):
+    """调度器调用的入口：执行一次任务，结束后写出本次执行的 Chrome trace"""
     try:
-        fetcher = DataFetcher(CONFIG["PHONE_NUMBER"], CONFIG["PASSWORD"])
-        driver = fetcher._get_webdriver()
-        fetcher.driver = driver
-        
-        for retry_times in range(1, RETRY_TIMES_LIMIT + 1):
-            try:
-                fetcher.fetch()
-                return True
-            except Exception as e:
-                logging.error(f"任务执行失败: {e}, 剩余重试次数: {RETRY_TIMES_LIMIT - retry_times}")
-                time.sleep(60)  # 重试前等待1分钟
-    except Exception as e:
-        logging.error(f"任务初始化失败: {e}")
-        return False
+        return run_task(accounts)
     finally:
-        if driver:
-            driver.quit()
-    return False
+        tracing.flush()
 
 def logger_init(level: str):
     """初始化日志配置"""
@@ -147,50 +151,51 @@ def logger_init(level: str):
     sh.setFormatter(format)
     logger.addHandler(sh)
 
+def schedule_jobs(scheduler):
+    """按执行时间给账号分组，每组一个定时任务；账号可在 ACCOUNTS 中用 JOB_START_TIME 单独设置执行时间"""
+    groups = {}
+    for account in load_accounts(CONFIG):
+        spec = account.get("JOB_START_TIME") or CONFIG["JOB_START_TIME"]
+        groups.setdefault(spec, []).append(account)
+    for spec, accounts in groups.items():
+        names = ", ".join(mask_account(account["PHONE_NUMBER"]) for account in accounts)
+        logging.info(f"执行时间 {spec}: {names}")
+        scheduler.add(f"fetch@{spec}", spec, lambda accounts=accounts: run_scheduled(accounts))
+    return len(groups)
+
 def main():
     """主函数"""
     # 初始化日志（使用默认级别，稍后可能会被配置覆盖）
     logger_init("INFO")
-    
-    logging.info("程序启动，等待执行时间...")
-    
-    while True:
-        try:
-            # 检查是否到达执行时间
-            if should_run_now():
-                logging.info("检测到执行时间，开始加载配置...")
-                
-                # 加载配置
-                if not load_config():
-                    logging.error("配置加载失败，等待下一次执行时间")
-                    time.sleep(300)  # 等待5分钟后重试
-                    continue
-                
-                # 重新配置日志级别
-                logger_init(CONFIG.get("LOG_LEVEL", "INFO"))
-                
-                # 记录版本信息
-                version = CONFIG.get("VERSION", "未知")
-                logging.info(f"当前版本: {version}, 仓库地址: https://github.com/ARC-MX/sgcc_electricity_new.git")
-                logging.info(f"当前时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                logging.info(f"用户名: {CONFIG['PHONE_NUMBER']}, 执行时间: {CONFIG['JOB_START_TIME']}")
-                
-                # 执行任务
-                run_task()
-                
-                logging.info("任务执行完成，等待下一次执行时间")
-                
-                # 任务完成后等待23小时，避免频繁检查
-                time.sleep(23 * 3600)
-            else:
-                # 未到执行时间，等待5分钟后再检查
-                time.sleep(300)
-        except KeyboardInterrupt:
-            logging.info("程序被用户中断")
-            break
-        except Exception as e:
-            logging.error(f"程序执行异常: {e}")
-            time.sleep(300)  # 发生异常后等待5分钟再继续
+
+    if not load_config():
+        logging.error("程序启动失败，无法加载配置")
+        return 1
+    logging.getLogger().setLevel(CONFIG.get("LOG_LEVEL", "INFO"))
+
+    # 记录版本信息
+    version = CONFIG.get("VERSION", "未知")
+    logging.info(f"当前版本: {version}, 仓库地址: https://github.com/ARC-MX/sgcc_electricity_new.git")
+
+    metrics.start()
+    profiling.install_signal_handler()
+    scheduler = Scheduler()
+    try:
+        if not schedule_jobs(scheduler):
+            logging.error("未配置国网账号 PHONE_NUMBER/PASSWORD 或 ACCOUNTS")
+            return 1
+    except ValueError as e:
+        logging.error(f"JOB_START_TIME 格式错误，应为 HH:MM、HH:MM,HH:MM 或 cron:分 时 日 月 周: {e}")
+        return 1
+
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        logging.info("程序被用户中断")
+    finally:
+        if BROWSER_POOL is not None:
+            BROWSER_POOL.close()
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
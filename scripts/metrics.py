@@ -0,0 +1,255 @@
+"""Prometheus 指标：供长期运行的守护进程暴露耗时、验证码成功率、浏览器内存和各户号的抓取结果
+
+METRICS_PORT 大于 0 时在该端口提供 http://<host>:<port>/metrics；
+METRICS_TEXTFILE 设置时每次执行结束后写入该文件，供 node_exporter 的 textfile collector 采集。
+两者都未设置时所有记录函数直接返回。各阶段耗时来自 tracing 的 span，不需要打开 TRACE_ENABLED。
+这两个变量在使用时读取，load_config() 之后才从 .env 载入的值同样生效。"""
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tracing
+from accounts import mask_account
+
+
+def _port():
+    return int(os.getenv("METRICS_PORT", 0))
+
+
+def _textfile():
+    path = os.getenv("METRICS_TEXTFILE", "")
+    if path and 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(path):
+        path = "/data/" + path
+    return path
+
+
+def enabled():
+    '''True when METRICS_PORT or METRICS_TEXTFILE is set'''
+    return bool(_port() or _textfile())
+
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+INFERENCE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+ATTEMPT_BUCKETS = (1, 2, 3, 5, 8, 13)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = registry.lock
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values.items()):
+            lines.extend(self._render_one(key, value))
+        return lines
+
+    def _render_one(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value:g}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各桶单独计数，输出时再累加成 Prometheus 的累计桶
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = 0
+            while index < len(self.buckets) and value > self.buckets[index]:
+                index += 1
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_one(self, key, state):
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {total:g}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        '''all metrics in the Prometheus text exposition format'''
+        with self.lock:
+            lines = [line for metric in self._metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+PHASE_DURATION = Histogram(REGISTRY, "sgcc_phase_duration_seconds",
+                           "Duration of each traced phase (run, fetch, login, page_load, ...).", ["phase"])
+CAPTCHA_ATTEMPTS = Counter(REGISTRY, "sgcc_captcha_attempts_total", "Slider CAPTCHA attempts by result.",
+                           ["result"])
+CAPTCHA_ATTEMPTS_PER_LOGIN = Histogram(REGISTRY, "sgcc_captcha_attempts_per_login",
+                                       "CAPTCHA attempts needed by one password login.", buckets=ATTEMPT_BUCKETS)
+LOGINS = Counter(REGISTRY, "sgcc_logins_total", "Password logins by result.", ["result"])
+INFERENCE_DURATION = Histogram(REGISTRY, "sgcc_captcha_inference_seconds",
+                               "CAPTCHA distance inference latency.", ["backend"], INFERENCE_BUCKETS)
+BROWSER_RSS = Gauge(REGISTRY, "sgcc_browser_rss_bytes",
+                    "Resident memory of a pooled browser process tree after its last use.", ["slot"])
+USER_FETCHES = Counter(REGISTRY, "sgcc_user_fetch_total", "Balance fetches per user by result.", ["user", "result"])
+ACCOUNT_FETCHES = Counter(REGISTRY, "sgcc_account_fetch_total", "Account runs (login and user list) by result.",
+                          ["account", "result"])
+LAST_SUCCESS = Gauge(REGISTRY, "sgcc_last_success_timestamp_seconds",
+                     "Unix time of the last successful balance fetch per user.", ["user"])
+BALANCE = Gauge(REGISTRY, "sgcc_balance_yuan", "Latest electricity balance per user.", ["user"])
+LAST_RUN = Gauge(REGISTRY, "sgcc_last_run_timestamp_seconds", "Unix time the last run finished.")
+
+_login_state = threading.local()
+_server = None
+
+
+def _on_span(record):
+    '''tracing listener: phase durations, CAPTCHA attempts and inference latency'''
+    name, seconds = record["name"], record["dur_ms"] / 1000
+    PHASE_DURATION.observe(seconds, phase=name)
+    if name == "captcha_attempt":
+        success = bool(record["attrs"].get("success"))
+        CAPTCHA_ATTEMPTS.inc(result="success" if success else "failure")
+        # span 在所在线程结束，按线程累计本次登录的尝试次数
+        _login_state.attempts = getattr(_login_state, "attempts", 0) + 1
+        _login_state.success = success
+    elif name == "captcha_inference":
+        INFERENCE_DURATION.observe(seconds, backend=record["attrs"].get("backend", "unknown"))
+    elif name == "login":
+        attempts = getattr(_login_state, "attempts", 0)
+        if attempts:
+            CAPTCHA_ATTEMPTS_PER_LOGIN.observe(attempts)
+        ok = record["error"] is None and (attempts == 0 or getattr(_login_state, "success", False))
+        LOGINS.inc(result="success" if ok else "failure")
+        _login_state.attempts = 0
+        _login_state.success = False
+
+
+def observe_browser(slot, rss_mb):
+    if rss_mb is not None and enabled():
+        BROWSER_RSS.set(rss_mb * 1024 * 1024, slot=slot)
+
+
+def record_results(results):
+    '''per-user counters, last-success times and balances from fetch_accounts() results'''
+    if not enabled():
+        return
+    now = time.time()
+    for result in results:
+        ACCOUNT_FETCHES.inc(account=mask_account(result["account"]),
+                            result="success" if result["success"] else "failure")
+        for user_id, balance in result["balances"].items():
+            # 与传感器名称一致只使用户号后 4 位，/metrics 没有鉴权，不暴露完整户号
+            user = user_id[-4:]
+            if balance is None:
+                USER_FETCHES.inc(user=user, result="failure")
+                continue
+            USER_FETCHES.inc(user=user, result="success")
+            LAST_SUCCESS.set(now, user=user)
+            BALANCE.set(balance, user=user)
+    LAST_RUN.set(now)
+    write_textfile()
+
+
+def write_textfile():
+    '''replace METRICS_TEXTFILE atomically so the collector never reads half a file'''
+    path = _textfile()
+    if not path:
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(REGISTRY.render())
+        os.replace(tmp, path)
+    except OSError as e:
+        logging.warning(f"Failed to write metrics to {path}: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug("metrics: " + format % args)
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        data = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start():
+    '''hook the span listener and start the HTTP endpoint, a no-op unless METRICS_PORT or METRICS_TEXTFILE is set'''
+    global _server
+    if not enabled():
+        return
+    tracing.add_listener(_on_span)
+    port, textfile = _port(), _textfile()
+    if port and _server is None:
+        _server = ThreadingHTTPServer((os.getenv("METRICS_ADDR", "127.0.0.1"), port), _MetricsHandler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+        logging.info(f"Prometheus metrics on http://{_server.server_address[0]}:{port}/metrics")
+    if textfile:
+        logging.info(f"Prometheus metrics written to {textfile} after each run.")
@@ -0,0 +1,244 @@
+"""本地模拟的 95598 站点：多个账号、每个账号多个户号，页面结构与 DataFetcher 使用的一致（见 mock_pages.py）
+
+启动：python mock_95598.py --port 8598 --accounts 20 --users 3 --latency lognormal:300,0.5
+自检：python mock_95598.py --self-test
+把 SGCC_BASE_URL 指向 http://127.0.0.1:8598 即可让 DataFetcher 和 HttpBackend 请求本服务，
+账号为 --accounts 个手机号 13900000000 起，密码均为 --password。
+负载模拟：
+  --latency / --api-latency  每个页面/接口请求的延迟分布：fixed:毫秒、uniform:最小,最大、exp:平均、lognormal:中位数,sigma
+  --error-rate               按比例返回 503
+  --rate-limit               全站每秒请求数上限（令牌桶），超出返回 429
+  --capacity                 同时处理的请求数上限，超出时排队，模拟站点的处理能力
+  --captcha-fail-rate        滑块验证按比例失败，模拟验证码识别不准"""
+import argparse
+import logging
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from const import *
+from mock_pages import LOGIN_PATH, MockSite, png_image, start_site_server
+
+CAPTCHA_SIZE = (320, 160)
+CAPTCHA_VARIANTS = 8
+
+
+def make_users(count: int, seed: int = 0):
+    '''{consNo: {"balance": float, "owe": float}} with a few accounts in arrears'''
+    rng = random.Random(seed)
+    users = {}
+    for index in range(count):
+        user_id = f"{1000000000 + rng.randrange(10 ** 9)}"
+        owe = round(rng.uniform(1, 50), 2) if rng.random() < 0.1 else 0.0
+        users[user_id] = {"balance": 0.0 if owe else round(rng.uniform(0, 300), 2), "owe": owe}
+    return users
+
+
+def make_accounts(count: int, users_per_account: int, seed: int = 0):
+    '''{phone number: {consNo: ...}}, phone numbers start at 13900000000'''
+    return {f"139{index:08d}": make_users(users_per_account, seed * 100003 + index) for index in range(count)}
+
+
+class Latency:
+    '''a delay distribution parsed from fixed:ms, uniform:min,max, exp:mean or lognormal:median,sigma'''
+    PARAMS = {"fixed": 1, "uniform": 2, "exp": 1, "lognormal": 2}
+
+    def __init__(self, spec: str = "fixed:0"):
+        kind, _, params = spec.partition(":")
+        try:
+            values = [float(value) for value in params.split(",") if value]
+        except ValueError:
+            values = []
+        if self.PARAMS.get(kind) != len(values):
+            raise ValueError(f"bad latency spec {spec!r}")
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random):
+        '''one delay in seconds'''
+        if self.kind == "fixed":
+            delay = self.values[0]
+        elif self.kind == "uniform":
+            delay = rng.uniform(*self.values)
+        elif self.kind == "exp":
+            delay = rng.expovariate(1 / self.values[0]) if self.values[0] > 0 else 0
+        else:
+            median, sigma = self.values
+            delay = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0
+        return max(delay, 0) / 1000
+
+
+class SyntheticSite(MockSite):
+    def __init__(self, accounts: dict, password: str = "mock-password", latency: str = "fixed:0",
+                 api_latency: str = None, error_rate: float = 0, rate_limit: float = 0, capacity: int = 0,
+                 captcha_fail_rate: float = 0, seed: int = 0):
+        self.accounts = accounts
+        self.password = password
+        self.page_latency = Latency(latency)
+        self.api_latency = Latency(api_latency or latency)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.captcha_fail_rate = captcha_fail_rate
+        self._capacity = threading.Semaphore(capacity) if capacity else None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = rate_limit
+        self._refilled = time.monotonic()
+        self.throttled = 0
+        self.errors = 0
+        self._captchas = [self._captcha_image(self._rng) for _ in range(CAPTCHA_VARIANTS)]
+
+    @staticmethod
+    def _captcha_image(rng):
+        '''textured background with a darker square gap, like the real slider'''
+        width, height = CAPTCHA_SIZE
+        gap_x, gap_y, size = rng.randrange(80, width - 60), rng.randrange(20, height - 60), 44
+        base = [(rng.randrange(90, 200), rng.randrange(90, 200), rng.randrange(90, 200)) for _ in range(16)]
+
+        def pixel(x, y):
+            r, g, b = base[(x // 40 + y // 40 * 8) % 16]
+            if gap_x <= x < gap_x + size and gap_y <= y < gap_y + size:
+                return r // 3, g // 3, b // 3
+            return r, g, b
+        return png_image(width, height, pixel)
+
+    def _take_token(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+            self._refilled = now
+            if self._tokens < 1:
+                self.throttled += 1
+                return False
+            self._tokens -= 1
+            return True
+
+    def gate(self, kind, account):
+        if self.rate_limit and not self._take_token():
+            return 429, {"code": "429", "message": "请求过于频繁"}
+        with self._lock:
+            failed = self.error_rate and self._rng.random() < self.error_rate
+            delay = (self.page_latency if kind == "page" else self.api_latency).sample(self._rng)
+            if failed:
+                self.errors += 1
+        if self._capacity is not None:
+            # 站点处理能力有限：排队等待，延迟随并发升高
+            with self._capacity:
+                time.sleep(delay)
+        elif delay:
+            time.sleep(delay)
+        if failed:
+            return 503, {"code": "503", "message": "Service Unavailable"}
+        return None
+
+    def login(self, username, password):
+        return username if username in self.accounts and password == self.password else None
+
+    def new_captcha(self, account):
+        with self._lock:
+            png = self._rng.choice(self._captchas)
+            fail = self.captcha_fail_rate and self._rng.random() < self.captcha_fail_rate
+        return png, lambda offset: not fail
+
+    def user_list(self, account):
+        power_users = [{"consNo": user_id, "consName": "模拟用户", "elecAddr": "模拟地址"}
+                       for user_id in self.accounts[account]]
+        return {"code": "1", "message": "ok", "data": {"powerUserList": power_users}}
+
+    def balance(self, account, user_id):
+        user = self.accounts[account].get(user_id)
+        if user is None:
+            return {"code": "1", "message": "ok", "data": {"list": []}}
+        item = {"consNo": user_id, "sumMoney": f"{user['balance']:.2f}", "historyOwe": f"{user['owe']:.2f}"}
+        return {"code": "1", "message": "ok", "data": {"list": [item]}}
+
+    def daily(self, account, user_id, days):
+        rng = random.Random(user_id)
+        today = datetime.now().date()
+        return [[(today - timedelta(days=offset)).strftime("%Y-%m-%d"), f"{rng.uniform(2, 15):.2f}"]
+                for offset in range(1, days + 1)]
+
+
+def start_server(accounts: dict, port: int = 0, host: str = "127.0.0.1", **options):
+    '''start the synthetic site in a daemon thread, server.site has the counters, server.url the base URL'''
+    return start_site_server(SyntheticSite(accounts, **options), port, host)
+
+
+def _login(session, base_url, phone, password):
+    '''log in the way the pages do: credentials, slider image, slider verify'''
+    ticket = session.post(base_url + "/mock/login", json={"username": phone, "password": password}).json()["ticket"]
+    captcha = session.post(base_url + "/mock/captcha", json={"ticket": ticket}).json()
+    return session.post(base_url + "/mock/verify", json={"id": captcha["id"], "offset": 100}).json()
+
+
+def self_test(user_count: int):
+    '''run HttpBackend against a fresh site, then check throttling and error injection'''
+    import os
+    import requests
+    from http_backend import HttpBackend, SessionExpiredError
+    from mock_pages import SESSION_COOKIE, check_templates
+
+    problems = check_templates()
+    assert not problems, f"templates do not match the fetcher: {problems}"
+    accounts = make_accounts(2, user_count, seed=1)
+    server = start_server(accounts)
+    os.environ["API_BASE_URL"] = server.url
+    try:
+        try:
+            HttpBackend([]).get_user_ids()
+            raise AssertionError("request without session was accepted")
+        except SessionExpiredError:
+            pass
+        session = requests.Session()
+        phone, users = next(iter(accounts.items()))
+        assert session.post(server.url + "/mock/login", json={"username": phone, "password": "x"}).json()["code"] == "0"
+        assert _login(session, server.url, phone, "mock-password")["code"] == "1"
+        backend = HttpBackend([{"name": SESSION_COOKIE, "value": session.cookies[SESSION_COOKIE]}])
+        user_ids = backend.get_user_ids()
+        assert user_ids == list(users), user_ids
+        balances = backend.get_balances(user_ids)
+        for user_id, user in users.items():
+            expected = -user["owe"] if user["owe"] else user["balance"]
+            assert abs(balances[user_id] - expected) < 1e-6, (user_id, balances[user_id], expected)
+        backend.close()
+    finally:
+        server.shutdown()
+
+    server = start_server(accounts, rate_limit=5, error_rate=0.5, latency="lognormal:20,0.5", seed=2)
+    try:
+        statuses = [requests.get(server.url + LOGIN_PATH).status_code for _ in range(20)]
+        assert statuses.count(429) >= 10 and 503 in statuses and 200 in statuses, statuses
+    finally:
+        server.shutdown()
+    print(f"self-test passed: {len(user_ids)} users, throttling and error injection work")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8598)
+    parser.add_argument("--accounts", type=int, default=1, help="number of accounts (phone numbers)")
+    parser.add_argument("--users", type=int, default=3, help="户号 per account")
+    parser.add_argument("--password", default="mock-password")
+    parser.add_argument("--latency", default="fixed:0", help="page latency distribution")
+    parser.add_argument("--api-latency", default=None, help="API latency distribution, defaults to --latency")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=0, help="requests per second, 0 for unlimited")
+    parser.add_argument("--capacity", type=int, default=0, help="requests served at once, 0 for unlimited")
+    parser.add_argument("--captcha-fail-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--self-test", action="store_true", help="check the site with HttpBackend and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.self_test:
+        self_test(args.users)
+    else:
+        server = start_server(make_accounts(args.accounts, args.users, args.seed), args.port, args.host,
+                              password=args.password, latency=args.latency, api_latency=args.api_latency,
+                              error_rate=args.error_rate, rate_limit=args.rate_limit, capacity=args.capacity,
+                              captcha_fail_rate=args.captcha_fail_rate, seed=args.seed)
+        logging.info(f"Mock 95598 listening on {server.url}, accounts: {', '.join(server.site.accounts)}")
+        threading.Event().wait()
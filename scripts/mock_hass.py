@@ -0,0 +1,140 @@
+"""本地模拟 Home Assistant 的 POST /api/states/<entity_id> 接口，用于离线测试 HaPublisher
+
+启动：python mock_hass.py --port 8123 --token test
+自检：python mock_hass.py --self-test --users 50
+把 HASS_URL 指向 http://127.0.0.1:8123/、HASS_TOKEN 设为 --token 的值即可让程序推送到本服务。
+--latency-ms 模拟慢速的 HA，--fail-rate 按比例返回 503 用于测试重试。"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from const import *
+
+
+class MockHassHandler(BaseHTTPRequestHandler):
+    server_version = "mockhass/1.0"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug("mockhass: " + format % args)
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            if self.client_address not in server.clients:
+                server.clients.add(self.client_address)
+        if self.headers.get("Authorization") != "Bearer " + server.token:
+            return self._send_json({"message": "Unauthorized"}, 401)
+        if not self.path.startswith(API_PATH):
+            return self._send_json({"message": "Not found"}, 404)
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_rate and server.rng.random() < server.fail_rate:
+            with server.lock:
+                server.failures += 1
+            return self._send_json({"message": "Service Unavailable"}, 503)
+        entity_id = self.path[len(API_PATH):]
+        payload = json.loads(body)
+        with server.lock:
+            created = entity_id not in server.states
+            server.states[entity_id] = payload
+        self._send_json({"entity_id": entity_id, **payload}, 201 if created else 200)
+
+
+def start_server(token: str = "test", port: int = 0, host: str = "127.0.0.1", latency: float = 0,
+                 fail_rate: float = 0):
+    '''start the mock in a daemon thread, returns the server (server.server_address has the real port)'''
+    server = ThreadingHTTPServer((host, port), MockHassHandler)
+    server.daemon_threads = True
+    server.token = token
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.rng = random.Random(0)
+    server.lock = threading.Lock()
+    server.states = {}
+    server.requests = 0
+    server.failures = 0
+    server.clients = set()
+    threading.Thread(target=server.serve_forever, daemon=True, name="mockhass").start()
+    return server
+
+
+def self_test(user_count: int, latency: float, fail_rate: float):
+    '''publish users x 4 sensors twice and check what reached the mock'''
+    import os
+    import tempfile
+    from ha_publisher import HaPublisher
+
+    server = start_server(latency=latency, fail_rate=fail_rate)
+    os.environ["HA_STATE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "ha_state_cache.json")
+    try:
+        publisher = HaPublisher(f"http://127.0.0.1:{server.server_address[1]}/", "test")
+        states = []
+        for index in range(user_count):
+            postfix = f"_{index:04d}"
+            attributes = {"unit_of_measurement": USAGE_UNIT, "present_date": "2026-10-17"}
+            states += [(BALANCE_SENSOR_NAME + postfix, round(100 - index * 0.5, 2), {"unit_of_measurement": BALANCE_UNIT}),
+                       (DAILY_USAGE_SENSOR_NAME + postfix, 5.2, attributes),
+                       (MONTH_USAGE_SENSOR_NAME + postfix, 88.0, attributes),
+                       (YEARLY_USAGE_SENSOR_NAME + postfix, 1520.4, attributes)]
+        start = time.perf_counter()
+        first = publisher.publish(states)
+        first_time = time.perf_counter() - start
+        assert first["sent"] == len(states) and not first["failed"], first
+        assert len(server.states) == len(states)
+        requests_after_first = server.requests
+
+        start = time.perf_counter()
+        second = publisher.publish(states)
+        second_time = time.perf_counter() - start
+        assert second["skipped"] == len(states) and server.requests == requests_after_first, second
+
+        changed = [(states[0][0], 1.0, states[0][2])] + states[1:]
+        third = publisher.publish(changed)
+        assert third["sent"] == 1 and server.states[states[0][0]]["state"] == 1.0, third
+        publisher.close()
+        print(f"self-test passed: {len(states)} states sent in {first_time * 1000:.0f}ms over "
+              f"{len(server.clients)} connection(s), {server.failures} injected failure(s) retried; "
+              f"unchanged re-publish took {second_time * 1000:.1f}ms with no requests")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--token", default="test")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--fail-rate", type=float, default=0)
+    parser.add_argument("--users", type=int, default=20, help="users published by --self-test")
+    parser.add_argument("--self-test", action="store_true", help="check HaPublisher against the mock and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.self_test:
+        self_test(args.users, args.latency_ms / 1000, args.fail_rate)
+    else:
+        server = start_server(args.token, args.port, args.host, args.latency_ms / 1000, args.fail_rate)
+        logging.info(f"Mock Home Assistant listening on http://{args.host}:{server.server_address[1]}")
+        try:
+            while True:
+                time.sleep(60)
+                logging.info(f"{server.requests} request(s), {len(server.states)} state(s)")
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,453 @@
+"""本地模拟 95598 网页（登录、余额、用电量三个页面）和滑块验证，供 replay_server.py 与 mock_95598.py 共用
+
+页面只实现 DataFetcher 用到的结构：登录框和滑块 canvas、户号下拉菜单、户号选择器、余额的 .num/.amttxt、
+日用电量表，XPath 与 data_fetcher.py 中的一致（见 FETCHER_XPATHS）。页面数据由 XHR 从同一服务的接口读取，
+数据来源是一个 MockSite 对象：
+  login(username, password)            账号标识，密码错误返回 None
+  new_captcha(account)                 (png 字节, accept(offset) -> bool)
+  user_list(account) / balance(...)    USER_LIST_API / BALANCE_API 的响应体
+  daily(account, user_id, days)        [[日期, 用电量]]，日期从新到旧
+  gate(kind, account)                  每个请求前调用，用于模拟延迟、错误和限流，返回 (状态码, 响应体) 时直接返回"""
+import itertools
+import json
+import logging
+import re
+import secrets
+import struct
+import threading
+import time
+import zlib
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from const import *
+
+SESSION_COOKIE = "mock_session"
+LOGIN_PATH = urlparse(LOGIN_URL).path
+BALANCE_PATH = urlparse(BALANCE_URL).path
+USAGE_PATH = urlparse(ELECTRIC_USAGE_URL).path
+DAILY_API = "/mock/api/daily"
+
+# data_fetcher.py 用到的定位方式，页面模板必须全部满足（self_test 中逐个检查）
+FETCHER_XPATHS = {
+    "login": [
+        "//*[@class='user']",
+        '//*[@id="login_box"]/div[1]/div[1]/div[2]/span',
+        '//*[@id="login_box"]/div[2]/div[1]/form/div[1]/div[3]/div/span[2]',
+        "//input[@class='el-input__inner']",
+        "//button[@class='el-button el-button--primary']",
+        '//*[@id="slideVerify"]/canvas',
+        "//*[@class='slide-verify-slider-mask-item']",
+    ],
+    "balance": [
+        "//div[@class='el-dropdown']/span",
+        "//ul[@class='el-dropdown-menu el-popper']",
+        "//*[@class='el-input__suffix']",
+        "/html/body/div[2]/div[1]/div[1]/ul/li/span",
+        '//*[@id="app"]/div/div/article/div/div/div[2]/div/div/div[1]/div[2]/div/div/div/div[2]/div/div[1]/div/ul/div/li[1]/span[2]',
+        "//*[@class='num']",
+        "//*[@class='amttxt']",
+    ],
+    "usage": [
+        "//*[@class='el-input__suffix']",
+        "/html/body/div[2]/div[1]/div[1]/ul/li/span",
+        "//div[@class='el-tabs__nav is-top']/div[@id='tab-second']",
+        "//*[@id='pane-second']/div[1]/div/label[2]/span[1]",
+        "//*[@id='pane-second']/div[2]/div[2]/div[1]/div[3]/table/tbody",
+    ],
+}
+
+_STYLE = """
+body { font-family: sans-serif; margin: 0; }
+.user, .el-dropdown span, .el-input__suffix, li, label, button, #tab-second, #tab-first { cursor: pointer; }
+.el-select { display: inline-block; border: 1px solid #ccc; padding: 4px; }
+.el-select-dropdown, .el-dropdown-menu { display: none; border: 1px solid #ccc; padding: 4px; }
+#slideVerify { position: relative; width: 310px; }
+#slideVerify canvas { display: block; }
+.slide-verify-block { display: none; }
+.slide-verify-slider { position: relative; width: 310px; height: 40px; background: #eee; margin-top: 8px; }
+.slide-verify-slider-mask-item { position: absolute; left: 0; top: 0; width: 40px; height: 40px; background: #1991fa; }
+"""
+
+_COMMON_JS = """
+function byId(id) { return document.getElementById(id); }
+function show(el) { el.style.display = "block"; }
+function hide(el) { el.style.display = "none"; }
+function post(url, body) {
+    return fetch(url, {method: "POST", credentials: "same-origin",
+                       headers: {"Content-Type": "application/json;charset=UTF-8"},
+                       body: JSON.stringify(body || {})})
+        .then(function (r) { if (!r.ok) { throw new Error("HTTP " + r.status); } return r.json(); });
+}
+"""
+
+_LOGIN_JS = """
+var agreed = false, ticket = null, captchaId = null, dragging = false, startX = 0;
+var canvas = byId("slideVerify").childNodes[0], item = document.querySelector(".slide-verify-slider-mask-item");
+function message(text) { byId("verify-msg").innerText = text; }
+function resetCaptcha() {
+    canvas.getContext("2d").clearRect(0, 0, canvas.width, canvas.height);
+    item.style.left = "0px";
+    hide(byId("verify"));
+}
+function loadCaptcha() {
+    post("/mock/captcha", {ticket: ticket}).then(function (r) {
+        captchaId = r.id;
+        var img = new Image();
+        img.onload = function () {
+            canvas.width = img.naturalWidth;
+            canvas.height = img.naturalHeight;
+            canvas.getContext("2d").drawImage(img, 0, 0);
+        };
+        img.src = r.image;
+        show(byId("verify"));
+    }).catch(function (e) { message("验证码加载失败 " + e); });
+}
+document.querySelector(".user").addEventListener("click", function () { show(byId("login_box")); });
+byId("agree").addEventListener("click", function () { agreed = !agreed; });
+byId("login").addEventListener("click", function () {
+    if (!agreed) { message("请先阅读并同意服务协议"); return; }
+    resetCaptcha();
+    post("/mock/login", {username: byId("username").value, password: byId("password").value}).then(function (r) {
+        if (r.code !== "1") { message(r.message); return; }
+        ticket = r.ticket;
+        loadCaptcha();
+    }).catch(function (e) { message("登录失败 " + e); });
+});
+item.addEventListener("mousedown", function (e) { dragging = true; startX = e.clientX; e.preventDefault(); });
+document.addEventListener("mousemove", function (e) {
+    if (dragging) { item.style.left = Math.max(0, e.clientX - startX) + "px"; }
+});
+document.addEventListener("mouseup", function (e) {
+    if (!dragging) { return; }
+    dragging = false;
+    post("/mock/verify", {id: captchaId, offset: Math.round(e.clientX - startX)}).then(function (r) {
+        if (r.code === "1") { location.href = r.redirect; return; }
+        message("验证失败，请重新登录");
+        resetCaptcha();
+    }).catch(function (e) { message("验证失败 " + e); resetCaptcha(); });
+});
+"""
+
+# 户号列表、户号选择器和当前户号，余额页和用电量页共用；seq 丢弃切换户号前发出的过期响应
+_ACCOUNT_JS = """
+var users = [], current = null, seq = 0;
+function selectUser(index) {
+    current = users[index];
+    seq += 1;
+    byId("current-user").innerText = current.consNo;
+    document.querySelector(".el-select input").value = current.consNo;
+    onUserChange(current, seq);
+}
+post(MOCK.userListApi, {}).then(function (r) {
+    if (r.code !== "1") { location.href = MOCK.loginPath; return; }
+    users = r.data.powerUserList;
+    var menu = document.querySelector(".el-dropdown-menu"), options = byId("user-options");
+    users.forEach(function (user, index) {
+        var li = document.createElement("li");
+        li.innerText = user.consName + " 户号:" + user.consNo;
+        menu.appendChild(li);
+        var div = document.createElement("div");
+        div.innerHTML = "<ul><li><span></span></li></ul>";
+        div.querySelector("span").innerText = user.consNo;
+        div.querySelector("li").addEventListener("click", function () {
+            hide(document.querySelector(".el-select-dropdown"));
+            selectUser(index);
+        });
+        options.appendChild(div);
+    });
+    if (users.length) { selectUser(0); }
+});
+document.querySelector(".el-dropdown span").addEventListener("click", function () {
+    show(document.querySelector(".el-dropdown-menu"));
+});
+document.querySelector(".el-input__suffix").addEventListener("click", function () {
+    show(document.querySelector(".el-select-dropdown"));
+});
+"""
+
+_BALANCE_JS = """
+function onUserChange(user, requestSeq) {
+    document.querySelector(".num").innerText = "";
+    post(MOCK.balanceApi, {consNo: user.consNo}).then(function (r) {
+        if (requestSeq !== seq || r.code !== "1" || !r.data.list.length) { return; }
+        var item = r.data.list[0], owe = parseFloat(item.historyOwe || "0");
+        document.querySelector(".amttxt").innerText = owe > 0 ? "欠费金额" : "账户余额";
+        document.querySelector(".num").innerText = owe > 0 ? item.historyOwe : item.sumMoney;
+    });
+}
+"""
+
+_USAGE_JS = """
+var days = 7;
+function loadDaily(requestSeq) {
+    var body = document.querySelector("#pane-second table tbody");
+    body.innerHTML = "";
+    post(MOCK.dailyApi, {consNo: current.consNo, days: days}).then(function (r) {
+        if (requestSeq !== seq || r.code !== "1") { return; }
+        r.data.forEach(function (row) {
+            var tr = document.createElement("tr");
+            tr.innerHTML = "<td></td><td></td>";
+            tr.childNodes[0].innerText = row[0];
+            tr.childNodes[1].innerText = row[1];
+            body.appendChild(tr);
+        });
+    });
+}
+function onUserChange(user, requestSeq) { loadDaily(requestSeq); }
+byId("tab-second").addEventListener("click", function () { hide(byId("pane-first")); show(byId("pane-second")); });
+byId("days-30").addEventListener("click", function () { days = 30; seq += 1; loadDaily(seq); });
+"""
+
+
+def _chain(steps, leaf, fill=None, after=None):
+    '''nested markup for an XPath-like list of steps such as ["div", "div[2]", "ul"]; "tag[n]" gets n-1
+    placeholder siblings before it, fill/after put extra markup in the first placeholder / after the element'''
+    fill, after = fill or {}, after or {}
+    html = leaf
+    for index in range(len(steps) - 1, -1, -1):
+        match = re.fullmatch(r"(\w+)(?:\[(\d+)\])?", steps[index])
+        tag, position = match.group(1), int(match.group(2) or 1)
+        before = "".join(f"<{tag}>{fill.get(index, '') if n == 0 else ''}</{tag}>" for n in range(position - 1))
+        html = f"{before}<{tag}>{html}</{tag}>{after.get(index, '')}"
+    return html
+
+
+# 当前户号：//*[@id="app"]/div/div/article/div/div/div[2]/div/div/div[1]/div[2]/div/div/div/div[2]/div/div[1]/div/ul/div/li[1]/span[2]
+_CURRENT_USER_STEPS = ["div", "div", "article", "div", "div", "div[2]", "div", "div", "div[1]", "div[2]", "div", "div",
+                       "div", "div[2]", "div", "div[1]", "div", "ul", "div", "li[1]"]
+_HEADER = ('<div class="el-dropdown"><span>切换户号</span></div>'
+           '<div class="el-select"><input class="el-input__inner" readonly="readonly"/>'
+           '<span class="el-input__suffix">▼</span></div>')
+_POPPERS = ('<div class="el-select-dropdown el-popper"><div class="el-scrollbar" id="user-options"></div></div>'
+            '<ul class="el-dropdown-menu el-popper"></ul>')
+_BALANCE_BOX = '<div class="balance"><p class="amttxt">账户余额</p><p><span class="num"></span> 元</p></div>'
+# 日用电量：//*[@id='pane-second']/div[1]/div/label[2]/span[1] 和 DAILY_USAGE_TABLE_XPATH
+_USAGE_TABS = (
+    '<div class="el-tabs"><div class="el-tabs__header"><div class="el-tabs__nav is-top">'
+    '<div id="tab-first">月用电量</div><div id="tab-second">日用电量</div></div></div>'
+    '<div class="el-tabs__content"><div id="pane-first"></div><div id="pane-second" style="display:none">'
+    '<div><div><label><span>近7天</span></label><label id="days-30"><span>近30天</span></label></div></div>'
+    + _chain(["div", "div[2]", "div[1]", "div[3]"], "<table><tbody></tbody></table>")
+    + '</div></div></div>'
+)
+
+_LOGIN_BODY = (
+    '<div id="app"><div class="header"><span class="user">登录</span></div>'
+    '<div id="login_box" style="display:none">'
+    '<div><div><div><span>扫码登录</span></div><div><span>账号登录</span></div><div><span>短信登录</span></div></div></div>'
+    '<div><div><form onsubmit="return false">'
+    '<div><div><input class="el-input__inner" id="username" type="text"/></div>'
+    '<div><input class="el-input__inner" id="password" type="password"/></div>'
+    '<div><div><span class="checkbox"></span><span id="agree">我已阅读并同意服务协议</span></div></div></div>'
+    '<div><button type="button" class="el-button el-button--primary" id="login"><span>登录</span></button></div>'
+    '</form></div></div>'
+    '<div id="verify" style="display:none"><div id="slideVerify"><canvas width="310" height="155"></canvas>'
+    '<canvas class="slide-verify-block" width="50" height="155"></canvas>'
+    '<div class="slide-verify-slider"><div class="slide-verify-slider-mask">'
+    '<div class="slide-verify-slider-mask-item"></div></div></div></div><p id="verify-msg"></p></div>'
+    '</div></div>'
+)
+
+
+def _account_body(extra):
+    leaf = '<span>户号：</span><span id="current-user"></span>'
+    return '<div id="app">' + _chain(_CURRENT_USER_STEPS, leaf, fill={5: _HEADER}, after={5: extra}) + '</div>' + _POPPERS
+
+
+def render_page(kind: str):
+    '''HTML of the "login", "balance" or "usage" page'''
+    config = {"userListApi": USER_LIST_API, "balanceApi": BALANCE_API, "dailyApi": DAILY_API, "loginPath": LOGIN_PATH}
+    if kind == "login":
+        body, scripts = _LOGIN_BODY, _COMMON_JS + _LOGIN_JS
+    elif kind == "balance":
+        body, scripts = _account_body(_BALANCE_BOX), _COMMON_JS + _ACCOUNT_JS + _BALANCE_JS
+    else:
+        body, scripts = _account_body(_USAGE_TABS), _COMMON_JS + _ACCOUNT_JS + _USAGE_JS
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"/><title>mock 95598 {kind}</title>'
+            f'<style>{_STYLE}</style></head><body>{body}'
+            f'<script>var MOCK = {json.dumps(config)};{scripts}</script></body></html>')
+
+
+def png_image(width: int, height: int, pixel):
+    '''a PNG of pixel(x, y) -> (r, g, b), for generated slider backgrounds without PIL'''
+    raw = b"".join(b"\x00" + b"".join(bytes(pixel(x, y)) for x in range(width)) for y in range(height))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+class MockSite:
+    '''defaults shared by the replayed and the synthetic site'''
+    latency = 0
+
+    def gate(self, kind, account):
+        if self.latency:
+            time.sleep(self.latency)
+        return None
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    server_version = "mock95598/1.0"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug("mock95598: " + format % args)
+
+    def _send(self, data: bytes, content_type: str, status: int = 200, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, body, status: int = 200, headers: dict = None):
+        self._send(json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json;charset=UTF-8",
+                   status, headers)
+
+    def _account(self):
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        if SESSION_COOKIE not in cookie:
+            return None
+        return self.server.sessions.get(cookie[SESSION_COOKIE].value)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _gate(self, kind, account=None):
+        with self.server.lock:
+            self.server.requests[kind] = self.server.requests.get(kind, 0) + 1
+        blocked = self.server.site.gate(kind, account)
+        if blocked is not None:
+            status, body = blocked
+            self._send_json(body, status)
+            return True
+        return False
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == LOGIN_PATH:
+            if not self._gate("page"):
+                self._send(self.server.pages["login"], "text/html;charset=utf-8")
+        elif path in (BALANCE_PATH, USAGE_PATH):
+            account = self._account()
+            if account is None:
+                # 会话失效时真实站点的前端路由跳回登录页
+                self._send(b"", "text/html", 302, {"Location": LOGIN_PATH})
+            elif not self._gate("page", account):
+                kind = "balance" if path == BALANCE_PATH else "usage"
+                self._send(self.server.pages[kind], "text/html;charset=utf-8")
+        elif path.startswith("/mock/captcha/"):
+            with self.server.lock:
+                captcha = self.server.captchas.get(path[len("/mock/captcha/"):].split(".")[0])
+            if captcha is None:
+                self._send_json({"code": "404", "message": "not found"}, 404)
+            else:
+                self._send(captcha[1], "image/png")
+        else:
+            self._send_json({"code": "404", "message": "not found"}, 404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        payload = self._read_json()
+        server, site = self.server, self.server.site
+        if path == "/mock/login":
+            if self._gate("login"):
+                return
+            account = site.login(payload.get("username", ""), payload.get("password", ""))
+            if account is None:
+                return self._send_json({"code": "0", "message": "账号或密码错误"})
+            ticket = secrets.token_hex(8)
+            with server.lock:
+                server.tickets[ticket] = account
+            self._send_json({"code": "1", "message": "ok", "ticket": ticket})
+        elif path == "/mock/captcha":
+            with server.lock:
+                account = server.tickets.get(payload.get("ticket"))
+            if account is None:
+                return self._send_json({"code": "0", "message": "请重新登录"})
+            if self._gate("captcha", account):
+                return
+            png, accept = site.new_captcha(account)
+            captcha_id = str(next(server.ids))
+            with server.lock:
+                server.captchas[captcha_id] = (account, png, accept)
+            self._send_json({"code": "1", "id": captcha_id, "image": f"/mock/captcha/{captcha_id}.png"})
+        elif path == "/mock/verify":
+            with server.lock:
+                # 每张验证码只能提交一次
+                captcha = server.captchas.pop(str(payload.get("id")), None)
+            if captcha is None:
+                return self._send_json({"code": "0", "message": "验证码已失效"})
+            if self._gate("verify", captcha[0]):
+                return
+            account, _, accept = captcha
+            offset = payload.get("offset")
+            ok = isinstance(offset, (int, float)) and accept(offset)
+            with server.lock:
+                server.verifications[ok] += 1
+            if not ok:
+                return self._send_json({"code": "0", "message": "验证失败"})
+            token = secrets.token_hex(16)
+            with server.lock:
+                server.sessions[token] = account
+            self._send_json({"code": "1", "redirect": BALANCE_PATH},
+                            headers={"Set-Cookie": f"{SESSION_COOKIE}={token}; Path=/"})
+        elif path in (USER_LIST_API, BALANCE_API, DAILY_API):
+            account = self._account()
+            if account is None:
+                return self._send_json({"code": "10002", "message": "登录已失效"})
+            if self._gate("api", account):
+                return
+            if path == USER_LIST_API:
+                self._send_json(site.user_list(account))
+            elif path == BALANCE_API:
+                self._send_json(site.balance(account, str(payload.get("consNo"))))
+            else:
+                rows = site.daily(account, str(payload.get("consNo")), int(payload.get("days", 7)))
+                self._send_json({"code": "1", "message": "ok", "data": rows})
+        else:
+            self._send_json({"code": "404", "message": "not found"}, 404)
+
+
+def start_site_server(site, port: int = 0, host: str = "127.0.0.1"):
+    '''serve site in a daemon thread, server.url is the SGCC_BASE_URL to point the fetcher at'''
+    server = ThreadingHTTPServer((host, port), SiteHandler)
+    server.daemon_threads = True
+    server.site = site
+    server.pages = {kind: render_page(kind).encode("utf-8") for kind in ("login", "balance", "usage")}
+    server.lock = threading.Lock()
+    server.ids = itertools.count(1)
+    server.sessions = {}
+    server.tickets = {}
+    server.captchas = {}
+    server.requests = {}
+    server.verifications = {True: 0, False: 0}
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True, name="mock95598-site").start()
+    return server
+
+
+def check_templates():
+    '''every FETCHER_XPATHS entry matches the rendered pages, scripts are dropped so the markup parses as XML'''
+    import xml.etree.ElementTree as ET
+
+    problems = []
+    for kind, xpaths in FETCHER_XPATHS.items():
+        html = re.sub(r"<(script|style)>.*?</\1>", "", render_page(kind), flags=re.S).replace("<!DOCTYPE html>", "")
+        # 户号选项由脚本在读取户号列表后生成，按脚本生成的结构补上一个
+        html = html.replace('id="user-options"></div>', 'id="user-options"><div><ul><li><span>1</span></li></ul></div></div>')
+        root = ET.fromstring(html)
+        for xpath in xpaths:
+            # ElementTree 只支持相对路径：//x 改为 .//x，/html/body 改为 ./body
+            relative = "." + xpath[len("/html"):] if xpath.startswith("/html/") else "." + xpath
+            if root.find(relative.replace('"', "'")) is None:
+                problems.append(f"{kind}: {xpath}")
+    return problems
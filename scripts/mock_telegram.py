@@ -0,0 +1,127 @@
+"""本地模拟的 Telegram Bot API 镜像，用于测试 TELEGRAM_API_DOMAINS 的对冲发送
+
+启动一个镜像：python mock_telegram.py --port 8443 --mode slow --delay-ms 800
+自检：python mock_telegram.py --self-test
+模式：ok 立即成功；slow 延迟 --delay-ms 后成功；fail 返回 502；blackhole 接收请求但不响应。
+TELEGRAM_API_DOMAINS 中可以写 http://127.0.0.1:8443 指向本服务。"""
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockTelegramHandler(BaseHTTPRequestHandler):
+    server_version = "mocktelegram/1.0"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug("mocktelegram: " + format % args)
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.mode == "blackhole":
+            server.closed.wait()
+            return
+        if server.mode == "slow":
+            time.sleep(server.delay)
+        if server.mode == "fail":
+            return self._send_json({"ok": False, "description": "Bad Gateway"}, 502)
+        if not self.path.endswith("/sendMessage"):
+            return self._send_json({"ok": False, "description": "Not Found"}, 404)
+        with server.lock:
+            server.messages.append(json.loads(body))
+        self._send_json({"ok": True, "result": {"message_id": len(server.messages)}})
+
+
+def start_server(mode: str = "ok", delay: float = 0, port: int = 0, host: str = "127.0.0.1"):
+    '''start one mirror in a daemon thread, returns the server; server.url is its TELEGRAM_API_DOMAINS entry'''
+    server = ThreadingHTTPServer((host, port), MockTelegramHandler)
+    server.daemon_threads = True
+    server.mode = mode
+    server.delay = delay
+    server.lock = threading.Lock()
+    server.closed = threading.Event()
+    server.requests = 0
+    server.messages = []
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True, name=f"mocktelegram-{mode}").start()
+    return server
+
+
+def self_test(rounds: int):
+    '''send through a blackholed, a failing, a slow and a fast mirror, first sequentially then hedged'''
+    import os
+    import tempfile
+    import requests
+    from notifier import Notifier, NotifyConfig
+
+    mirrors = [start_server("blackhole"), start_server("fail"), start_server("slow", 0.8), start_server("ok")]
+    workdir = tempfile.mkdtemp()
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123:test", "TELEGRAM_CHAT_ID": "1", "PUSHPLUS_TOKEN": "",
+        "TELEGRAM_API_DOMAINS": ",".join(server.url for server in mirrors), "NOTIFY_TIMEOUT": "2",
+        "NOTIFY_DB_PATH": os.path.join(workdir, "notify.db"),
+        "TELEGRAM_HEALTH_PATH": os.path.join(workdir, "telegram_health.json"),
+    })
+    try:
+        # 原来的方式：按顺序逐个尝试
+        start = time.perf_counter()
+        for server in mirrors:
+            try:
+                requests.post(f"{server.url}/bot123:test/sendMessage", json={"chat_id": "1", "text": "t"},
+                              timeout=2).raise_for_status()
+                break
+            except requests.exceptions.RequestException:
+                pass
+        sequential = time.perf_counter() - start
+        print(f"sequential: {sequential:.2f}s")
+
+        notifier = Notifier(NotifyConfig())
+        for index in range(rounds):
+            start = time.perf_counter()
+            notifier._send_telegram("1", "余额提醒", f"hedged #{index}")
+            hedged = time.perf_counter() - start
+            order = notifier.telegram_health.ranked(notifier.config.TELEGRAM_API_DOMAINS)
+            assert hedged < sequential / 2, f"hedged send #{index} took {hedged:.2f}s, sequential {sequential:.2f}s"
+            print(f"hedged #{index}: {hedged:.2f}s, "
+                  f"ranking now {[next(s.mode for s in mirrors if s.url == d) for d in order]}")
+            # 让被放弃的请求结束并计入健康评分
+            time.sleep(2.2)
+        assert mirrors[3].messages, "fast mirror never received a message"
+        print("self-test passed")
+    finally:
+        for server in mirrors:
+            server.closed.set()
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--mode", choices=("ok", "slow", "fail", "blackhole"), default="ok")
+    parser.add_argument("--delay-ms", type=float, default=800)
+    parser.add_argument("--rounds", type=int, default=3, help="hedged sends in --self-test")
+    parser.add_argument("--self-test", action="store_true", help="check hedged delivery against local mirrors")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.self_test:
+        self_test(args.rounds)
+    else:
+        server = start_server(args.mode, args.delay_ms / 1000, args.port, args.host)
+        logging.info(f"Mock Telegram mirror ({args.mode}) listening on {server.url}")
+        threading.Event().wait()
@@ -0,0 +1,348 @@
+"""余额提醒的发送：持久化队列 + 后台并发发送 + 按渠道限速 + 每次跌破阈值只提醒一次
+
+balance_alert() 只在数据库中登记一条待发送消息并立即返回，不会阻塞抓取流程；
+后台线程用连接池并发发送，失败的消息按指数退避重试，进程退出前未发送的消息下次启动后继续发送。"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PUSHPLUS_URL = "http://www.pushplus.plus/send"
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+class RateLimiter:
+    '''token bucket allowing rate_per_minute sends with bursts of the same size'''
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''take a token, returns 0 on success or the seconds to wait for the next one'''
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate if self.rate else 3600
+
+
+class DomainHealth:
+    '''EWMA latency and failure rate per Telegram API domain, persisted between runs,
+    used to try the fastest healthy domain first and to size the hedge delay'''
+
+    def __init__(self, path: str, timeout: float):
+        self.path = path
+        self.timeout = timeout
+        self.alpha = float(os.getenv("TELEGRAM_HEALTH_ALPHA", 0.3))
+        self.min_delay = float(os.getenv("TELEGRAM_HEDGE_MIN_DELAY", 0.3))
+        self.max_delay = float(os.getenv("TELEGRAM_HEDGE_MAX_DELAY", 3))
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.stats = json.load(f)
+        except (OSError, ValueError):
+            self.stats = {}
+
+    def score(self, domain):
+        '''expected seconds to a successful response: latency plus failures costed at the timeout'''
+        stat = self.stats.get(domain)
+        if stat is None:
+            # 没有记录的域名排在最前，先测一次
+            return 0.0
+        return stat["latency"] + stat["failure_rate"] * self.timeout
+
+    def ranked(self, domains):
+        with self._lock:
+            return sorted(domains, key=self.score)
+
+    def hedge_delay(self, domain):
+        '''how long to wait for domain before also trying the next one'''
+        with self._lock:
+            stat = self.stats.get(domain)
+        if stat is None:
+            # 没有记录的域名可能不通，冷启动时尽快尝试下一个
+            return self.min_delay
+        return min(self.max_delay, max(self.min_delay, stat["latency"] * 2))
+
+    def record(self, domain, latency, ok):
+        with self._lock:
+            stat = self.stats.setdefault(domain, {"latency": latency, "failure_rate": 0.0 if ok else 1.0})
+            if ok:
+                stat["latency"] += self.alpha * (latency - stat["latency"])
+            stat["failure_rate"] += self.alpha * ((0.0 if ok else 1.0) - stat["failure_rate"])
+            stat["updated"] = time.time()
+            try:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self.stats, f, indent=2)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logging.debug(f"Failed to save Telegram domain health: {e}")
+
+
+class NotifyConfig:
+    '''notification settings, parsed once'''
+
+    def __init__(self):
+        self.BALANCE = float(os.getenv("BALANCE", 10.0))
+        # 余额回升到 BALANCE + NOTIFY_RESET_MARGIN 以上才视为已充值，下次跌破时再提醒
+        self.NOTIFY_RESET_MARGIN = float(os.getenv("NOTIFY_RESET_MARGIN", 0))
+        self.PUSHPLUS_TOKENS = [t for t in os.getenv("PUSHPLUS_TOKEN", "").split(",") if t]
+        self.TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+        self.TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
+        self.TELEGRAM_API_DOMAINS = [d for d in os.getenv("TELEGRAM_API_DOMAINS", "").split(",") if d]
+        self.NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", 10))
+        self.NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", 4))
+        self.NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", 5))
+        self.NOTIFY_RATE_LIMIT_PER_MINUTE = float(os.getenv("NOTIFY_RATE_LIMIT_PER_MINUTE", 10))
+        # 进程退出时最多等待多少秒把队列中的消息发完，剩余的下次启动后发送
+        self.NOTIFY_FLUSH_TIMEOUT = float(os.getenv("NOTIFY_FLUSH_TIMEOUT", 30))
+        path = os.getenv("NOTIFY_DB_PATH", "notify.db")
+        if 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(path):
+            path = "/data/" + path
+        self.NOTIFY_DB_PATH = path
+        path = os.getenv("TELEGRAM_HEALTH_PATH", "telegram_health.json")
+        if 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(path):
+            path = "/data/" + path
+        self.TELEGRAM_HEALTH_PATH = path
+
+    def channels(self):
+        '''[(channel, target)] every message is delivered to'''
+        targets = [("pushplus", token) for token in self.PUSHPLUS_TOKENS]
+        if self.TELEGRAM_BOT_TOKEN and self.TELEGRAM_CHAT_ID and self.TELEGRAM_API_DOMAINS:
+            targets.append(("telegram", self.TELEGRAM_CHAT_ID))
+        return targets
+
+
+class Notifier:
+
+    def __init__(self, config: NotifyConfig = None):
+        self.config = config or NotifyConfig()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.config.NOTIFY_WORKERS)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.limiters = {}
+        self._lock = threading.Lock()
+        self.connect = sqlite3.connect(self.config.NOTIFY_DB_PATH, check_same_thread=False, timeout=30)
+        self.connect.executescript('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                target TEXT NOT NULL,
+                title TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending');
+            CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, next_attempt);
+            CREATE TABLE IF NOT EXISTS alert_state (
+                user_id TEXT PRIMARY KEY NOT NULL,
+                low INTEGER NOT NULL,
+                balance REAL NOT NULL,
+                changed REAL NOT NULL);''')
+        # 上次进程退出时正在发送的消息重新排队
+        self.connect.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+        self.connect.commit()
+        self.senders = {"pushplus": self._send_pushplus, "telegram": self._send_telegram}
+        self._executor = ThreadPoolExecutor(max_workers=self.config.NOTIFY_WORKERS, thread_name_prefix="notify")
+        self.telegram_health = DomainHealth(self.config.TELEGRAM_HEALTH_PATH, self.config.NOTIFY_TIMEOUT)
+        # 对冲请求单独的线程池：被放弃的慢请求最多占用线程 NOTIFY_TIMEOUT 秒
+        self._hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="notify-hedge")
+        self._wakeup = threading.Event()
+        self._in_flight = 0
+        self._idle = threading.Condition(self._lock)
+        threading.Thread(target=self._dispatch_loop, daemon=True, name="notify-dispatch").start()
+
+    def _limiter(self, channel):
+        if channel not in self.limiters:
+            self.limiters[channel] = RateLimiter(self.config.NOTIFY_RATE_LIMIT_PER_MINUTE)
+        return self.limiters[channel]
+
+    def enqueue(self, title: str, content: str):
+        '''queue a message for every configured channel, returns the number of queued deliveries'''
+        targets = self.config.channels()
+        now = time.time()
+        with self._lock:
+            with self.connect:
+                self.connect.executemany(
+                    "INSERT INTO outbox (channel, target, title, content, created, next_attempt) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(channel, target, title, content, now, now) for channel, target in targets])
+        self._wakeup.set()
+        return len(targets)
+
+    def balance_alert(self, user_id: str, balance: float):
+        """余额低于 BALANCE 时登记提醒；同一户号在余额回升之前只提醒一次。返回是否登记了提醒"""
+        threshold = self.config.BALANCE
+        with self._lock:
+            row = self.connect.execute("SELECT low FROM alert_state WHERE user_id = ?", (user_id,)).fetchone()
+            was_low = bool(row and row[0])
+            if balance < threshold:
+                is_low = True
+            elif balance >= threshold + self.config.NOTIFY_RESET_MARGIN:
+                is_low = False
+            else:
+                is_low = was_low
+            with self.connect:
+                self.connect.execute("INSERT OR REPLACE INTO alert_state VALUES (?, ?, ?, ?)",
+                                     (user_id, int(is_low), balance, time.time()))
+        if is_low and not was_low:
+            content = f"户号 {user_id[-4:]} 的当前余额为：{balance}元，请及时充值。"
+            queued = self.enqueue("余额提醒", content)
+            logging.info(f"Balance {balance} CNY is below {threshold} CNY, {queued} notification(s) queued.")
+            return True
+        if is_low:
+            logging.info(f"Balance {balance} CNY is still below {threshold} CNY, already notified.")
+        return False
+
+    def _dispatch_loop(self):
+        while True:
+            self._wakeup.wait(self._next_delay())
+            self._wakeup.clear()
+            try:
+                self._dispatch_due()
+            except Exception as e:
+                logging.error(f"Notification dispatch failed: {e}")
+
+    def _next_delay(self):
+        with self._lock:
+            row = self.connect.execute(
+                "SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def _dispatch_due(self):
+        now = time.time()
+        with self._lock:
+            rows = self.connect.execute(
+                "SELECT id, channel, target, title, content, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY id", (now,)).fetchall()
+            due = []
+            with self.connect:
+                for row in rows:
+                    wait = self._limiter(row[1]).acquire()
+                    if wait:
+                        # 超出限速：推迟，不计入重试次数
+                        self.connect.execute("UPDATE outbox SET next_attempt = ? WHERE id = ?", (now + wait, row[0]))
+                        continue
+                    self.connect.execute("UPDATE outbox SET status = 'sending' WHERE id = ?", (row[0],))
+                    due.append(row)
+            self._in_flight += len(due)
+        for row in due:
+            self._executor.submit(self._deliver, *row)
+
+    def _deliver(self, message_id, channel, target, title, content, attempts):
+        try:
+            self.senders[channel](target, title, content)
+            status, next_attempt, error = "sent", 0, None
+        except Exception as e:
+            attempts += 1
+            error = e
+            status = "failed" if attempts >= self.config.NOTIFY_MAX_ATTEMPTS else "pending"
+            next_attempt = time.time() + 30 * 2 ** (attempts - 1)
+        with self._lock:
+            with self.connect:
+                self.connect.execute("UPDATE outbox SET status = ?, attempts = ?, next_attempt = ? WHERE id = ?",
+                                     (status, attempts, next_attempt, message_id))
+            self._in_flight -= 1
+            self._idle.notify_all()
+        if status == "sent":
+            logging.info(f"{channel} notification sent.")
+        elif status == "failed":
+            logging.error(f"{channel} notification dropped after {attempts} attempts: {error}")
+        else:
+            logging.warning(f"{channel} notification failed (attempt {attempts}), retrying later: {error}")
+        self._wakeup.set()
+
+    def _send_pushplus(self, token, title, content):
+        response = self.session.post(PUSHPLUS_URL, json={"token": token, "title": title, "content": content},
+                                     timeout=self.config.NOTIFY_TIMEOUT)
+        response.raise_for_status()
+        result = response.json()
+        if result.get("code") != 200:
+            raise RuntimeError(f"pushplus error {result.get('code')}: {result.get('msg')}")
+
+    def _post_telegram(self, domain, payload):
+        # 域名可以写成 http://host:port，便于指向本地测试服务
+        base = domain if "://" in domain else f"https://{domain}"
+        response = self.session.post(f"{base}/bot{self.config.TELEGRAM_BOT_TOKEN}/sendMessage", json=payload,
+                                     timeout=self.config.NOTIFY_TIMEOUT)
+        response.raise_for_status()
+
+    def _send_telegram(self, chat_id, title, content):
+        """对冲发送：先请求评分最好的域名，超过自适应延迟仍无响应（或已失败）时再请求下一个，
+        第一个成功即返回，其余未开始的取消、已发出的放弃"""
+        payload = {"chat_id": chat_id, "text": f"{title}：{content}"}
+        domains = self.telegram_health.ranked(self.config.TELEGRAM_API_DOMAINS)
+        pending, errors = set(), []
+
+        def start(domain):
+            started = time.monotonic()
+            future = self._hedge_executor.submit(self._post_telegram, domain, payload)
+            future.domain = domain
+            future.add_done_callback(lambda f: f.cancelled() or self.telegram_health.record(
+                domain, time.monotonic() - started, f.exception() is None))
+            pending.add(future)
+
+        start(domains[0])
+        next_index = 1
+        while pending:
+            delay = self.telegram_health.hedge_delay(domains[next_index - 1]) if next_index < len(domains) else None
+            done, pending = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    logging.info(f"Telegram notification sent via {future.domain} "
+                                 f"({next_index} of {len(domains)} domain(s) tried).")
+                    return
+                errors.append(f"{future.domain}: {future.exception()}")
+            if next_index < len(domains):
+                start(domains[next_index])
+                next_index += 1
+        raise RuntimeError("all Telegram API domains failed: " + "; ".join(errors))
+
+    def pending(self):
+        with self._lock:
+            return self.connect.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+    def flush(self, timeout: float = None):
+        '''wait until nothing is due or being sent, at most timeout seconds'''
+        deadline = time.monotonic() + (self.config.NOTIFY_FLUSH_TIMEOUT if timeout is None else timeout)
+        self._wakeup.set()
+        with self._idle:
+            while time.monotonic() < deadline:
+                due = self.connect.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE status = 'pending' AND next_attempt <= ?",
+                    (time.time(),)).fetchone()[0]
+                if not due and not self._in_flight:
+                    return True
+                self._idle.wait(min(0.5, max(0.0, deadline - time.monotonic())))
+        return False
+
+
+def get_notifier():
+    '''the process-wide Notifier; pending messages get NOTIFY_FLUSH_TIMEOUT seconds at exit'''
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = Notifier()
+            atexit.register(_notifier.flush)
+        return _notifier
@@ -1,4 +1,8 @@
 # import cv2
+import logging
+import os
+import threading
+import time
 from PIL import ImageDraw,Image,ImageOps
 import numpy as np
 import onnxruntime
@@ -7,11 +11,88 @@ anchors = [[(116,90),(156,198),(373,326)],[(30,61),(62,45),(59,119)],[(10,13),(1
 anchors_yolo_tiny = [[(81, 82), (135, 169), (344, 319)], [(10, 14), (23, 27), (37, 58)]]
 CLASSES=["target"]
 
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+# 进程内共享的模型，同一个模型文件只加载一次
+_models = {}
+_models_lock = threading.Lock()
+
+
+class LoadedModel:
+    '''an InferenceSession together with its cached input/output metadata'''
+
+    def __init__(self, session):
+        self.session = session
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_shape = model_input.shape
+        self.output_names = [output.name for output in session.get_outputs()]
+
+
+def _session_options(optimized_model_path):
+    """根据环境变量构造 SessionOptions
+    ONNX_GRAPH_OPTIMIZATION_LEVEL: disable/basic/extended/all
+    ONNX_INTRA_OP_THREADS / ONNX_INTER_OP_THREADS: 线程数，0 为由 onnxruntime 决定
+    ONNX_EXECUTION_MODE: sequential/parallel"""
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[os.getenv("ONNX_GRAPH_OPTIMIZATION_LEVEL", "all").lower()]
+    options.intra_op_num_threads = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))
+    options.inter_op_num_threads = int(os.getenv("ONNX_INTER_OP_THREADS", 0))
+    options.execution_mode = EXECUTION_MODES[os.getenv("ONNX_EXECUTION_MODE", "sequential").lower()]
+    if optimized_model_path:
+        options.optimized_model_filepath = optimized_model_path
+    return options
+
+
+def get_model(onnx_file_name="captcha.onnx"):
+    """返回进程内共享的模型，第一次调用时加载
+    配置 ONNX_OPTIMIZED_MODEL_PATH 后，图优化的结果会保存到该文件，之后直接加载优化后的模型"""
+    key = os.path.abspath(onnx_file_name)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _models_lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+        start = time.monotonic()
+        optimized_model_path = os.getenv("ONNX_OPTIMIZED_MODEL_PATH", "")
+        if optimized_model_path and os.path.isfile(optimized_model_path) \
+                and os.path.getmtime(optimized_model_path) >= os.path.getmtime(onnx_file_name):
+            options = _session_options(None)
+            # 已经是优化后的图，跳过重复优化
+            options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS["disable"]
+            session = onnxruntime.InferenceSession(optimized_model_path, options, providers=["CPUExecutionProvider"])
+        else:
+            options = _session_options(optimized_model_path)
+            session = onnxruntime.InferenceSession(onnx_file_name, options, providers=["CPUExecutionProvider"])
+        model = LoadedModel(session)
+        if os.getenv("ONNX_WARMUP", "false").lower() == "true":
+            shape = [dim if isinstance(dim, int) else 1 for dim in model.input_shape]
+            session.run(model.output_names, {model.input_name: np.zeros(shape, dtype=np.float32)})
+        logging.info(f"ONNX model {onnx_file_name} loaded in {time.monotonic() - start:.2f}s.")
+        _models[key] = model
+        return model
+
+
+INPUT_SIZE = 416
 
 
 class ONNX:
     def __init__(self,onnx_file_name="captcha.onnx"):
-        self.onnx_session = onnxruntime.InferenceSession(onnx_file_name) 
+        self.model = get_model(onnx_file_name)
+        self.onnx_session = self.model.session
+        # 复用的模型输入 [N,3,416,416]，每个实例各自一份，实例本身不可多线程共用
+        self._input_buffer = np.empty((1, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
 
     # sigmoid函数
     def sigmoid(self,x):
@@ -21,13 +102,10 @@ class ONNX:
 
     # 获取预测正确的类别，以及概率和索引;
     def get_result(self,class_scores):
-        class_score = 0
-        class_index = 0
-        for i in range(len(class_scores)):
-            if class_scores[i] > class_score:
-                class_index += 1
-                class_score = class_scores[i]
-        return class_score, class_index
+        # 与逐个比较的写法等价：class_index 为“刷新最大值”的次数
+        running = np.maximum.accumulate(np.concatenate(([0], np.asarray(class_scores, dtype=np.float64))))
+        class_index = int(np.count_nonzero(running[1:] > running[:-1]))
+        return running[-1], class_index
 
 
     def xywh2xyxy(self,x):
@@ -86,6 +164,28 @@ class ONNX:
         return keep
 
 
+    # 一次完成所有类别的 NMS：不同类别的框平移到互不重叠的区域，返回保留框的下标（按置信度从大到小）
+    # 先一次算出两两之间的 IOU 矩阵，贪心抑制时每一步只剩一次布尔运算
+    def nms_batched(self, dets, thresh):
+        if len(dets) == 0:
+            return np.empty(0, dtype=np.int64)
+        order = dets[:, 4].argsort()[::-1]
+        boxes = dets[order, :4] + dets[order, 5:6] * (dets[:, :4].max() + 1)
+        x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        areas = (y2 - y1 + 1) * (x2 - x1 + 1)
+        w = np.maximum(0, np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]) + 1)
+        h = np.maximum(0, np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]) + 1)
+        overlaps = w * h
+        suppress = overlaps / (areas[:, None] + areas[None, :] - overlaps) > thresh
+        removed = np.zeros(len(order), dtype=bool)
+        keep = []
+        for i in range(len(order)):
+            if removed[i]:
+                continue
+            keep.append(i)
+            removed |= suppress[i]
+        return order[keep]
+
     def draw(self,image, box_data):
         # -------------------------------------------------------
         #	取整，方便画框
@@ -160,6 +260,31 @@ class ONNX:
         output = np.array(output)
         return output
 
+    # 获取预测框（全部在 NumPy 中完成，结果与 get_boxes 相同）
+    # max_candidates: 置信度过滤后最多保留的候选框数，降低阈值时 NMS 的耗时不会随框数暴涨
+    def get_boxes_vectorized(self, prediction, confidence_threshold=0.7, nms_threshold=0.6, max_candidates=300):
+        feature_map = prediction.reshape(-1, prediction.shape[-1])
+        scores = feature_map[:, 4]
+        candidates = np.flatnonzero(scores > confidence_threshold)
+        if candidates.size > max_candidates:
+            candidates = candidates[np.argpartition(-scores[candidates], max_candidates)[:max_candidates]]
+        box = feature_map[candidates]
+
+        dets = np.empty((len(box), 6), dtype=box.dtype)  # x1 y1 x2 y2 score class
+        half_w = box[:, 2] / 2
+        half_h = box[:, 3] / 2
+        dets[:, 0] = box[:, 0] - half_w
+        dets[:, 1] = box[:, 1] - half_h
+        dets[:, 2] = box[:, 0] + half_w
+        dets[:, 3] = box[:, 1] + half_h
+        dets[:, 4] = box[:, 4]
+        dets[:, 5] = box[:, 5:].argmax(axis=1)
+
+        keep = self.nms_batched(dets, nms_threshold)
+        # 与 get_boxes 一致：按类别分组，组内按置信度从大到小
+        keep = keep[np.argsort(dets[keep, 5], kind="stable")]
+        return dets[keep]
+
     def letterbox(self, img, new_shape=(640, 640), color=(114, 114, 114), auto=False, scaleFill=False, scaleup=True,
                     stride=32):
         '''图片归一化'''
@@ -199,7 +324,7 @@ class ONNX:
         img = ImageOps.expand(img, border=(left, top, right, bottom), fill=0)##left,top,right,bottom
         return img, ratio, (dw, dh)
 
-    def _inference(self,image):
+    def _preprocess(self,image):
         # org_img = cv2.resize(image, [416, 416]) # resize后的原图 (640, 640, 3)
         org_img = image.resize((416,416))
         # img = cv2.cvtColor(org_img, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)
@@ -207,15 +332,18 @@ class ONNX:
         img = np.array(img).transpose(2, 0, 1)
         img = img.astype(dtype=np.float32)  # onnx模型的类型是type: float32[ , , , ]
         img /= 255.0
+        return img, org_img
+
+    def _inference(self,image):
+        img, org_img = self._preprocess(image)
         img = np.expand_dims(img, axis=0) # [3, 640, 640]扩展为[1, 3, 640, 640]
 
-        inputs = {self.onnx_session.get_inputs()[0].name: img} 
-        prediction = self.onnx_session.run(None, inputs)[0] 
+        inputs = {self.model.input_name: img}
+        prediction = self.onnx_session.run(self.model.output_names, inputs)[0]
         return prediction, org_img
 
-    def get_distance(self,image,draw=False):
-        prediction, org_img = self._inference(image)
-        boxes = self.get_boxes(prediction=prediction)
+    def _distance(self, prediction, org_img=None, draw=False):
+        boxes = self.get_boxes_vectorized(prediction=prediction)
         if len(boxes) == 0:
             print('No gaps were detected.')
             return 0
@@ -228,6 +356,53 @@ class ONNX:
                 # cv2.waitKey(0)
             return int(boxes[..., :4].astype(np.int32)[0][0])
 
+    def _write_input(self, out, image):
+        '''write one image into out ([3,416,416] float32) as normalized CHW without intermediate copies
+        image: PIL image, or a (416,416,4)/(416,416,3) uint8 array such as canvas getImageData pixels'''
+        if isinstance(image, np.ndarray):
+            pixels = image
+        else:
+            pixels = np.asarray(image.resize((INPUT_SIZE, INPUT_SIZE)).convert("RGB"))
+        np.multiply(pixels[..., :3].transpose(2, 0, 1), np.float32(1 / 255.0), out=out)
+
+    def _run_buffer(self, batch_size):
+        '''run the model on the first batch_size rows of the input buffer, bound without copying'''
+        binding = self.onnx_session.io_binding()
+        binding.bind_cpu_input(self.model.input_name, self._input_buffer[:batch_size])
+        binding.bind_output(self.model.output_names[0])
+        self.onnx_session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
+
+    def get_distance(self,image,draw=False):
+        if draw:
+            prediction, org_img = self._inference(image)
+            return self._distance(prediction, org_img, draw)
+        self._write_input(self._input_buffer[0], image)
+        return self._distance(self._run_buffer(1))
+
+    def get_distance_rgba(self, rgba, width=INPUT_SIZE, height=INPUT_SIZE):
+        '''distance from raw RGBA bytes (canvas getImageData), already resized to 416x416 by the browser'''
+        pixels = np.frombuffer(rgba, dtype=np.uint8).reshape(height, width, 4)
+        if (width, height) != (INPUT_SIZE, INPUT_SIZE):
+            return self.get_distance(Image.frombuffer("RGBA", (width, height), rgba))
+        return self.get_distance(pixels)
+
+    def supports_batch(self):
+        '''True when the model input has a dynamic batch dimension'''
+        return not isinstance(self.model.input_shape[0], int)
+
+    def get_distances(self, images):
+        '''distances for several images (PIL images or 416x416 RGBA arrays),
+        one session.run over [N,3,416,416] when the model allows it'''
+        if not self.supports_batch():
+            return [self.get_distance(image) for image in images]
+        if len(images) > len(self._input_buffer):
+            self._input_buffer = np.empty((len(images), 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+        for index, image in enumerate(images):
+            self._write_input(self._input_buffer[index], image)
+        predictions = self._run_buffer(len(images))
+        return [self._distance(prediction) for prediction in predictions]
+
 if __name__ == "__main__":
     onnx = ONNX()
     img_path="../assets/background.png"
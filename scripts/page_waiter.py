@@ -0,0 +1,210 @@
+import logging
+import os
+import time
+
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import StaleElementReferenceException, WebDriverException
+
+# 在每个新文档加载前注入，统计页面中未完成的 XHR/fetch 请求数，用于判断网络是否空闲
+NETWORK_TRACKER_JS = """
+(function () {
+    if (window.__sgccPending !== undefined) { return; }
+    window.__sgccPending = 0;
+    window.__sgccLastActivity = Date.now();
+    function begin() { window.__sgccPending += 1; window.__sgccLastActivity = Date.now(); }
+    function end() { window.__sgccPending = Math.max(0, window.__sgccPending - 1); window.__sgccLastActivity = Date.now(); }
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        begin();
+        this.addEventListener('loadend', end);
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var _fetch = window.fetch;
+        window.fetch = function () {
+            begin();
+            return _fetch.apply(this, arguments).then(
+                function (r) { end(); return r; },
+                function (e) { end(); throw e; });
+        };
+    }
+})();
+"""
+
+PAGE_STATE_JS = """
+return {
+    ready: document.readyState,
+    pending: (window.__sgccPending === undefined) ? -1 : window.__sgccPending,
+    resources: performance.getEntriesByType('resource').length
+};
+"""
+
+# 滑块背景 canvas 已经绘制出内容（存在不透明像素）时返回 true
+SLIDER_READY_JS = """
+var box = document.getElementById('slideVerify');
+if (!box || !box.childNodes.length) { return false; }
+var canvas = box.childNodes[0];
+if (!canvas.getContext || !canvas.width || !canvas.height) { return false; }
+try {
+    var data = canvas.getContext('2d').getImageData(0, 0, canvas.width, canvas.height).data;
+    for (var i = 3; i < data.length; i += 4 * 97) {
+        if (data[i]) { return true; }
+    }
+    return false;
+} catch (e) {
+    return true;
+}
+"""
+
+QUERY_JS = """
+var by = arguments[0], key = arguments[1];
+if (by === 'xpath') {
+    return document.evaluate(key, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+return document.querySelector(key);
+"""
+
+ELEMENT_VISIBLE_JS = """
+var el = arguments[0];
+if (!el || !el.isConnected) { return false; }
+var style = window.getComputedStyle(el);
+if (style.visibility === 'hidden' || style.display === 'none') { return false; }
+var rect = el.getBoundingClientRect();
+return rect.width > 0 && rect.height > 0;
+"""
+
+
+class PageWaiter:
+    '''Block on real page-readiness signals instead of fixed sleeps.
+
+    All lookups are done with JavaScript so the driver's implicit wait never
+    adds its own delay; the legacy fixed sleeps are only used as a fallback
+    (PAGE_WAIT_MODE=sleep or PAGE_WAIT_FALLBACK_SLEEP > 0).'''
+
+    def __init__(self):
+        self.DRIVER_IMPLICITY_WAIT_TIME = int(os.getenv("DRIVER_IMPLICITY_WAIT_TIME", 60))
+        self.RETRY_WAIT_TIME_OFFSET_UNIT = int(os.getenv("RETRY_WAIT_TIME_OFFSET_UNIT", 10))
+        self.PAGE_WAIT_MODE = os.getenv("PAGE_WAIT_MODE", "event").lower()
+        self.PAGE_WAIT_TIMEOUT = float(os.getenv("PAGE_WAIT_TIMEOUT", self.DRIVER_IMPLICITY_WAIT_TIME))
+        self.PAGE_WAIT_POLL_INTERVAL = float(os.getenv("PAGE_WAIT_POLL_INTERVAL", 0.2))
+        self.PAGE_WAIT_FALLBACK_SLEEP = float(os.getenv("PAGE_WAIT_FALLBACK_SLEEP", 0))
+        self.NETWORK_IDLE_TIME = float(os.getenv("NETWORK_IDLE_TIME", 0.5))
+        self.ELEMENT_STABLE_TIME = float(os.getenv("ELEMENT_STABLE_TIME", 0.4))
+
+    def track_network(self, driver):
+        '''inject the XHR tracker into the current document, needed for tabs opened by window.open
+        because addScriptToEvaluateOnNewDocument only applies to the target it was registered on'''
+        try:
+            driver.execute_script(NETWORK_TRACKER_JS)
+        except WebDriverException as e:
+            logging.debug(f"Failed to inject the network tracker: {e}")
+
+    def install(self, driver):
+        '''register the XHR/fetch tracker for every document the driver opens'''
+        try:
+            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": NETWORK_TRACKER_JS})
+        except Exception as e:
+            logging.debug(f"Network tracker not installed, falling back to resource timing: {e}")
+
+    def fallback_sleep(self, factor=1):
+        '''legacy padding, only used when configured'''
+        if self.PAGE_WAIT_MODE == "sleep":
+            time.sleep(self.RETRY_WAIT_TIME_OFFSET_UNIT * factor)
+        elif self.PAGE_WAIT_FALLBACK_SLEEP > 0:
+            time.sleep(self.PAGE_WAIT_FALLBACK_SLEEP * factor)
+
+    def until(self, condition, timeout=None, message=""):
+        '''poll condition() until it returns a truthy value, raise TimeoutError otherwise'''
+        timeout = self.PAGE_WAIT_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                value = condition()
+                if value:
+                    return value
+            except (StaleElementReferenceException, WebDriverException) as e:
+                logging.debug(f"Wait condition raised {type(e).__name__}, retrying.")
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out after {timeout}s waiting for {message or 'condition'}")
+            time.sleep(self.PAGE_WAIT_POLL_INTERVAL)
+
+    def find_now(self, driver, by, key):
+        '''look up an element without triggering the implicit wait, None if absent'''
+        if by == By.XPATH:
+            return driver.execute_script(QUERY_JS, "xpath", key)
+        if by == By.CLASS_NAME:
+            selector = "." + key
+        elif by == By.ID:
+            selector = "#" + key
+        else:
+            selector = key
+        return driver.execute_script(QUERY_JS, "css", selector)
+
+    def is_visible(self, driver, element):
+        return bool(driver.execute_script(ELEMENT_VISIBLE_JS, element))
+
+    def wait_document_ready(self, driver, timeout=None):
+        self.until(lambda: driver.execute_script("return document.readyState") == "complete",
+                   timeout, "document.readyState == complete")
+
+    def wait_network_idle(self, driver, timeout=None, idle_time=None):
+        '''no pending XHR/fetch and no new resource entries for idle_time seconds'''
+        idle_time = self.NETWORK_IDLE_TIME if idle_time is None else idle_time
+        state = {"resources": -1, "since": time.monotonic()}
+
+        def idle():
+            page = driver.execute_script(PAGE_STATE_JS)
+            now = time.monotonic()
+            if page["ready"] != "complete" or page["pending"] > 0 or page["resources"] != state["resources"]:
+                state["resources"] = page["resources"]
+                state["since"] = now
+                return False
+            return now - state["since"] >= idle_time
+
+        self.until(idle, timeout, "network idle")
+
+    def wait_page_ready(self, driver, timeout=None):
+        self.wait_document_ready(driver, timeout)
+        self.wait_network_idle(driver, timeout)
+
+    def wait_present(self, driver, by, key, timeout=None):
+        return self.until(lambda: self.find_now(driver, by, key), timeout, f"presence of {key}")
+
+    def wait_visible(self, driver, by, key, timeout=None):
+        def visible():
+            element = self.find_now(driver, by, key)
+            return element if element is not None and self.is_visible(driver, element) else None
+        return self.until(visible, timeout, f"visibility of {key}")
+
+    def wait_stable_text(self, driver, by, key, predicate=None, timeout=None):
+        '''wait until the element is visible and its text stops changing, return the text'''
+        state = {"text": None, "since": time.monotonic()}
+
+        def stable():
+            element = self.find_now(driver, by, key)
+            if element is None or not self.is_visible(driver, element):
+                state["text"] = None
+                return None
+            text = element.text
+            now = time.monotonic()
+            if text != state["text"]:
+                state["text"] = text
+                state["since"] = now
+                return None
+            if predicate is not None and not predicate(text):
+                return None
+            return (now - state["since"] >= self.ELEMENT_STABLE_TIME) and (text,)
+
+        return self.until(stable, timeout, f"stable text of {key}")[0]
+
+    def wait_slider_ready(self, driver, timeout=None):
+        '''wait for the slideVerify canvas to be rendered'''
+        self.until(lambda: driver.execute_script(SLIDER_READY_JS), timeout, "slideVerify canvas")
+
+    def wait_url_change(self, driver, url, timeout=None):
+        '''return True once the driver navigates away from url, False on timeout'''
+        try:
+            self.until(lambda: driver.current_url != url, timeout, f"navigation away from {url}")
+            return True
+        except TimeoutError:
+            return False
@@ -0,0 +1,298 @@
+"""可选的性能剖析，用于排查某次执行变慢时 Python 的耗时和内存去向
+
+PROFILE_MODES 为逗号分隔的模式（或 all），每次 run_task() 都会剖析；
+也可以留空并向进程发送 SIGUSR1，下一次执行时按 PROFILE_SIGNAL_MODES 剖析，再发送一次则取消。
+  cprofile     各抓取线程的 cProfile 合并为 cprofile.pstats，并输出按累计时间排序的 cprofile.txt
+  sample       每 PROFILE_SAMPLE_INTERVAL 秒采样所有线程的调用栈，输出 collapsed 格式的 stacks.collapsed
+               （flamegraph.pl / speedscope 可直接打开）
+  tracemalloc  ONNX 求解和逐户查询前后各取一次快照，差异写入 tracemalloc-*.txt
+  browser      在登录后、每个户号之后用 CDP Performance.getMetrics 记录浏览器的 JS 堆、DOM 节点等
+每次执行的结果写入 PROFILE_DIR/<时间>-<名称>-<pid>/，metadata.json 记录版本、依赖版本和相关配置，便于跨版本比较。"""
+import cProfile
+import io
+import json
+import logging
+import os
+import platform
+import pstats
+import signal
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+ALL_MODES = ("cprofile", "sample", "tracemalloc", "browser")
+BROWSER_METRICS = ("JSHeapUsedSize", "JSHeapTotalSize", "Nodes", "Documents", "Frames", "JSEventListeners",
+                   "LayoutCount", "RecalcStyleCount", "LayoutDuration", "ScriptDuration", "TaskDuration")
+# 写入 metadata.json 的配置项，影响耗时的设置不同的两次剖析不能直接比较
+RECORDED_SETTINGS = ("BROWSER_PROFILE", "BROWSER_KEEP_WARM", "BALANCE_TAB_FANOUT", "FETCH_BACKEND",
+                     "CAPTCHA_RAW_PIXELS", "CAPTCHA_SOLVER_ADDRESS", "ENABLE_CAPTCHA_CACHE",
+                     "MAX_CONCURRENT_BROWSERS", "ONNX_INTRA_OP_THREADS", "ONNX_INTER_OP_THREADS",
+                     "ONNX_EXECUTION_MODE", "PAGE_WAIT_MODE", "SGCC_BASE_URL")
+
+_signal_armed = False
+_session = None
+# 正在使用 _session 的 profile_run() 数量，最后一个退出时写出结果
+_session_users = 0
+_session_lock = threading.Lock()
+
+
+def _parse_modes(value: str):
+    modes = {mode.strip().lower() for mode in value.split(",") if mode.strip()}
+    if "all" in modes:
+        return set(ALL_MODES)
+    unknown = modes - set(ALL_MODES)
+    if unknown:
+        logging.warning(f"Unknown profiling mode(s) ignored: {', '.join(sorted(unknown))}")
+    return modes & set(ALL_MODES)
+
+
+def _package_versions():
+    versions = {}
+    for name in ("onnxruntime", "numpy", "selenium", "undetected_chromedriver", "PIL", "requests"):
+        module = sys.modules.get(name)
+        versions[name] = getattr(module, "__version__", None) if module else None
+    return versions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class ProfileSession:
+    '''artifacts of one profiled run, created by profile_run()'''
+
+    def __init__(self, label: str, modes: set):
+        self.label = label
+        self.modes = modes
+        base = os.getenv("PROFILE_DIR", "profiles")
+        if 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(base):
+            base = "/data/" + base
+        self.directory = os.path.join(base, f"{datetime.now():%Y%m%d-%H%M%S}-{label}-{os.getpid()}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.sample_interval = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.01))
+        self._lock = threading.Lock()
+        self._stats = None
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._diffs = 0
+        self._started_tracemalloc = False
+        self.error = None
+        self.started = time.time()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def start(self):
+        if "tracemalloc" in self.modes and not tracemalloc.is_tracing():
+            tracemalloc.start(int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", 10)))
+            self._started_tracemalloc = True
+        if "sample" in self.modes:
+            self._sampler = threading.Thread(target=self._sample_loop, daemon=True, name="profile-sampler")
+            self._sampler.start()
+        logging.info(f"Profiling {self.label} ({', '.join(sorted(self.modes))}) into {self.directory}.")
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.sample_interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                # 线程名里的序号去掉，多次执行的同类线程合并在一起
+                thread_name = names.get(ident, "thread").rstrip("0123456789_-")
+                self._stacks[";".join([thread_name] + stack[::-1])] += 1
+
+    def add_profile(self, profile: cProfile.Profile):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot() if "tracemalloc" in self.modes and tracemalloc.is_tracing() else None
+
+    def write_diff(self, name, before, after):
+        with self._lock:
+            self._diffs += 1
+            index = self._diffs
+        stats = after.compare_to(before, "lineno")
+        total = sum(stat.size_diff for stat in stats)
+        with open(self.path(f"tracemalloc-{index:03d}-{name}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"# {name}: {total / 1024:+.1f} KiB net, top {min(len(stats), 30)} lines\n")
+            for stat in stats[:30]:
+                f.write(f"{stat}\n")
+
+    def write_browser_sample(self, record):
+        with self._lock, open(self.path("browser_metrics.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def finish(self, error=None):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            with open(self.path("stacks.collapsed"), "w", encoding="utf-8") as f:
+                for stack, count in sorted(self._stacks.items()):
+                    f.write(f"{stack} {count}\n")
+        if self._stats is not None:
+            self._stats.dump_stats(self.path("cprofile.pstats"))
+            text = io.StringIO()
+            stats = pstats.Stats(self.path("cprofile.pstats"), stream=text)
+            stats.sort_stats("cumulative").print_stats(80)
+            stats.sort_stats("tottime").print_stats(40)
+            with open(self.path("cprofile.txt"), "w", encoding="utf-8") as f:
+                f.write(text.getvalue())
+        if self._started_tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        else:
+            current = peak = None
+        metadata = {
+            "label": self.label, "modes": sorted(self.modes), "started": self.started,
+            "duration": round(time.time() - self.started, 3), "error": error,
+            "version": os.getenv("VERSION"), "git_commit": _git_commit(),
+            "python": sys.version, "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "packages": _package_versions(), "sample_interval": self.sample_interval,
+            "tracemalloc_current_bytes": current, "tracemalloc_peak_bytes": peak,
+            "settings": {name: os.getenv(name) for name in RECORDED_SETTINGS},
+        }
+        with open(self.path("metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2, sort_keys=True)
+        logging.info(f"Profile of {self.label} written to {self.directory}.")
+
+
+def _requested_modes():
+    global _signal_armed
+    modes = _parse_modes(os.getenv("PROFILE_MODES", ""))
+    if _signal_armed:
+        _signal_armed = False
+        modes |= _parse_modes(os.getenv("PROFILE_SIGNAL_MODES", "cprofile,sample,tracemalloc,browser"))
+    return modes
+
+
+@contextmanager
+def profile_run(label: str):
+    '''profile one run when requested by PROFILE_MODES or SIGUSR1, nested and concurrent calls join the
+    active session, which is written when the last of them exits'''
+    global _session, _session_users
+    with _session_lock:
+        if _session is None:
+            modes = _requested_modes()
+            if modes:
+                _session = ProfileSession(label, modes)
+                _session.start()
+        session = _session
+        if session is not None:
+            _session_users += 1
+    if session is None:
+        yield
+        return
+    try:
+        with profile_thread():
+            yield
+    except BaseException as e:
+        session.error = session.error or repr(e)
+        raise
+    finally:
+        with _session_lock:
+            _session_users -= 1
+            last = _session_users == 0
+            if last:
+                _session = None
+        if last:
+            try:
+                session.finish(session.error)
+            except Exception as e:
+                logging.warning(f"Failed to write profile to {session.directory}: {e}")
+
+
+def profiled(label: str):
+    '''decorator form of profile_run()'''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile_run(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile_thread():
+    '''cProfile the calling thread into the active session, each fetcher thread needs its own profiler'''
+    session = _session
+    if session is None or "cprofile" not in session.modes:
+        yield
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # 同一线程中已有 profiler（嵌套调用）时由外层负责
+        yield
+        return
+    try:
+        yield
+    finally:
+        profile.disable()
+        session.add_profile(profile)
+
+
+@contextmanager
+def memory_diff(name: str):
+    '''write the tracemalloc difference of the enclosed block, allocations of other threads are included'''
+    session = _session
+    before = session.snapshot() if session is not None else None
+    try:
+        yield
+    finally:
+        if before is not None:
+            session.write_diff(name, before, session.snapshot())
+
+
+def sample_browser(driver, label: str):
+    '''record CDP Performance.getMetrics of driver at a phase boundary'''
+    session = _session
+    if session is None or "browser" not in session.modes or driver is None:
+        return
+    try:
+        if not getattr(driver, "_profiling_performance_enabled", False):
+            driver.execute_cdp_cmd("Performance.enable", {})
+            driver._profiling_performance_enabled = True
+        result = driver.execute_cdp_cmd("Performance.getMetrics", {})
+    except Exception as e:
+        logging.debug(f"Performance.getMetrics failed: {e}")
+        return
+    metrics = {item["name"]: item["value"] for item in result.get("metrics", []) if item["name"] in BROWSER_METRICS}
+    session.write_browser_sample({"ts": time.time(), "label": label, "thread": threading.current_thread().name,
+                                  **metrics})
+
+
+def _toggle(signum, frame):
+    global _signal_armed
+    _signal_armed = not _signal_armed
+    logging.info("Profiling armed for the next run." if _signal_armed else "Profiling request cancelled.")
+
+
+def install_signal_handler():
+    '''SIGUSR1 arms (or disarms) profiling of the next run, must be called from the main thread'''
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, _toggle)
@@ -0,0 +1,166 @@
+"""把一次真实执行中看到的页面、XHR 响应和滑块背景录制为 zip 归档，供 replay_server.py 离线回放
+
+设置 RECORD_DIR 后每次 DataFetcher.fetch() 写入 RECORD_DIR/<时间>-<账号>-<pid>.zip：
+  manifest.json  户号、余额页的 .num/.amttxt、日用电量、每张验证码提交的偏移量及是否通过、页面列表
+  pages/*.html   各阶段的 page_source，站点改版时用于对照 mock_pages.py 的模板
+  captchas/*.png 滑块背景 canvas
+  xhr.jsonl      页面发出的 XHR/fetch 请求和响应体（来自 Chrome 的 performance 日志）
+归档包含户号、余额和接口原始响应，只应保存在本地。录制时请使用 FETCH_BACKEND=selenium。"""
+import base64
+import json
+import logging
+import os
+import threading
+import zipfile
+from datetime import datetime
+
+from accounts import mask_account
+
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+if RECORD_DIR and 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(RECORD_DIR):
+    RECORD_DIR = "/data/" + RECORD_DIR
+ENABLED = bool(RECORD_DIR)
+ARCHIVE_VERSION = 1
+
+CANVAS_PNG_JS = 'return document.getElementById("slideVerify").childNodes[0].toDataURL("image/png");'
+BALANCE_TEXT_JS = """
+var num = document.querySelector(".num"), amttxt = document.querySelector(".amttxt");
+return [num ? num.innerText : null, amttxt ? amttxt.innerText : null];
+"""
+
+
+class _NullRecorder:
+    '''used while recording is off, every hook is a no-op'''
+
+    def page(self, driver, name):
+        pass
+
+    def captcha(self, driver):
+        return None
+
+    def captcha_result(self, index, offset, success):
+        pass
+
+    def user_ids(self, driver, user_ids):
+        pass
+
+    def balance(self, driver, user_id):
+        pass
+
+    def usage(self, driver, user_id, rows):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_RECORDER = _NullRecorder()
+
+
+class Recorder(_NullRecorder):
+    def __init__(self, directory: str, account: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{datetime.now():%Y%m%d-%H%M%S}-{mask_account(account)}-{os.getpid()}.zip")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.manifest = {"version": ARCHIVE_VERSION, "recorded": datetime.now().isoformat(timespec="seconds"),
+                         "account": mask_account(account), "pages": [], "captchas": [], "user_ids": [],
+                         "users": {}, "daily": {}}
+        self._files = {}
+        self._xhr = []
+
+    def _drain_network(self, driver):
+        '''XHR/fetch requests finished since the last call, read from the performance log'''
+        try:
+            entries = driver.get_log("performance")
+        except Exception as e:
+            logging.debug(f"Performance log unavailable, XHR responses not recorded: {e}")
+            return
+        for entry in entries:
+            message = json.loads(entry["message"])["message"]
+            method, params = message.get("method"), message.get("params", {})
+            request_id = params.get("requestId")
+            if method == "Network.requestWillBeSent" and params.get("type") in ("XHR", "Fetch"):
+                request = params["request"]
+                self._pending[request_id] = {"url": request["url"], "method": request["method"],
+                                             "post_data": request.get("postData"), "ts": params.get("wallTime")}
+            elif method == "Network.responseReceived" and request_id in self._pending:
+                response = params["response"]
+                self._pending[request_id].update(status=response.get("status"), mime=response.get("mimeType"))
+            elif method == "Network.loadingFinished" and request_id in self._pending:
+                record = self._pending.pop(request_id)
+                try:
+                    body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+                    record["body"] = body.get("body")
+                    record["base64"] = body.get("base64Encoded", False)
+                except Exception as e:
+                    record["error"] = str(e)
+                self._xhr.append(record)
+
+    def page(self, driver, name):
+        with self._lock:
+            self._drain_network(driver)
+            filename = f"pages/{len(self.manifest['pages']) + 1:03d}-{name}.html"
+            self._files[filename] = driver.page_source.encode("utf-8")
+            self.manifest["pages"].append({"name": name, "url": driver.current_url, "file": filename})
+
+    def captcha(self, driver):
+        '''save the slider background before it is solved, returns the index for captcha_result()'''
+        try:
+            png = base64.b64decode(driver.execute_script(CANVAS_PNG_JS).split(",", 1)[1])
+        except Exception as e:
+            logging.debug(f"Slider background not recorded: {e}")
+            return None
+        with self._lock:
+            index = len(self.manifest["captchas"])
+            filename = f"captchas/{index + 1:03d}.png"
+            self._files[filename] = png
+            self.manifest["captchas"].append({"file": filename, "offset": None, "success": None})
+        return index
+
+    def captcha_result(self, index, offset, success):
+        if index is None:
+            return
+        with self._lock:
+            self.manifest["captchas"][index].update(offset=offset, success=bool(success))
+
+    def user_ids(self, driver, user_ids):
+        self.page(driver, "user_list")
+        with self._lock:
+            self.manifest["user_ids"] = list(user_ids)
+
+    def balance(self, driver, user_id):
+        try:
+            num, amttxt = driver.execute_script(BALANCE_TEXT_JS)
+        except Exception as e:
+            logging.debug(f"Balance text not recorded: {e}")
+            return
+        with self._lock:
+            self.manifest["users"][user_id] = {"num": num, "amttxt": amttxt}
+        self.page(driver, "balance")
+
+    def usage(self, driver, user_id, rows):
+        with self._lock:
+            self.manifest["daily"][user_id] = [list(row) for row in rows]
+        self.page(driver, "usage")
+
+    def close(self):
+        with self._lock:
+            tmp = self.path + ".tmp"
+            try:
+                with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as archive:
+                    archive.writestr("manifest.json", json.dumps(self.manifest, ensure_ascii=False, indent=2))
+                    archive.writestr("xhr.jsonl", "".join(json.dumps(record, ensure_ascii=False) + "\n"
+                                                          for record in self._xhr))
+                    for filename, data in self._files.items():
+                        archive.writestr(filename, data)
+                os.replace(tmp, self.path)
+                logging.info(f"Recorded {len(self.manifest['pages'])} page(s), {len(self._xhr)} XHR response(s) and "
+                             f"{len(self.manifest['captchas'])} captcha(s) to {self.path}.")
+            except OSError as e:
+                logging.warning(f"Failed to write recording {self.path}: {e}")
+
+
+def open_recorder(account: str):
+    '''a Recorder for one fetch when RECORD_DIR is set, otherwise the shared no-op recorder'''
+    return Recorder(RECORD_DIR, account) if ENABLED else NULL_RECORDER
@@ -0,0 +1,179 @@
+"""回放 recorder.py 录制的归档：在本地提供 LOGIN_URL / BALANCE_URL / ELECTRIC_USAGE_URL 对应的页面和接口
+
+启动：python replay_server.py --archive recordings/20261018-070000-138****1234-1.zip --port 8597
+自检：python replay_server.py --self-test
+把 SGCC_BASE_URL 设为 http://127.0.0.1:8597（需为环境变量，在导入 const 之前生效）即可让 DataFetcher.fetch()
+完整地跑一遍登录、验证码、户号列表、余额和日用电量，用于比较每次性能改动前后的端到端耗时。
+任意账号密码都能登录；滑块只接受与录制时通过的偏移量相差不超过 --tolerance 像素的提交，
+归档中没有通过的验证码时接受任意偏移量。接口优先返回录制到的原始响应，没有时按页面上读到的数据生成。"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import threading
+import zipfile
+from urllib.parse import urlparse
+
+from const import *
+from mock_pages import MockSite, start_site_server
+
+
+class ArchiveSite(MockSite):
+    def __init__(self, path: str, tolerance: int = 3, latency: float = 0):
+        self.tolerance = tolerance
+        self.latency = latency
+        files = self._read(path)
+        self.manifest = json.loads(files["manifest.json"])
+        self.xhr = [json.loads(line) for line in files.get("xhr.jsonl", b"").decode("utf-8").splitlines() if line]
+        captchas = self.manifest["captchas"]
+        passed = [captcha for captcha in captchas if captcha.get("success")]
+        if not passed:
+            logging.warning("No passed captcha in the archive, any slider offset will be accepted.")
+        self.captchas = [(files[captcha["file"]], captcha["offset"] if passed else None)
+                         for captcha in (passed or captchas)]
+        if not self.captchas:
+            raise ValueError(f"{path} has no captcha images")
+        self._next_captcha = itertools.cycle(self.captchas)
+        self._lock = threading.Lock()
+        self.user_ids = self.manifest["user_ids"] or list(self.manifest["users"])
+
+    @staticmethod
+    def _read(path):
+        if os.path.isdir(path):
+            files = {}
+            for root, _, names in os.walk(path):
+                for name in names:
+                    full = os.path.join(root, name)
+                    with open(full, "rb") as f:
+                        files[os.path.relpath(full, path).replace(os.sep, "/")] = f.read()
+            return files
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+
+    def _recorded(self, api_path, user_id=None):
+        '''the last recorded JSON response of api_path (for user_id when given), None if there is none'''
+        for record in reversed(self.xhr):
+            if urlparse(record["url"]).path != api_path or record.get("base64") or not record.get("body"):
+                continue
+            try:
+                if user_id is not None and str(json.loads(record.get("post_data") or "{}").get("consNo")) != user_id:
+                    continue
+                return json.loads(record["body"])
+            except ValueError:
+                # 接口请求或响应加密时无法按户号匹配，改用页面上的数据
+                continue
+        return None
+
+    def login(self, username, password):
+        return "replay"
+
+    def new_captcha(self, account):
+        with self._lock:
+            png, expected = next(self._next_captcha)
+        return png, lambda offset: expected is None or abs(offset - expected) <= self.tolerance
+
+    def user_list(self, account):
+        recorded = self._recorded(USER_LIST_API)
+        if recorded is not None:
+            return recorded
+        users = [{"consNo": user_id, "consName": "回放用户", "elecAddr": "回放地址"} for user_id in self.user_ids]
+        return {"code": "1", "message": "ok", "data": {"powerUserList": users}}
+
+    def balance(self, account, user_id):
+        recorded = self._recorded(BALANCE_API, user_id)
+        if recorded is not None:
+            return recorded
+        user = self.manifest["users"].get(user_id)
+        if not user or not user.get("num"):
+            return {"code": "1", "message": "ok", "data": {"list": []}}
+        arrears = "欠费" in (user.get("amttxt") or "")
+        item = {"consNo": user_id, "sumMoney": "0.00" if arrears else user["num"],
+                "historyOwe": user["num"] if arrears else "0.00"}
+        return {"code": "1", "message": "ok", "data": {"list": [item]}}
+
+    def daily(self, account, user_id, days):
+        rows = sorted(self.manifest["daily"].get(user_id, []), reverse=True)
+        return rows[:days]
+
+
+def _sample_archive(path):
+    '''a small archive shaped like a recording, used by the self-test'''
+    from mock_pages import png_image
+
+    manifest = {"version": 1, "recorded": "2026-10-18T07:00:00", "account": "138****0000", "pages": [],
+                "captchas": [{"file": "captchas/001.png", "offset": 120, "success": False},
+                             {"file": "captchas/002.png", "offset": 131, "success": True}],
+                "user_ids": ["1000000001", "1000000002"],
+                "users": {"1000000001": {"num": "88.50", "amttxt": "账户余额"},
+                          "1000000002": {"num": "12.30", "amttxt": "欠费金额"}},
+                "daily": {"1000000001": [["2026-10-16", "4.2"], ["2026-10-17", "5.1"]]}}
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False))
+        archive.writestr("xhr.jsonl", "")
+        for index in (1, 2):
+            archive.writestr(f"captchas/00{index}.png", png_image(32, 16, lambda x, y: (x * 8, y * 16, index * 100)))
+    return manifest
+
+
+def self_test():
+    '''walk the login, verify and data endpoints the pages use, then read the balances with HttpBackend'''
+    import tempfile
+    import requests
+    from mock_pages import BALANCE_PATH, DAILY_API, LOGIN_PATH, SESSION_COOKIE, check_templates
+    from http_backend import HttpBackend
+
+    problems = check_templates()
+    assert not problems, f"templates do not match the fetcher: {problems}"
+    path = os.path.join(tempfile.mkdtemp(), "sample.zip")
+    manifest = _sample_archive(path)
+    server = start_site_server(ArchiveSite(path, tolerance=3))
+    base = server.url
+    try:
+        session = requests.Session()
+        assert "login_box" in session.get(base + LOGIN_PATH).text
+        redirect = session.get(base + BALANCE_PATH, allow_redirects=False)
+        assert redirect.status_code == 302 and redirect.headers["Location"] == LOGIN_PATH
+
+        ticket = session.post(base + "/mock/login", json={"username": "u", "password": "p"}).json()["ticket"]
+        captcha = session.post(base + "/mock/captcha", json={"ticket": ticket}).json()
+        assert session.get(base + captcha["image"]).content.startswith(b"\x89PNG")
+        assert session.post(base + "/mock/verify", json={"id": captcha["id"], "offset": 100}).json()["code"] == "0"
+        captcha = session.post(base + "/mock/captcha", json={"ticket": ticket}).json()
+        verified = session.post(base + "/mock/verify", json={"id": captcha["id"], "offset": 133}).json()
+        assert verified["code"] == "1" and verified["redirect"] == BALANCE_PATH, verified
+        assert "el-dropdown" in session.get(base + BALANCE_PATH).text
+
+        daily = session.post(base + DAILY_API, json={"consNo": "1000000001", "days": 7}).json()["data"]
+        assert daily[0] == ["2026-10-17", "5.1"], daily
+        os.environ["API_BASE_URL"] = base
+        backend = HttpBackend([{"name": SESSION_COOKIE, "value": session.cookies[SESSION_COOKIE]}])
+        user_ids = backend.get_user_ids()
+        balances = backend.get_balances(user_ids)
+        backend.close()
+        assert user_ids == manifest["user_ids"], user_ids
+        assert balances == {"1000000001": 88.5, "1000000002": -12.3}, balances
+        print(f"self-test passed: {server.requests} request(s), verifications {server.verifications}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archive", help="zip written by recorder.py, or its extracted directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8597)
+    parser.add_argument("--tolerance", type=int, default=3, help="accepted slider offset error in pixels")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay added to every request")
+    parser.add_argument("--self-test", action="store_true", help="check the replay site without a browser and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.self_test:
+        self_test()
+    elif not args.archive:
+        parser.error("--archive is required")
+    else:
+        server = start_site_server(ArchiveSite(args.archive, args.tolerance, args.latency_ms / 1000),
+                                   args.port, args.host)
+        logging.info(f"Replaying {args.archive} on {server.url}, run the fetcher with SGCC_BASE_URL={server.url}")
+        threading.Event().wait()
@@ -0,0 +1,224 @@
+"""定时执行：计算每个任务确切的下一次执行时间并一直睡到那一刻
+
+执行时间的写法（JOB_START_TIME，或 ACCOUNTS 中单个账号的 JOB_START_TIME）：
+    "07:00"                 每天 07:00
+    "07:00,19:30"           每天多个时间
+    "cron:0 7,19 * * 1-5"   cron 表达式（分 时 日 月 周），周日为 0 或 7
+每个周期只抽取一次随机偏移（JOB_RANDOM_DELAY_MINUTES，默认 ±10 分钟）。
+上次执行的计划时间保存在 SCHEDULER_STATE_PATH 中，重启后若错过了执行时间
+（不超过 SCHEDULER_CATCHUP_HOURS 小时）会立即补执行一次。"""
+import json
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+
+def _parse_field(field: str, low: int, high: int):
+    '''one cron field -> sorted list of allowed values'''
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"cron field {field!r} out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+
+class CronSpec:
+    '''5-field cron expression: minute hour day-of-month month day-of-week'''
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression {expression!r} must have 5 fields")
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        # 7 与 0 都表示周日，转换为 datetime.weekday()（周一为 0）
+        self.weekdays = sorted({(d - 1) % 7 for d in _parse_field(fields[4], 0, 7)})
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = dt.weekday() in self.weekdays
+        # 与 cron 相同：日和周都有限制时满足其一即可
+        if not self._any_day and not self._any_weekday:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, dt: datetime):
+        '''first matching minute strictly after dt'''
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+                dt = dt.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"cron expression {self.expression!r} never fires")
+
+    def __str__(self):
+        return f"cron:{self.expression}"
+
+
+class DailySpec:
+    '''one or more "HH:MM" times every day'''
+
+    def __init__(self, times: str):
+        self.times = sorted(datetime.strptime(t.strip(), "%H:%M").time() for t in times.split(",") if t.strip())
+        if not self.times:
+            raise ValueError("no time given")
+
+    def next_after(self, dt: datetime):
+        for days in (0, 1):
+            day = dt.date() + timedelta(days=days)
+            for t in self.times:
+                candidate = datetime.combine(day, t)
+                if candidate > dt:
+                    return candidate
+
+    def __str__(self):
+        return ",".join(t.strftime("%H:%M") for t in self.times)
+
+
+def parse_spec(spec: str):
+    spec = spec.strip()
+    if spec.startswith("cron:"):
+        return CronSpec(spec[len("cron:"):].strip())
+    return DailySpec(spec)
+
+
+class Job:
+
+    def __init__(self, name, spec, func, jitter_minutes):
+        self.name = name
+        self.spec = spec
+        self.func = func
+        self.jitter_minutes = jitter_minutes
+        self.base = None  # 本周期的计划时间
+        self.fire_at = None  # 加上本周期随机偏移后的执行时间
+
+    def plan(self, base: datetime):
+        self.base = base
+        offset = random.uniform(-self.jitter_minutes, self.jitter_minutes) if self.jitter_minutes else 0
+        self.fire_at = base + timedelta(minutes=offset)
+
+
+class Scheduler:
+    '''Runs jobs at their next fire time, sleeping in between.'''
+
+    def __init__(self, state_path: str = None):
+        path = state_path or os.getenv("SCHEDULER_STATE_PATH", "scheduler_state.json")
+        if 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(path):
+            path = "/data/" + path
+        self.state_path = path
+        self.JOB_RANDOM_DELAY_MINUTES = float(os.getenv("JOB_RANDOM_DELAY_MINUTES", 10))
+        self.SCHEDULER_CATCHUP_HOURS = float(os.getenv("SCHEDULER_CATCHUP_HOURS", 12))
+        # 单次最长睡眠，醒来后按系统时间重新计算，应对系统时间调整和休眠
+        self.SCHEDULER_MAX_SLEEP = float(os.getenv("SCHEDULER_MAX_SLEEP", 3600))
+        self.jobs = []
+        self._stop = threading.Event()
+        self._state = self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Scheduler state {self.state_path} unreadable, catch-up disabled: {e}")
+            return {}
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, indent=2)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            logging.warning(f"Failed to save scheduler state to {self.state_path}: {e}")
+
+    def add(self, name: str, spec: str, func, jitter_minutes: float = None):
+        '''schedule func() on spec; a missed run since the last recorded one is caught up immediately'''
+        job = Job(name, parse_spec(spec), func,
+                  self.JOB_RANDOM_DELAY_MINUTES if jitter_minutes is None else jitter_minutes)
+        now = datetime.now()
+        last_base = self._state.get(name, {}).get("last_base")
+        last_base = datetime.fromisoformat(last_base) if last_base else None
+        missed = None
+        if last_base:
+            missed = job.spec.next_after(last_base)
+            # 最近一次错过的计划时间
+            while job.spec.next_after(missed) <= now:
+                missed = job.spec.next_after(missed)
+            if missed > now or now - missed > timedelta(hours=self.SCHEDULER_CATCHUP_HOURS):
+                missed = None
+        if missed is not None:
+            logging.info(f"Job {name}: run scheduled at {missed:%Y-%m-%d %H:%M} was missed, catching up now.")
+            job.base, job.fire_at = missed, now
+        else:
+            # 随机偏移为负时本周期可能已提前执行过
+            job.plan(job.spec.next_after(max(now, last_base) if last_base else now))
+        self.jobs.append(job)
+        logging.info(f"Job {name} ({job.spec}) next run at {job.fire_at:%Y-%m-%d %H:%M:%S}.")
+        return job
+
+    def _run(self, job):
+        start = datetime.now()
+        logging.info(f"Job {job.name} started (scheduled {job.base:%Y-%m-%d %H:%M}).")
+        try:
+            result = job.func()
+            success = result is not False
+        except Exception as e:
+            logging.error(f"Job {job.name} failed: {e}")
+            success = False
+        self._state[job.name] = {"last_base": job.base.isoformat(), "last_run": start.isoformat(),
+                                 "success": success}
+        self._save_state()
+        # 下一个周期从本次计划时间和当前时间中较晚者之后开始，补执行的多个周期只执行一次
+        job.plan(job.spec.next_after(max(job.base, datetime.now())))
+        logging.info(f"Job {job.name} finished in {(datetime.now() - start).total_seconds():.0f}s, "
+                     f"next run at {job.fire_at:%Y-%m-%d %H:%M:%S}.")
+
+    def run_pending(self):
+        '''run every job whose fire time has passed, returns seconds until the next one'''
+        for job in sorted(self.jobs, key=lambda j: j.fire_at):
+            if job.fire_at <= datetime.now():
+                self._run(job)
+        if not self.jobs:
+            return None
+        return max(0.0, (min(job.fire_at for job in self.jobs) - datetime.now()).total_seconds())
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            delay = self.run_pending()
+            if delay is None:
+                logging.warning("No jobs scheduled.")
+                return
+            self._stop.wait(min(delay, self.SCHEDULER_MAX_SLEEP))
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,160 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+from const import *
+from browser_manager import account_scripts
+
+SALT_SIZE = 16
+KDF_ITERATIONS = 200000
+
+CAPTURE_STORAGE_JS = """
+return {
+    origin: location.origin,
+    local: JSON.stringify(Object.assign({}, localStorage)),
+    session: JSON.stringify(Object.assign({}, sessionStorage))
+};
+"""
+
+# 在目标站点的文档脚本执行之前写回 localStorage/sessionStorage
+RESTORE_STORAGE_JS = """
+(function () {
+    if (location.origin !== %(origin)s) { return; }
+    var local = %(local)s, session = %(session)s;
+    Object.keys(local).forEach(function (k) { localStorage.setItem(k, local[k]); });
+    Object.keys(session).forEach(function (k) { sessionStorage.setItem(k, session[k]); });
+})();
+"""
+
+
+class SessionStore:
+    '''Encrypted on-disk copy of the 95598 login state (cookies, localStorage,
+    sessionStorage) for one PHONE_NUMBER account.'''
+
+    def __init__(self, account: str, secret: str):
+        default_dir = "/data/sessions" if 'PYTHON_IN_DOCKER' in os.environ else "sessions"
+        self.SESSION_STORE_DIR = os.getenv("SESSION_STORE_DIR", default_dir)
+        self.SESSION_MAX_AGE_HOURS = float(os.getenv("SESSION_MAX_AGE_HOURS", 168))
+        # 未单独配置密钥时用账号密码派生，只有持有 .env 的人才能解密
+        self._secret = os.getenv("SESSION_STORE_KEY") or f"{account}:{secret}"
+        self._account = account
+        account_hash = hashlib.sha256(account.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(self.SESSION_STORE_DIR, f"{account_hash}.session")
+        self.origin = "{0.scheme}://{0.netloc}".format(urlparse(LOGIN_URL))
+        self._restore_script = None
+
+    def _fernet(self, salt: bytes):
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=KDF_ITERATIONS)
+        return Fernet(base64.urlsafe_b64encode(kdf.derive(self._secret.encode("utf-8"))))
+
+    def _write(self, state: dict):
+        os.makedirs(self.SESSION_STORE_DIR, exist_ok=True)
+        salt = os.urandom(SALT_SIZE)
+        token = self._fernet(salt).encrypt(json.dumps(state).encode("utf-8"))
+        tmp_path = self.path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(salt + token)
+        os.replace(tmp_path, self.path)
+
+    def _read(self):
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            data = f.read()
+        try:
+            state = json.loads(self._fernet(data[:SALT_SIZE]).decrypt(data[SALT_SIZE:]))
+        except (InvalidToken, ValueError) as e:
+            logging.warning(f"Stored session can not be decrypted, ignored: {e}")
+            return None
+        if state.get("account") != self._account:
+            return None
+        age_hours = (time.time() - state.get("saved_at", 0)) / 3600
+        if self.SESSION_MAX_AGE_HOURS > 0 and age_hours > self.SESSION_MAX_AGE_HOURS:
+            logging.info(f"Stored session is {age_hours:.1f} hours old, ignored.")
+            return None
+        return state
+
+    def save(self, driver):
+        '''capture the current login state, the driver must be on the 95598 origin'''
+        try:
+            cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+            storage = driver.execute_script(CAPTURE_STORAGE_JS)
+            if storage["origin"] != self.origin:
+                logging.debug(f"Driver is on {storage['origin']}, web storage not captured.")
+                storage = {"local": "{}", "session": "{}"}
+            self._write({
+                "account": self._account,
+                "saved_at": time.time(),
+                "cookies": cookies,
+                "local_storage": storage["local"],
+                "session_storage": storage["session"],
+            })
+            logging.info(f"Login session saved to {self.path}.")
+            return True
+        except Exception as e:
+            logging.warning(f"Failed to save login session: {e}")
+            return False
+
+    def restore(self, driver):
+        '''load the stored state into the driver before the first navigation, True if anything was restored'''
+        state = self._read()
+        if state is None:
+            return False
+        try:
+            cookies = []
+            for cookie in state["cookies"]:
+                cookie = {k: v for k, v in cookie.items() if k in (
+                    "name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")}
+                # 会话 cookie 的 expires 为 -1，写回时去掉
+                if cookie.get("expires", 0) <= 0:
+                    cookie.pop("expires", None)
+                cookies.append(cookie)
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+            source = RESTORE_STORAGE_JS % {
+                "origin": json.dumps(self.origin),
+                "local": state["local_storage"],
+                "session": state["session_storage"],
+            }
+            self._restore_script = driver.execute_cdp_cmd(
+                "Page.addScriptToEvaluateOnNewDocument", {"source": source})["identifier"]
+            # 池中的浏览器换账号前由 DriverPool 移除，避免把本账号的 web storage 注入下一个账号的页面
+            account_scripts(driver).add(self._restore_script)
+            logging.info(f"Login session restored from {self.path}, saved at "
+                         f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(state['saved_at']))}.")
+            return True
+        except Exception as e:
+            logging.warning(f"Failed to restore login session: {e}")
+            return False
+
+    def finish_restore(self, driver):
+        '''stop re-injecting the stored web storage on later navigations'''
+        if self._restore_script is not None:
+            try:
+                driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument",
+                                       {"identifier": self._restore_script})
+                account_scripts(driver).discard(self._restore_script)
+            except Exception as e:
+                logging.debug(f"Failed to remove session restore script: {e}")
+            self._restore_script = None
+
+    def clear(self, driver=None):
+        '''drop an expired session from disk and from the browser'''
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+        if driver is not None:
+            self.finish_restore(driver)
+            try:
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                driver.execute_script("localStorage.clear(); sessionStorage.clear();")
+            except Exception as e:
+                logging.debug(f"Failed to clear browser session: {e}")
@@ -0,0 +1,184 @@
+"""按阶段计时：span("name", key=value) 包住一段代码，记录开始时间、耗时、线程和父 span
+
+    with span("login", account=mask_account(phone)):
+        ...
+
+TRACE_ENABLED=true 时每个 span 结束后以一行 JSON 追加到 TRACE_DIR/trace-<时间>-<pid>.jsonl；
+TRACE_CHROME=true 时每次执行结束调用 flush() 另存一份 Chrome trace-event 格式
+（TRACE_DIR/trace-<时间>-<pid>-<序号>.trace.json，chrome://tracing 或 ui.perfetto.dev 打开）；
+未调用 flush() 时缓存的事件达到 TRACE_CHROME_MAX_EVENTS 条或进程退出时写出，长期运行也不会无限增长。
+未开启且没有 add_listener() 注册的监听者时，span() 返回同一个空操作对象，开销只有一次环境变量读取。
+TRACE_ENABLED 在使用时读取，load_config() 之后才从 .env 载入的值同样生效。"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+_local = threading.local()
+_ids = itertools.count(1)
+_writer = None
+_writer_lock = threading.Lock()
+_listeners = []
+
+
+def _enabled():
+    return os.getenv("TRACE_ENABLED", "false").lower() == "true"
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class TraceWriter:
+    '''append finished spans to a JSONL file, keep them for the Chrome trace when asked to'''
+
+    def __init__(self, directory: str, chrome: bool):
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"trace-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}")
+        self.stem = stem
+        self.jsonl_path = stem + ".jsonl"
+        self.chrome = chrome
+        self.max_events = int(os.getenv("TRACE_CHROME_MAX_EVENTS", 100000))
+        self._file = open(self.jsonl_path, "a", encoding="utf-8", buffering=1)
+        self._events = []
+        self._chrome_files = 0
+        self._lock = threading.Lock()
+        logging.info(f"Tracing spans to {self.jsonl_path}.")
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            if self.chrome:
+                self._events.append({"name": record["name"], "ph": "X", "pid": os.getpid(), "tid": record["thread"],
+                                     "ts": record["ts"] * 1e6, "dur": record["dur_ms"] * 1e3,
+                                     "args": dict(record["attrs"], error=record["error"]) if record["error"]
+                                     else record["attrs"]})
+                if len(self._events) >= self.max_events:
+                    self._write_chrome()
+
+    def _write_chrome(self):
+        '''write the buffered events to the next numbered Chrome trace file and start a new buffer'''
+        if not self._events:
+            return
+        events, self._events = self._events, []
+        self._chrome_files += 1
+        path = f"{self.stem}-{self._chrome_files:03d}.trace.json"
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+            logging.info(f"Chrome trace written to {path}.")
+        except OSError as e:
+            logging.warning(f"Failed to write Chrome trace {path}: {e}")
+
+    def flush_chrome(self):
+        with self._lock:
+            self._write_chrome()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._write_chrome()
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                directory = os.getenv("TRACE_DIR", "traces")
+                if 'PYTHON_IN_DOCKER' in os.environ and not os.path.isabs(directory):
+                    directory = "/data/" + directory
+                _writer = TraceWriter(directory, os.getenv("TRACE_CHROME", "false").lower() == "true")
+                atexit.register(_writer.close)
+    return _writer
+
+
+def flush():
+    '''write the Chrome trace of the spans finished so far, called after every run'''
+    if _writer is not None:
+        _writer.flush_chrome()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "start", "wall_start")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        '''add attributes known only inside the span, e.g. a result'''
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent_id = stack[-1] if stack else None
+        self.span_id = next(_ids)
+        stack.append(self.span_id)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        record = {
+            "name": self.name, "ts": self.wall_start, "dur_ms": round(duration * 1000, 3),
+            "span_id": self.span_id, "parent_id": self.parent_id, "thread": threading.get_ident(),
+            "attrs": self.attrs, "error": f"{exc_type.__name__}: {exc}" if exc_type else None,
+        }
+        if _enabled():
+            _get_writer().write(record)
+        for listener in _listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                logging.debug(f"Span listener {listener!r} failed: {e}")
+        return False
+
+
+def span(name: str, **attrs):
+    '''context manager timing the enclosed block as one span'''
+    if not _listeners and not _enabled():
+        return _NOOP
+    return Span(name, attrs)
+
+
+def traced(name: str = None):
+    '''decorator form of span(), named after the function by default'''
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+def add_listener(listener):
+    '''call listener(record) for every finished span, even when TRACE_ENABLED is off'''
+    if listener not in _listeners:
+        _listeners.append(listener)